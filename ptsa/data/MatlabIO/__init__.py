@@ -1,5 +1,7 @@
 import sys
 import functools
+import operator
+import warnings
 import numpy as np
 
 from .MatlabIO import *
@@ -42,6 +44,13 @@ else:
         type(bytes()): '|S1'
     })
 
+# number of records with scalar values examined to infer the format of a field
+FORMAT_SAMPLE_SIZE = 100
+
+
+class _FormatMismatch(ValueError):
+    """Raised when the values of a field do not fit the format inferred from a sample of records"""
+
 
 def read_single_matlab_matrix_as_numpy_structured_array(file_name, object_name, verbose=False):
     """
@@ -63,19 +72,18 @@ def read_single_matlab_matrix_as_numpy_structured_array(file_name, object_name,
     if type(matlab_matrix_as_python_obj) != np.ndarray:
         matlab_matrix_as_python_obj = np.array([matlab_matrix_as_python_obj])
 
-    # # picking first first elment  plus 20 randomly selected elements to determine type
-    # selector_array = [0] + np.random.randint(len(matlab_matrix_as_python_obj), size=20)
-    # selector_array = np.hstack(([0], selector_array))
-    template_element_array = matlab_matrix_as_python_obj  # [selector_array]
-    record = matlab_matrix_as_python_obj[0]
-    # format_dict = get_np_format([record])
-    format_dict = get_np_format(template_element_array)
-    # format_dict = get_np_format(record)
-
-    array_fd = np.recarray(shape=matlab_matrix_as_python_obj.shape, dtype=format_dict)
-
-    populate_record_array(source_array=matlab_matrix_as_python_obj, target_array=array_fd, format_dict=format_dict,
-                          prepend_name='',verbose=verbose)
+    # formats of scalar fields are inferred from a sample of records. If the values of a field turn out not to fit
+    # the sampled format the formats are inferred again from all records
+    try:
+        format_dict = get_np_format(matlab_matrix_as_python_obj, sample_size=FORMAT_SAMPLE_SIZE)
+        array_fd = np.zeros(matlab_matrix_as_python_obj.shape, dtype=format_dict).view(np.recarray)
+        populate_record_array(source_array=matlab_matrix_as_python_obj, target_array=array_fd,
+                              format_dict=format_dict, prepend_name='', verbose=verbose, check_formats=True)
+    except _FormatMismatch:
+        format_dict = get_np_format(matlab_matrix_as_python_obj)
+        array_fd = np.zeros(matlab_matrix_as_python_obj.shape, dtype=format_dict).view(np.recarray)
+        populate_record_array(source_array=matlab_matrix_as_python_obj, target_array=array_fd,
+                              format_dict=format_dict, prepend_name='', verbose=verbose)
 
     if verbose:
         print(array_fd)
@@ -137,15 +145,21 @@ def get_np_type(record, _fieldname, verbose=False):
             return attr_dtype.str
 
 
-def get_np_format(record_array, verbose=False):
+def get_np_format(record_array, verbose=False, sample_size=None):
+    """
+    Infers the numpy format of an array of MATLAB structs.
+    The format of a field is determined by the first record in which it is an array, a struct or a string. Fields
+    holding scalars get the common type of all records or, if sample_size is given, of the first sample_size records
+    with a value
+        :param record_array: array of MATLAB structs (as loaded with struct_as_record=False)
+        :param verbose=False:
+        :param sample_size=None: maximum number of scalar values examined per field
+    """
     names_list = []
     format_list = []
 
     first_record = record_array[0]
 
-    dt = {'names': ['a', 'b'], 'formats': ['<f8', {'names': ['x'], 'formats': ['<f8']}]}
-    array_fd = np.recarray(shape=(10,), dtype=dt)
-
     for _fieldname in first_record._fieldnames:
         formats = []
         for record in record_array:
@@ -165,6 +179,8 @@ def get_np_format(record_array, verbose=False):
                     break
                 else:
                     formats.append(format)
+                    if len(formats) == sample_size:
+                        break
 
                     # if format is not None:
                     #     formats.append(format)
@@ -208,20 +224,90 @@ def rgetattr(obj, attr):
     return functools.reduce(getattr, [obj] + attr.split('.'))
 
 
-def populate_record_array(source_array, target_array, format_dict, prepend_name='', verbose=False):
+def is_empty_value(value):
+    """
+    Returns True for empty MATLAB values (empty arrays), which get_np_type does not infer a format from
+    """
+    return hasattr(value, 'dtype') and value.shape[:1] == (0,)
+
+
+def fits_format(values, format):
+    """
+    Checks that scalar values can be stored in a scalar numeric format without a loss of precision, i.e. that
+    inferring the format from all values would give the same format. Empty values are ignored
+        :param values: list of field values
+        :param format: numeric format of the field
+    """
+    with warnings.catch_warnings():
+        warnings.simplefilter('ignore')
+        try:
+            column = np.array([value for value in values if not is_empty_value(value)])
+        except ValueError:
+            return False
+    return column.ndim == 1 and column.dtype.kind != 'O' and np.can_cast(column.dtype, format)
+
+
+def copy_column(values, target_field):
+    """
+    Copies field values into a field of a record array with a single assignment. Nothing is copied if the values
+    do not form a regular array that can be cast to the field type without changing its kind.
+        :param values: list of field values, one per (flattened) record
+        :param target_field: field of the target record array
+        :return: True if the values have been copied
+    """
+    with warnings.catch_warnings():
+        # ragged values are handled element by element
+        warnings.simplefilter('ignore')
+        try:
+            column = np.array(values)
+        except ValueError:
+            return False
+
+    if (column.dtype.kind == 'O' or column.size != target_field.size or
+            column.shape[1:] != target_field.shape[target_field.ndim - column.ndim + 1:] or
+            not np.can_cast(column.dtype, target_field.dtype, 'same_kind')):
+        return False
+
+    target_field[...] = column.reshape(target_field.shape)
+    return True
+
+
+def populate_record_array(source_array, target_array, format_dict, prepend_name='', verbose=False,
+                          check_formats=False):
+    """
+    Copies the fields of an array of MATLAB structs into a record array. Each field is copied in a single assignment
+    when possible and element by element otherwise; values that cannot be assigned are skipped
+        :param source_array: array of MATLAB structs
+        :param target_array: record array with the format given by format_dict
+        :param format_dict: format as returned by get_np_format
+        :param prepend_name='': path of the nested struct being copied
+        :param verbose=False:
+        :param check_formats=False: raise _FormatMismatch if the values of a scalar numeric field do not fit its
+            format
+    """
     for i, field_name in enumerate(format_dict['names']):
         format = format_dict['formats'][i]
         if isinstance(format, dict):
             populate_record_array(source_array=source_array, target_array=target_array[field_name],
                                   format_dict=format, prepend_name=prepend_name + field_name + '.')
         else:
-
-            for index, x in np.ndenumerate(source_array):
-
-                try:
-                    target_array[field_name][index] = rgetattr(source_array[index], prepend_name + field_name)
-                except ValueError:
-                    pass
+            target_field = target_array[field_name]
+            values = list(map(operator.attrgetter(prepend_name + field_name), source_array.flat))
+            # empty values cannot be assigned to the field, which leaves it zero
+            zero = np.zeros(target_field.shape[source_array.ndim:], dtype=target_field.dtype)
+            values = [zero if is_empty_value(value) else value for value in values]
+
+            if check_formats:
+                dtype = np.dtype(format)
+                if dtype.kind in 'biufc' and not dtype.shape and not fits_format(values, dtype):
+                    raise _FormatMismatch(field_name)
+
+            if not copy_column(values, target_field):
+                for index, value in zip(np.ndindex(source_array.shape), values):
+                    try:
+                        target_field[index] = value
+                    except ValueError:
+                        pass
 
 
     if verbose:
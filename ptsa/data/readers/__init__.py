@@ -6,6 +6,7 @@ from .hdf5 import H5RawReader
 from .index import JsonIndexReader
 from .netcdf import NetCDF4XrayReader
 from .params import ParamsReader
+from .catalog import SessionCatalog
 from ptsa.data.readers.base import BaseRawReader
 from .tal import *
 from .binary import BinaryRawReader
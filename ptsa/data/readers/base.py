@@ -5,10 +5,14 @@ import os
 from os.path import *
 import re
 import json
+import hashlib
+import tempfile
+from six.moves import cPickle as pickle
 import unicodedata
 from collections import defaultdict
 import warnings
 import numpy as np
+from numpy.lib.stride_tricks import as_strided
 import pandas as pd
 from abc import abstractmethod
 import traits.api
@@ -27,11 +31,121 @@ __all__ = [
 
 
 class BaseReader(traits.api.HasTraits):
-    """Base reader class. Children should implement the :meth:`read` method."""
+    """Base reader class. Children should implement the :meth:`read` method.
+
+    Readers with ``filename`` and ``cache_dir`` attributes can cache the
+    arrays they read with :meth:`read_with_cache`.
+
+    """
+
+    #: Reader settings that affect the array returned by :meth:`read` and are
+    #: therefore part of the cache key
+    cache_key_attributes = ()
+
+    #: Version of the cached array format. Changing it invalidates existing
+    #: cache files
+    cache_version = 1
+
+    #: Extension of the cache files written by :meth:`save_cache`
+    cache_extension = '.npy'
+
     @abstractmethod
     def read(self):
         raise NotImplementedError
 
+    def read_with_cache(self, read):
+        """Return the array returned by ``read()``, going through the cache in
+        ``self.cache_dir`` if the reader has one.
+
+        Parameters
+        ----------
+        read : callable
+            Reads the file without using the cache.
+
+        """
+        if not getattr(self, 'cache_dir', ''):
+            return read()
+
+        cache_filename = self.get_cache_filename()
+        arr = self.read_cache(cache_filename)
+        if arr is None:
+            arr = read()
+            self.write_cache(arr, cache_filename)
+        return arr
+
+    def get_cache_filename(self):
+        """Return the path of the cache file for the current file and reader
+        settings.
+
+        The name contains a hash of the reader class, the absolute path,
+        modification time and size of ``self.filename`` and every setting
+        listed in :attr:`cache_key_attributes`, so modifying the file or
+        changing any of the settings results in a new cache file.
+
+        """
+        stat = os.stat(self.filename)
+        key = [type(self).__name__, self.cache_version, os.sep,
+               abspath(self.filename), stat.st_mtime, stat.st_size]
+        key += [(name, getattr(self, name)) for name in self.cache_key_attributes]
+        digest = hashlib.sha1(repr(key).encode('utf-8')).hexdigest()
+        return join(expanduser(self.cache_dir),
+                    '%s.%s%s' % (basename(self.filename), digest, self.cache_extension))
+
+    @classmethod
+    def read_cache(cls, cache_filename):
+        """Load a cached array.
+
+        Returns
+        -------
+        arr : np.recarray
+            The cached array or None if there is no (readable) cache file.
+
+        """
+        try:
+            with open(cache_filename, 'rb') as f:
+                return cls.load_cache(f)
+        except (IOError, OSError, ValueError, EOFError, pickle.UnpicklingError):
+            return None
+
+    @classmethod
+    def write_cache(cls, arr, cache_filename):
+        """Save an array to a cache file. The file is written under a
+        temporary name and renamed, so concurrent readers never see a partial
+        file. Arrays that cannot be cached are skipped and other failures only
+        emit a warning.
+
+        """
+        if not cls.is_cacheable(arr):
+            return
+
+        cache_dir = dirname(cache_filename)
+        tmp_filename = None
+        try:
+            if not isdir(cache_dir):
+                os.makedirs(cache_dir)
+            with tempfile.NamedTemporaryFile(dir=cache_dir, suffix=cls.cache_extension, delete=False) as f:
+                tmp_filename = f.name
+                cls.save_cache(f, arr)
+            os.rename(tmp_filename, cache_filename)
+        except (IOError, OSError, ValueError) as e:
+            warnings.warn('Could not cache %s: %s' % (cache_filename, e), RuntimeWarning)
+            if tmp_filename is not None and exists(tmp_filename):
+                os.remove(tmp_filename)
+
+    @staticmethod
+    def is_cacheable(arr):
+        """Arrays holding Python objects cannot be saved as ``.npy`` files
+        without pickling and are not cached."""
+        return not arr.dtype.hasobject
+
+    @staticmethod
+    def load_cache(f):
+        return np.load(f, allow_pickle=False).view(np.recarray)
+
+    @staticmethod
+    def save_cache(f, arr):
+        np.save(f, arr, allow_pickle=False)
+
 
 class BaseEventReader(BaseReader):
     """Reader class that reads event file and returns them as np.recarray.
@@ -57,6 +171,11 @@ class BaseEventReader(BaseReader):
         events are placed in the '/data/scalp_events/catFR' the common root
         should be 'data/scalp_events'. Note that you do not include opening
         '/' in the common_root
+    cache_dir : str
+        directory where the processed events are cached as ``.npy`` files.
+        Later reads of the same (unmodified) event file with the same reader
+        settings load the cached array instead of parsing the event file.
+        Caching is disabled by default
 
     """
 
@@ -66,10 +185,14 @@ class BaseEventReader(BaseReader):
     _alter_eeg_path_flag = traits.api.Bool
     normalize_eeg_path = traits.api.Bool
     common_root = traits.api.Str
+    cache_dir = traits.api.Str
+
+    cache_key_attributes = ('eliminate_events_with_no_eeg', 'eliminate_nans', 'use_reref_eeg',
+                            'normalize_eeg_path', 'common_root')
 
     def __init__(self, filename,common_root='data/events',
                  eliminate_events_with_no_eeg=True,eliminate_nans=True,use_reref_eeg=False,
-                 normalize_eeg_path=True):
+                 normalize_eeg_path=True,cache_dir=''):
         warnings.warn("Lab-specific readers may be moved to the cmlreaders "
                       "package (https://github.com/pennmem/cmlreaders)",
                       FutureWarning)
@@ -80,6 +203,7 @@ class BaseEventReader(BaseReader):
         self.use_reref_eeg = use_reref_eeg
         self.normalize_eeg_path = normalize_eeg_path
         self._alter_eeg_path_flag = not self.use_reref_eeg
+        self.cache_dir = cache_dir or ''
 
     @property
     def alter_eeg_path_flag(self):
@@ -104,10 +228,9 @@ class BaseEventReader(BaseReader):
             data_dir_bad = r'/data.*/' + subject + r'/eeg'
             data_dir_good = r'/data/eeg/' + subject + r'/eeg'
 
-        for ev in events:
-            # ev.eegfile = ev.eegfile.replace('eeg.reref', 'eeg.noreref')
-            ev.eegfile = re.sub(data_dir_bad, data_dir_good, ev.eegfile)
-        return events
+        data_dir_bad = re.compile(data_dir_bad)
+        return self.map_eegfiles(events, lambda eegfiles: [data_dir_bad.sub(data_dir_good, eegfile)
+                                                           for eegfile in eegfiles])
 
     def modify_eeg_path(self, events):
         """
@@ -115,12 +238,39 @@ class BaseEventReader(BaseReader):
         :param events: np.recarray representing events. One of hte field of this array should be eegfile
         :return:None
         """
+        return self.map_eegfiles(events, lambda eegfiles: np.char.replace(eegfiles, 'eeg.reref', 'eeg.noreref'))
 
-        for ev in events:
-            ev.eegfile = ev.eegfile.replace('eeg.reref', 'eeg.noreref')
+    @staticmethod
+    def map_eegfiles(events, fcn):
+        """
+        Transforms the eegfile field of events in place. Sessions typically have a handful of distinct eegfile values
+        shared by thousands of events, so fcn is only applied to the distinct values and the results are mapped back
+        to the events.
+
+        :param events: np.recarray representing events. One of the field of this array should be eegfile
+        :param fcn: function that takes an array of distinct eegfile values and returns a sequence with the new value
+            of each of them
+        :return: events
+        """
+        unique_eegfiles, inverse = np.unique(events['eegfile'], return_inverse=True)
+        if len(unique_eegfiles):
+            events['eegfile'] = np.asarray(fcn(unique_eegfiles))[inverse]
         return events
 
+    @staticmethod
+    def has_eegfile(events):
+        """
+        :param events: np.recarray representing events. One of the field of this array should be eegfile
+        :return: boolean mask of the events that have an eegfile
+        """
+        unique_eegfiles, inverse = np.unique(events['eegfile'], return_inverse=True)
+        # MAKE THIS CHECK STRONGER
+        return np.array([len(str(eegfile)) > 3 for eegfile in unique_eegfiles], dtype=bool)[inverse]
+
     def read(self):
+        return self.read_with_cache(self.read_events)
+
+    def read_events(self):
         if os.path.splitext(self.filename)[-1] == '.json':
             return self.read_json()
         else:
@@ -153,20 +303,12 @@ class BaseEventReader(BaseReader):
 
         if self.eliminate_events_with_no_eeg:
             # eliminating events that have no eeg file
-            indicator = np.empty(len(evs), dtype=bool)
-            indicator[:] = False
-
-            for i, ev in enumerate(evs):
-                # MAKE THIS CHECK STRONGER
-                indicator[i] = (len(str(evs[i].eegfile)) > 3)
-
-            evs = evs[indicator]
+            evs = evs[self.has_eegfile(evs)]
 
         if 'eegfile' in evs.dtype.names:
             eeg_dir = os.path.join(os.path.dirname(self.filename), '..', '..', 'ephys', 'current_processed', 'noreref')
             eeg_dir = os.path.abspath(eeg_dir)
-            for ev in evs:
-                ev.eegfile = os.path.join(eeg_dir, ev.eegfile)
+            evs = self.map_eegfiles(evs, lambda eegfiles: [os.path.join(eeg_dir, eegfile) for eegfile in eegfiles])
 
         return evs
 
@@ -188,21 +330,13 @@ class BaseEventReader(BaseReader):
             if self.eliminate_events_with_no_eeg:
 
                 # eliminating events that have no eeg file
-                indicator = np.empty(len(evs), dtype=bool)
-                indicator[:] = False
-
-                for i, ev in enumerate(evs):
-                    # MAKE THIS CHECK STRONGER
-                    indicator[i] = (len(str(evs[i].eegfile)) > 3)
-                    # indicator[i] = (type(evs[i].eegfile).__name__.startswith('unicode')) & (len(str(evs[i].eegfile)) > 3)
-
-                evs = evs[indicator]
+                evs = evs[self.has_eegfile(evs)]
 
             # determining data_dir_prefix in case rhino /data filesystem was mounted under different root
             if self.normalize_eeg_path:
                 data_dir_prefix = self.find_data_dir_prefix()
-                for i, ev in enumerate(evs):
-                    ev.eegfile = join(data_dir_prefix, str(pathlib.Path(str(ev.eegfile)).parts[1:]))
+                evs = self.map_eegfiles(evs, lambda eegfiles: [
+                    join(data_dir_prefix, str(pathlib.Path(str(eegfile)).parts[1:])) for eegfile in eegfiles])
 
                 evs = self.normalize_paths(evs)
 
@@ -318,14 +452,112 @@ class BaseEventReader(BaseReader):
                 dtypes.append((str(k), list_info[k]['dtype'], list_info[k]['len']))
 
         if dtypes:
-            arr = np.rec.array(np.zeros(len(d), dtypes))
+            arr = np.zeros(len(d), dtypes).view(np.recarray)
             cls.copy_values(d, arr, list_info)
+            return arr
         else:
-            arr = np.array([])
-        return np.rec.array(arr)
+            return np.rec.array(np.array([]))
 
     @classmethod
     def copy_values(cls, dict_list, rec_arr, list_info=None):
+        """Copy a list of (nested) dictionaries into a zero-initialized
+        record array created by :meth:`from_dict`.
+
+        Regular input (every dictionary has the same keys and every field
+        holds values of a single type) is copied one field at a time with
+        :meth:`copy_columns`. Anything else is copied element by element with
+        :meth:`copy_values_elementwise`. Both produce identical arrays.
+
+        """
+        if len(dict_list) == 0:
+            return
+
+        try:
+            cls.copy_columns(dict_list, rec_arr, list_info)
+        except (ValueError, TypeError):
+            # irregular input: start over from a blank array
+            rec_arr[...] = np.zeros(rec_arr.shape, rec_arr.dtype)
+            cls.copy_values_elementwise(dict_list, rec_arr, list_info)
+
+    @classmethod
+    def copy_columns(cls, dict_list, rec_arr, list_info=None):
+        """Columnar implementation of :meth:`copy_values`. Every field is
+        filled with a single assignment; nested dictionaries and lists are
+        gathered across all entries and copied in bulk.
+
+        Raises
+        ------
+        ValueError
+            If the input is not regular (see :meth:`copy_values`).
+        TypeError
+            If a value cannot be assigned to its field.
+
+        """
+        keys = list(dict_list[0].keys())
+        key_set = set(keys)
+        for entry in dict_list:
+            if not isinstance(entry, dict) or len(entry) != len(keys) or set(entry) != key_set:
+                raise ValueError('Entries do not all have the same fields')
+
+        for k in keys:
+            column = [entry[k] for entry in dict_list]
+            first = column[0]
+
+            if list_info and k in list_info:
+                cls._copy_list_column(column, rec_arr, k, list_info[k])
+            elif isinstance(first, dict):
+                cls.copy_columns(column, rec_arr[k])
+            elif isinstance(first, six.string_types):
+                if not all(isinstance(v, six.string_types) for v in column):
+                    raise ValueError('Field %s has values of different types' % k)
+                stripped = dict((v, cls.strip_accents(v)) for v in set(column))
+                rec_arr[k] = [stripped[v] for v in column]
+            elif isinstance(first, list):
+                raise ValueError('Field %s is a list' % k)
+            else:
+                value_type = type(first)
+                if not all(type(v) is value_type for v in column):
+                    raise ValueError('Field %s has values of different types' % k)
+                rec_arr[k] = column
+
+    @classmethod
+    def _copy_list_column(cls, column, rec_arr, k, info):
+        """Copy a field of variable length lists into the zero-padded subarray
+        field ``k`` of ``rec_arr``.
+
+        """
+        flat = [element for v in column for element in v]
+        if not flat:
+            return
+
+        first = flat[0]
+        if isinstance(first, dict):
+            if not all(isinstance(element, dict) for element in flat):
+                raise ValueError('Field %s has elements of different types' % k)
+            elements = np.zeros(len(flat), info['dtype'])
+            cls.copy_columns(flat, elements)
+        else:
+            element_type = type(first)
+            if isinstance(first, list) or not all(type(element) is element_type for element in flat):
+                raise ValueError('Field %s has elements of different types' % k)
+            elements = flat
+
+        lengths = np.array([len(v) for v in column])
+        values = np.zeros((len(column), info['len']), info['dtype'])
+        values[np.arange(info['len']) < lengths[:, None]] = elements
+        if rec_arr[k].shape != values.shape:
+            # lists of at most one element are stored in a scalar field
+            if values.dtype.kind in 'SU':
+                raise ValueError('Cannot store string lists in scalar field %s' % k)
+            values = values[:, 0]
+        rec_arr[k] = values
+
+    @classmethod
+    def copy_values_elementwise(cls, dict_list, rec_arr, list_info=None):
+        """Element by element implementation of :meth:`copy_values` that
+        handles irregular input.
+
+        """
         if len(dict_list) == 0:
             return
 
@@ -340,7 +572,7 @@ class BaseEventReader(BaseReader):
                     continue
 
                 if isinstance(v, dict):
-                    cls.copy_values([v], rec_arr[i][k])
+                    cls.copy_values_elementwise([v], rec_arr[i][k])
                 elif isinstance(v, six.string_types):
                     rec_arr[i][k] = cls.strip_accents(v)
                 else:
@@ -352,7 +584,7 @@ class BaseEventReader(BaseReader):
                     arr = np.zeros(list_info[k]['len'], list_info[k]['dtype'])
                     if len(v) > 0:
                         if isinstance(v[0], dict):
-                            cls.copy_values(v, arr)
+                            cls.copy_values_elementwise(v, arr)
                         else:
                             for j, element in enumerate(v):
                                 arr[j] = element
@@ -360,7 +592,7 @@ class BaseEventReader(BaseReader):
                     rec_arr[i][k] = np.rec.array(arr)
 
         for k, v in list(dict_fields.items()):
-            cls.copy_values(v, rec_arr[k])
+            cls.copy_values_elementwise(v, rec_arr[k])
 
     @classmethod
     def strip_accents(cls, s):
@@ -371,14 +603,16 @@ class BaseEventReader(BaseReader):
             return str(re.sub(r'[^A-Za-z0-9 -_.]', '', s))
 
 
-class BaseRawReader(BaseReader):
+class BaseRawReader(BaseReader, traits.api.ABCHasTraits):
     """
     Abstract base class for objects that know how to read binary EEG files.
     Classes inheriting from BaseRawReader should do the following
-    * Override :meth:read_file
+    * Override :meth:read_file and :meth:get_num_samples
     * Set self.params_dict['gain'] and self.params_dict['samplerate'] as appropriate,
       either in self.read_file or in the constructor
     * Make sure that self.channel_name as appropriate for the referencing scheme used
+    * Allocate the output of :meth:read_file with :meth:allocate_eventdata and :meth:output_dtype so that the
+      ``dtype`` and ``out`` options are honored
     """
 
     dataroot = traits.api.Str
@@ -386,10 +620,24 @@ class BaseRawReader(BaseReader):
     channel_labels = traits.api.CArray
     start_offsets = traits.api.CArray
     read_size = traits.api.Int
+    dtype = traits.api.Any
 
     channel_name = 'channels'
 
-    def __init__(self, dataroot,channels=tuple(),start_offsets=tuple([0]),read_size=-1):
+    #: Upper bound on the number of samples (summed over channels) read from
+    #: the underlying file in a single block when gathering epochs
+    max_block_size = 2 ** 24
+
+    #: Largest gap (in samples) between two epochs that are still merged into
+    #: a single block read
+    max_block_gap = 2 ** 12
+
+    #: :class:`ptsa.data.readers.catalog.SessionCatalog` consulted for session
+    #: metadata (params, file sizes) before touching the filesystem. None
+    #: disables the catalog
+    catalog = None
+
+    def __init__(self, dataroot,channels=tuple(),start_offsets=tuple([0]),read_size=-1,dtype=None):
         """
         Constructor
         :param dataroot {str} -  core name of the eegfile file (i.e. full path except extension e.g. '.002').
@@ -398,9 +646,17 @@ class BaseRawReader(BaseReader):
         :param channels {array-like} - array of channels (array of strings) that should be read
         :param start_offsets {array-like} -  array of ints with read offsets
         :param read_size {int} - size of the read chunk. If -1 the entire file is read
+        :param dtype {str or dtype} - dtype of the data returned by :meth:read. None (default) returns float64 data
+        scaled by the gain. A floating point dtype (e.g. 'float32') returns scaled data of that dtype. 'native'
+        returns the samples as they are stored in the file (e.g. int16) *without* applying the gain; multiply by
+        ``attrs['gain']`` to obtain physical units. Chunks that cannot be read are filled with NaN (or 0 for
+        integer dtypes, see the read_ok_mask)
         :return:None
 
         """
+        if not (dtype is None or self.is_native_dtype(dtype) or np.issubdtype(np.dtype(dtype), np.floating)):
+            raise ValueError("dtype must be None, 'native' or a floating point dtype (got %s)" % (dtype,))
+        self.dtype = dtype
         self.dataroot = dataroot
         self.channels = channels
         self.start_offsets = start_offsets
@@ -413,25 +669,179 @@ class BaseRawReader(BaseReader):
 
 
     def init_params(self):
+        self._catalog_files = {}
+        catalog = self.catalog
+        if catalog is not None:
+            entry = catalog.lookup(self.dataroot)
+            if entry is not None:
+                self._catalog_files = entry['files']
+                return entry['params']
+
         from ptsa.data.readers.params import ParamsReader
         p_reader = ParamsReader(dataroot=self.dataroot)
-        return p_reader.read()
+        params = p_reader.read()
+        if catalog is not None:
+            catalog.store_params(self.dataroot, p_reader.filename, params)
+        return params
+
+    @abstractmethod
+    def get_num_samples(self):
+        """Return the number of samples per channel in the recording without
+        reading the data. Subclasses must override this.
+
+        """
+        raise NotImplementedError
+
+    def get_native_dtype(self):
+        """Return the dtype of the samples stored in the file, without reading
+        any samples. Readers of integer or single precision files override
+        this.
+
+        """
+        return np.dtype(np.float64)
+
+    def resolve_channels(self):
+        """Return the number of channels :meth:`read_file` returns for
+        ``self.channel_labels`` and set ``self.channels`` as reading would,
+        without reading any samples. This allows the output of a read to be
+        allocated before it starts.
+
+        Readers that read every channel of the file when no channels are
+        requested, or that relabel the channels they read, override this.
+
+        """
+        return len(self.channel_labels)
+
+    @staticmethod
+    def is_native_dtype(dtype):
+        """Return True if ``dtype`` requests the native (unscaled) sample format."""
+        return isinstance(dtype, six.string_types) and dtype == 'native'
+
+    @classmethod
+    def resolve_dtype(cls, dtype, native_dtype):
+        """Return the numpy dtype corresponding to a ``dtype`` reader option.
+
+        Parameters
+        ----------
+        dtype : Union[None, str, np.dtype]
+            Requested dtype (see the ``dtype`` constructor argument).
+        native_dtype : np.dtype
+            dtype of the samples in the file.
+
+        """
+        if dtype is None:
+            return np.dtype(np.float64)
+        if cls.is_native_dtype(dtype):
+            return np.dtype(native_dtype)
+        return np.dtype(dtype)
+
+    def output_dtype(self, native_dtype=np.float64):
+        """Return the dtype :meth:`read_file` should allocate its output with,
+        given the dtype of the samples in the file.
+
+        """
+        return self.resolve_dtype(self.dtype, native_dtype)
+
+    @staticmethod
+    def empty_eventdata(shape, dtype):
+        """Allocate an output array for :meth:`read_file`. Floating point arrays
+        are filled with NaN and integer arrays with 0.
+
+        """
+        dtype = np.dtype(dtype)
+        fill_value = np.nan if np.issubdtype(dtype, np.inexact) else 0
+        return np.full(shape, fill_value, dtype=dtype)
+
+    @classmethod
+    def allocate_eventdata(cls, shape, dtype, out=None, positions=None):
+        """Return the array :meth:`read_file` should write into: ``out`` if it
+        is given, otherwise a new array from :meth:`empty_eventdata`.
+
+        Parameters
+        ----------
+        shape : tuple
+            ``(channels, start offsets, read size)`` shape of the data read.
+        dtype : np.dtype
+            dtype of a newly allocated array.
+        out : np.ndarray
+            Optional array to write the data to.
+        positions : np.ndarray
+            Optional positions along the second axis of ``out`` the epochs are
+            written to (see :meth:`read_into`). ``out`` may then hold more
+            epochs than are read.
+
+        Raises
+        ------
+        ValueError
+            If ``out`` does not have the expected shape.
+
+        """
+        if out is None:
+            return cls.empty_eventdata(shape, dtype)
+        if positions is None:
+            if tuple(out.shape) != tuple(shape):
+                raise ValueError('out has shape %s but the data read has shape %s' % (out.shape, tuple(shape)))
+        elif (out.ndim != len(shape) or out.shape[0] != shape[0] or tuple(out.shape[2:]) != tuple(shape[2:]) or
+              len(positions) != shape[1]):
+            raise ValueError('out has shape %s but the data read has shape %s' % (out.shape, tuple(shape)))
+        return out
+
+    @staticmethod
+    def fill_unread(eventdata, read_ok_mask, positions=None):
+        """Fill the chunks of ``eventdata`` that could not be read with NaN
+        (or 0 for integer dtypes). Used when writing into a caller-supplied
+        array that was not pre-filled. ``positions`` maps the columns of
+        ``read_ok_mask`` to the second axis of ``eventdata`` (see
+        :meth:`allocate_eventdata`).
+
+        """
+        fill_value = np.nan if np.issubdtype(eventdata.dtype, np.inexact) else 0
+        unread = ~np.asarray(read_ok_mask, dtype=bool)
+        if positions is None:
+            eventdata[unread] = fill_value
+        else:
+            channels, epochs = np.nonzero(unread)
+            eventdata[channels, np.asarray(positions)[epochs]] = fill_value
+
+    def apply_gain(self, eventdata):
+        """Convert data returned by :meth:`read_file` to the requested dtype
+        and multiply it by the gain in place. Native reads are returned as is.
+
+        """
+        if self.is_native_dtype(self.dtype):
+            return eventdata
+        eventdata = eventdata.astype(self.output_dtype(), copy=False)
+        eventdata *= self.params_dict['gain']
+        return eventdata
 
     def channel_labels_to_string(self):
         if np.issubdtype(self.channel_labels.dtype,np.integer):
             self.channel_labels = np.array(['{:03}'.format(c).encode() for c in self.channel_labels])
 
 
-    def read(self):
+    def read(self, out=None):
         """Read EEG data.
 
+        Parameters
+        ----------
+        out : np.ndarray
+            Optional array of shape (number of channels, number of start
+            offsets, number of time series points) the data are written to
+            instead of allocating a new array, e.g. a view into a larger
+            preallocated (possibly memory-mapped or shared memory) array.
+            Samples are converted to the dtype of ``out`` as they are read
+            and the gain is applied in place unless ``dtype='native'``, so
+            ``out`` must have a floating point dtype in that case.
+
         Returns
         -------
         event_data : DataArray
             Populated with data read from eeg files. The size of the output is
             number of channels * number of start offsets * number of time series
             points. The corresponding DataArray axes are: 'channels',
-            'start_offsets', 'offsets'
+            'start_offsets', 'offsets'. The dtype and scaling of the data are
+            determined by the ``dtype`` option; the gain is always stored in
+            ``attrs['gain']``.
         read_ok_mask : np.ndarray
             Mask of chunks that were properly read.
 
@@ -442,13 +852,19 @@ class BaseRawReader(BaseReader):
         example the HDF5 reader).
 
         """
+        if out is not None and not (self.is_native_dtype(self.dtype) or np.issubdtype(out.dtype, np.floating)):
+            raise ValueError("out must have a floating point dtype unless dtype='native' (got %s)" % out.dtype)
 
         eventdata, read_ok_mask = self.read_file(self.dataroot,
                                                  self.channel_labels,
                                                  self.start_offsets,
-                                                 self.read_size)
+                                                 self.read_size,
+                                                 out=out)
         # multiply by the gain
-        eventdata *= self.params_dict['gain']
+        if out is None:
+            eventdata = self.apply_gain(eventdata)
+        elif not self.is_native_dtype(self.dtype):
+            eventdata *= self.params_dict['gain']
 
         eventdata = DataArray(eventdata,
                               dims=[self.channel_name, 'start_offsets', 'offsets'],
@@ -465,8 +881,179 @@ class BaseRawReader(BaseReader):
 
         return eventdata, read_ok_mask
 
+    def read_into(self, out, positions):
+        """Read EEG data into part of a larger array.
+
+        The epoch starting at ``self.start_offsets[i]`` is written to
+        ``out[:, positions[i], :]`` by :meth:`read_file` itself, so the reads
+        of several readers (e.g. one per session) can be assembled into a
+        single array without intermediate copies.
+
+        Parameters
+        ----------
+        out : np.ndarray
+            Array of shape (number of channels, number of epochs, number of
+            time series points) with at least ``max(positions) + 1`` epochs.
+            Must have a floating point dtype unless ``dtype='native'``.
+        positions : np.ndarray
+            Increasing positions along the second axis of ``out``, one per
+            start offset.
+
+        Returns
+        -------
+        read_ok_mask : np.ndarray
+            Mask of chunks that were properly read.
+
+        """
+        if not (self.is_native_dtype(self.dtype) or np.issubdtype(out.dtype, np.floating)):
+            raise ValueError("out must have a floating point dtype unless dtype='native' (got %s)" % out.dtype)
+
+        positions = np.asarray(positions, dtype=np.intp)
+        _, read_ok_mask = self.read_file(self.dataroot,
+                                         self.channel_labels,
+                                         self.start_offsets,
+                                         self.read_size,
+                                         out=out,
+                                         positions=positions)
+        # multiply by the gain, one run of adjacent positions at a time
+        if not self.is_native_dtype(self.dtype):
+            for run in np.split(positions, np.where(np.diff(positions) != 1)[0] + 1):
+                if len(run):
+                    out[:, run[0]:run[-1] + 1, :] *= self.params_dict['gain']
+
+        return read_ok_mask
+
+    @staticmethod
+    def epochs_in_bounds(start_offsets, read_size, num_samples):
+        """Return a boolean mask of the epochs that can be read in full from a
+        file containing ``num_samples`` samples.
+
+        """
+        start_offsets = np.asarray(start_offsets, dtype=np.int64)
+        return (start_offsets >= 0) & (start_offsets + read_size <= num_samples)
+
+    @classmethod
+    def gather_epochs(cls, source, start_offsets, read_size, eventdata,
+                      source_offset=0, num_samples=None, positions=None):
+        """Copy epochs out of a contiguous block of samples.
+
+        All epochs that lie within ``source`` are gathered with a single
+        indexing operation on a strided view of the block, so this works
+        equally well on memory-mapped files, in-memory arrays and blocks read
+        from HDF5 datasets.
+
+        Parameters
+        ----------
+        source : np.ndarray
+            Block of samples with time along the last axis (e.g. a single
+            channel memmap or a ``(channels, samples)`` array). Sample
+            ``source[..., 0]`` corresponds to sample ``source_offset`` of the
+            file.
+        start_offsets : np.ndarray
+            Sample indices (relative to the start of the file) at which each
+            epoch starts.
+        read_size : int
+            Number of samples in each epoch.
+        eventdata : np.ndarray
+            Output array of shape ``source.shape[:-1] + (len(start_offsets),
+            read_size)``. Epochs that are not contained in ``source`` are left
+            untouched.
+        source_offset : int
+            Offset of the first sample of ``source`` within the file.
+        num_samples : int
+            Total number of samples in the file. Defaults to the end of
+            ``source``.
+        positions : np.ndarray
+            Optional positions along the epochs axis of ``eventdata`` the
+            epochs are written to (see :meth:`read_into`). Defaults to
+            ``range(len(start_offsets))``.
+
+        Returns
+        -------
+        read_ok_mask : np.ndarray
+            Boolean mask indicating which epochs are within the bounds of the
+            file.
+
+        """
+        source = np.asarray(source)
+        start_offsets = np.asarray(start_offsets, dtype=np.int64)
+        block_size = source.shape[-1]
+        if num_samples is None:
+            num_samples = source_offset + block_size
+
+        read_ok_mask = cls.epochs_in_bounds(start_offsets, read_size, num_samples)
+
+        block_offsets = start_offsets - source_offset
+        in_block = read_ok_mask & (block_offsets >= 0) & (block_offsets + read_size <= block_size)
+
+        if in_block.any():
+            windows = as_strided(source,
+                                 shape=source.shape[:-1] + (block_size - read_size + 1, read_size),
+                                 strides=source.strides + source.strides[-1:],
+                                 writeable=False)
+            index = in_block if positions is None else np.asarray(positions)[in_block]
+            eventdata[..., index, :] = windows[..., block_offsets[in_block], :]
+
+        return read_ok_mask
+
+    @classmethod
+    def plan_read_blocks(cls, start_offsets, read_size, num_samples, num_channels=1,
+                         max_gap=None):
+        """Plan the contiguous blocks of samples to read so that every readable
+        epoch is covered with as few reads as possible.
+
+        Epochs are sorted and merged into a single block whenever they overlap
+        or are separated by at most ``max_gap`` samples, as long as the block
+        stays within :attr:`max_block_size`. Epochs that cannot be read in full
+        are skipped.
+
+        Parameters
+        ----------
+        start_offsets : np.ndarray
+            Epoch start indices.
+        read_size : int
+            Number of samples in each epoch.
+        num_samples : int
+            Total number of samples in the file.
+        num_channels : int
+            Number of channels read with each block.
+        max_gap : int
+            Largest number of unneeded samples between two epochs that will be
+            read in order to merge them into one block. Defaults to
+            :attr:`max_block_gap`.
+
+        Returns
+        -------
+        blocks : list
+            Sorted list of ``(start, stop)`` sample ranges.
+
+        """
+        if max_gap is None:
+            max_gap = cls.max_block_gap
+
+        start_offsets = np.asarray(start_offsets, dtype=np.int64)
+        in_bounds = cls.epochs_in_bounds(start_offsets, read_size, num_samples)
+        if not in_bounds.any():
+            return []
+
+        starts = np.unique(start_offsets[in_bounds])
+        max_span = max(cls.max_block_size // max(num_channels, 1), read_size)
+
+        blocks = []
+        block_start, block_stop = starts[0], starts[0] + read_size
+        for start in starts[1:]:
+            stop = start + read_size
+            if start - block_stop <= max_gap and stop - block_start <= max_span:
+                block_stop = stop
+            else:
+                blocks.append((int(block_start), int(block_stop)))
+                block_start, block_stop = start, stop
+        blocks.append((int(block_start), int(block_stop)))
+
+        return blocks
+
     @abstractmethod
-    def read_file(self,filename,channels,start_offsets=np.array([0]),read_size=-1):
+    def read_file(self,filename,channels,start_offsets=np.array([0]),read_size=-1,out=None,positions=None):
         """
         Reads raw data from binary files into a numpy array of shape (len(channels),len(start_offsets), read_size).
          For each channel and offset, indicates whether the data at that offset on that channel could be read successfully.
@@ -484,11 +1071,18 @@ class BaseRawReader(BaseReader):
             The indices in the array to start reading at
         read_size : int
             The number of samples to read at each offset.
+        out : np.ndarray
+            Optional array of shape (len(channels), len(start_offsets),
+            read_size) to write the data to (see :meth:`allocate_eventdata`).
+        positions : np.ndarray
+            Optional positions along the second axis of ``out`` the epochs are
+            written to instead (see :meth:`read_into`). Unread epochs must be
+            filled with :meth:`fill_unread`.
 
         Returns
         -------
         eventdata : np.ndarray
-            The EEG data corresponding to each offset
+            The EEG data corresponding to each offset (``out`` if given)
         read_ok_mask : np.ndarray
             Boolean mask indicating whether each offset was read successfully.
 
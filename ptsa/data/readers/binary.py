@@ -1,15 +1,32 @@
 from ptsa.data.readers import BaseRawReader
 from collections import namedtuple
-from .params import ParamsReader
+from multiprocessing.pool import ThreadPool
 import six
 import warnings
-import os.path as osp
+import os
 import numpy as np
-import struct
+import traits.api
 
 class BinaryRawReader(BaseRawReader):
+    """
+    Reader for split-channel binary EEG files, i.e. one ``<dataroot>.<channel>`` file per channel.
+
+    In addition to the keyword arguments accepted by :class:`BaseRawReader` the following are allowed:
+
+    :param use_memmap {bool} - memory-map each channel file and gather all epochs in a single vectorized operation
+        (default True). Files that cannot be memory-mapped are read with plain file I/O.
+    :param num_workers {int} - maximum number of channel files read concurrently (default 1, i.e. channels are read
+        one after another). Each channel is written into its own slice of the output array.
+    """
+
+    use_memmap = traits.api.Bool
+    num_workers = traits.api.Int
 
     def __init__(self,**kwargs):
+        self.use_memmap = kwargs.pop('use_memmap', True)
+        self.num_workers = kwargs.pop('num_workers', 1)
+        if self.num_workers < 1:
+            raise ValueError('num_workers must be at least 1')
         if 'channels' in kwargs:
             channels = kwargs['channels']
             if channels.dtype.names is not None and 'channel_1' in channels.dtype.names:
@@ -29,8 +46,6 @@ class BinaryRawReader(BaseRawReader):
 
         self.file_format = self.file_format_dict['int16']
 
-        p_reader = ParamsReader(dataroot=self.dataroot)
-        self.params_dict = p_reader.read()
         try:
             format_name = self.params_dict['format']
             try:
@@ -50,62 +65,153 @@ class BinaryRawReader(BaseRawReader):
     def get_file_size(self):
         """
         :return: {int} size of the files whose core name (dataroot) matches self.dataroot. Assumes ALL files with this
-        dataroot are of the same length and uses first channel to determin the common file length
+        dataroot are of the same length and uses first channel to determin the common file length. The size is
+        looked up in (and added to) the session catalog if one is set (see :attr:`catalog`)
         """
         if isinstance(self.channel_labels[0], six.binary_type):
             ch = self.channel_labels[0].decode()
         else:
             ch = self.channel_labels[0]
+        try:
+            return self._catalog_files[ch]
+        except KeyError:
+            pass
+
         eegfname = self.dataroot + '.' + ch
-        return osp.getsize(eegfname)
+        stat = os.stat(eegfname)
+        if self.catalog is not None:
+            self.catalog.store_file(self.dataroot, ch, stat.st_size, stat.st_mtime)
+            self._catalog_files[ch] = stat.st_size
+        return stat.st_size
+
+    def get_num_samples(self):
+        """
+        :return: {int} number of samples in each channel file (see :meth:`get_file_size`)
+        """
+        return int(self.get_file_size() / self.file_format.data_size)
+
+    def get_native_dtype(self):
+        """
+        :return: {dtype} dtype of the samples in the channel files (see the 'format' entry of the params file)
+        """
+        # hard-codes little endian
+        return np.dtype('<' + self.file_format.format_string)
 
-    def read_file(self,filename,channels,start_offsets=np.array([0]),read_size=-1):
+    def read_file(self,filename,channels,start_offsets=np.array([0]),read_size=-1,out=None,positions=None):
         if read_size < 0:
-            read_size = int(self.get_file_size() / self.file_format.data_size)
+            read_size = self.get_num_samples()
             self.read_size=read_size
 
         # allocate space for data
-        eventdata = np.empty((len(channels), len(start_offsets), read_size),
-                             dtype=np.float)
-        eventdata.fill(np.nan)
+        eventdata = self.allocate_eventdata((len(channels), len(start_offsets), read_size),
+                                            self.output_dtype(self.get_native_dtype()), out, positions)
         read_ok_mask = np.ones(shape=(len(channels), len(start_offsets)), dtype=np.bool)
-        # loop over channels
-        for c, channel in enumerate(channels):
+
+        def read_channel(c):
+            channel = channels[c]
             try:
                 eegfname = filename + '.' + channel
             except TypeError:
                 eegfname = filename + '.' + channel.decode()
 
-            with open(eegfname, 'rb') as efile:
-                # loop over start offsets
-                for e, start_offset in enumerate(start_offsets):
-                    # rejecting negative offset
-                    if start_offset < 0:
-                        read_ok_mask[c, e] = False
-                        print(('Cannot read from negative offset %d in file %s' % (start_offset, eegfname)))
-                        continue
-
-                    # seek to the position in the file
-                    efile.seek(self.file_format.data_size * start_offset, 0)
-
-                    # read the data
-                    data = efile.read(int(self.file_format.data_size * read_size))
-
-                    # convert from string to array based on the format
-                    # hard-codes little endian
-                    fmt = '<' + str(int(len(data) / self.file_format.data_size)) + self.file_format.format_string
-                    data = np.array(struct.unpack(fmt, data))
-
-                    # make sure we got some data
-                    if len(data) < read_size:
-                        read_ok_mask[c, e] = False
-
-                        print((
-                            'Cannot read full chunk of data for offset ' + str(start_offset) +
-                            'End of read interval  is outside the bounds of file ' + str(eegfname)))
-                    else:
-                        # append it to the eventdata
-                        eventdata[c, e, :] = data
+            if self.use_memmap and self.read_channel_memmap(eegfname, start_offsets, read_size,
+                                                            eventdata[c], read_ok_mask[c], positions):
+                return
+
+            self.read_channel_file(eegfname, start_offsets, read_size,
+                                   eventdata[c], read_ok_mask[c], positions)
+
+        num_workers = min(self.num_workers, len(channels))
+        if num_workers <= 1:
+            # loop over channels
+            for c in range(len(channels)):
+                read_channel(c)
+        else:
+            pool = ThreadPool(num_workers)
+            try:
+                pool.map(read_channel, range(len(channels)))
+            finally:
+                pool.close()
+                pool.join()
+
+        if out is not None:
+            self.fill_unread(eventdata, read_ok_mask, positions)
 
         return eventdata, read_ok_mask
 
+    def read_channel_memmap(self, eegfname, start_offsets, read_size, eventdata, read_ok_mask, positions=None):
+        """
+        Reads all epochs of a single channel file by memory-mapping the file and gathering every epoch with
+        :meth:`gather_epochs`.
+
+        :param eegfname: {str} path to the channel file
+        :param start_offsets: {ndarray} read offsets (in samples)
+        :param read_size: {int} number of samples to read at each offset
+        :param eventdata: {ndarray} output array of shape (len(start_offsets), read_size), filled in place
+        :param read_ok_mask: {ndarray} boolean array of shape (len(start_offsets),), updated in place
+        :param positions: {ndarray} optional positions along the first axis of eventdata the epochs are written to
+        :return: {bool} False if the file could not be memory-mapped (nothing is read in that case)
+        """
+        try:
+            # hard-codes little endian
+            data = np.memmap(eegfname, dtype='<' + self.file_format.format_string, mode='r')
+        except (ValueError, EnvironmentError):
+            # empty files or filesystems that do not support mmap
+            return False
+        in_bounds = self.gather_epochs(data, start_offsets, read_size, eventdata, positions=positions)
+        self.report_bad_offsets(eegfname, start_offsets, in_bounds)
+
+        read_ok_mask &= in_bounds
+        return True
+
+    def read_channel_file(self, eegfname, start_offsets, read_size, eventdata, read_ok_mask, positions=None):
+        """
+        Reads all epochs of a single channel file using plain file I/O. Overlapping and nearby epochs are coalesced
+        (see :meth:`plan_read_blocks`) so that every sample span is read from the file once and shared by all the
+        epochs that contain it.
+
+        :param eegfname: {str} path to the channel file
+        :param start_offsets: {ndarray} read offsets (in samples)
+        :param read_size: {int} number of samples to read at each offset
+        :param eventdata: {ndarray} output array of shape (len(start_offsets), read_size), filled in place
+        :param read_ok_mask: {ndarray} boolean array of shape (len(start_offsets),), updated in place
+        :param positions: {ndarray} optional positions along the first axis of eventdata the epochs are written to
+        """
+        data_size = self.file_format.data_size
+        # hard-codes little endian
+        dtype = '<' + self.file_format.format_string
+
+        with open(eegfname, 'rb') as efile:
+            num_samples = int(os.fstat(efile.fileno()).st_size / data_size)
+
+            for block_start, block_stop in self.plan_read_blocks(start_offsets, read_size, num_samples):
+                # seek to the position in the file
+                efile.seek(data_size * block_start, 0)
+
+                # read the data
+                data = np.frombuffer(efile.read(data_size * (block_stop - block_start)), dtype=dtype)
+                self.gather_epochs(data, start_offsets, read_size, eventdata,
+                                   source_offset=block_start, num_samples=num_samples, positions=positions)
+
+        in_bounds = self.epochs_in_bounds(start_offsets, read_size, num_samples)
+        self.report_bad_offsets(eegfname, start_offsets, in_bounds)
+
+        read_ok_mask &= in_bounds
+
+    @staticmethod
+    def report_bad_offsets(eegfname, start_offsets, in_bounds):
+        """
+        Prints a message for every offset that could not be read
+
+        :param eegfname: {str} path to the channel file
+        :param start_offsets: {ndarray} read offsets (in samples)
+        :param in_bounds: {ndarray} boolean mask of the offsets that were read
+        """
+        start_offsets = np.asarray(start_offsets)
+        for start_offset in start_offsets[~in_bounds]:
+            if start_offset < 0:
+                print(('Cannot read from negative offset %d in file %s' % (start_offset, eegfname)))
+            else:
+                print((
+                    'Cannot read full chunk of data for offset ' + str(start_offset) +
+                    'End of read interval  is outside the bounds of file ' + str(eegfname)))
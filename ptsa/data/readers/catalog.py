@@ -0,0 +1,180 @@
+import json
+import os
+import os.path as osp
+import sqlite3
+import threading
+
+__all__ = [
+    'SessionCatalog',
+]
+
+
+class SessionCatalog(object):
+    """
+    On-disk (SQLite) catalog of raw EEG session metadata keyed by dataroot.
+
+    Locating and parsing the params file of a session (params.txt, .params or sources.json) takes several
+    filesystem probes, and raw readers stat channel files to find the number of samples. Once a session is in the
+    catalog its params and channel file sizes are served from the database instead.
+
+    An entry is invalidated when the mtime of its params file or of the directory containing the dataroot
+    changes, i.e. when the params are edited or files are added to, removed from or replaced in the session
+    directory. Channel files rewritten in place do not change the directory mtime, so the size and mtime of every
+    cached channel file are checked as well and stale channel files are dropped from the entry. Checking this costs
+    two ``stat`` calls per session plus one per cached channel file. With ``validate=False`` entries are trusted
+    without touching the filesystem at all, which is appropriate for read-only archives. The database itself should
+    not live in a session directory since writing to it changes the directory mtime.
+
+    Raw readers consult the catalog assigned to :attr:`BaseRawReader.catalog`::
+
+        BaseRawReader.catalog = SessionCatalog('~/.ptsa/sessions.sqlite')
+
+    :param filename: {str} path to the SQLite database. Created if it does not exist
+    :param validate: {bool} check the mtimes of the params file, of the session directory and of the cached
+        channel files before using an entry (default True)
+    """
+
+    SCHEMA = """
+        CREATE TABLE IF NOT EXISTS sessions (
+            dataroot TEXT PRIMARY KEY,
+            params_file TEXT NOT NULL,
+            params_mtime REAL NOT NULL,
+            dir_mtime REAL NOT NULL,
+            params TEXT NOT NULL
+        );
+        CREATE TABLE IF NOT EXISTS channel_files (
+            dataroot TEXT NOT NULL,
+            channel TEXT NOT NULL,
+            size INTEGER NOT NULL,
+            mtime REAL NOT NULL,
+            PRIMARY KEY (dataroot, channel)
+        );
+    """
+
+    def __init__(self, filename, validate=True):
+        self.filename = osp.expanduser(filename)
+        self.validate = validate
+        self._lock = threading.Lock()
+        # readers may be used from several threads (e.g. EEGReader with num_workers > 1);
+        # all access goes through self._lock
+        self._connection = sqlite3.connect(self.filename, check_same_thread=False)
+        with self._connection:
+            self._connection.executescript(self.SCHEMA)
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, exc_type, exc_val, exc_tb):
+        self.close()
+
+    def close(self):
+        with self._lock:
+            self._connection.close()
+
+    @staticmethod
+    def key(dataroot):
+        """
+        :param dataroot: {str} core name of the eeg files
+        :return: {str} normalized dataroot used as the catalog key
+        """
+        return osp.abspath(dataroot)
+
+    def lookup(self, dataroot):
+        """
+        Returns the cached metadata of a session
+
+        :param dataroot: {str} core name of the eeg files
+        :return: {dict} with keys 'params' (the dictionary returned by ParamsReader.read) and 'files' (mapping of
+            channel to file size in bytes, without channel files that changed since they were stored) or None if the
+            session is not in the catalog or its entry is stale
+        """
+        key = self.key(dataroot)
+        with self._lock:
+            row = self._connection.execute(
+                'SELECT params_file, params_mtime, dir_mtime, params FROM sessions WHERE dataroot = ?',
+                (key,)).fetchone()
+            if row is None:
+                return None
+
+            params_file, params_mtime, dir_mtime, params = row
+            if self.validate:
+                try:
+                    if (os.stat(params_file).st_mtime != params_mtime or
+                            os.stat(osp.dirname(key)).st_mtime != dir_mtime):
+                        return None
+                except OSError:
+                    return None
+
+            files = {}
+            stale = []
+            for channel, size, mtime in self._connection.execute(
+                    'SELECT channel, size, mtime FROM channel_files WHERE dataroot = ?', (key,)).fetchall():
+                if self.validate and not self._file_unchanged(key + '.' + channel, size, mtime):
+                    stale.append((key, channel))
+                    continue
+                files[channel] = size
+
+            if stale:
+                with self._connection:
+                    self._connection.executemany(
+                        'DELETE FROM channel_files WHERE dataroot = ? AND channel = ?', stale)
+
+        return {'params': json.loads(params), 'files': files}
+
+    @staticmethod
+    def _file_unchanged(filename, size, mtime):
+        """
+        :return: {bool} True if filename exists and still has the given size and mtime
+        """
+        try:
+            stat = os.stat(filename)
+        except OSError:
+            return False
+        return stat.st_size == size and stat.st_mtime == mtime
+
+    def store_params(self, dataroot, params_file, params):
+        """
+        Adds (or replaces) the params of a session. Cached channel file sizes of the session are dropped.
+
+        :param dataroot: {str} core name of the eeg files
+        :param params_file: {str} path to the params file the params were read from
+        :param params: {dict} params as returned by ParamsReader.read
+        """
+        key = self.key(dataroot)
+        params_file = osp.abspath(params_file)
+        params_mtime = os.stat(params_file).st_mtime
+        dir_mtime = os.stat(osp.dirname(key)).st_mtime
+        with self._lock:
+            with self._connection:
+                self._connection.execute('DELETE FROM channel_files WHERE dataroot = ?', (key,))
+                self._connection.execute(
+                    'INSERT OR REPLACE INTO sessions (dataroot, params_file, params_mtime, dir_mtime, params) '
+                    'VALUES (?, ?, ?, ?, ?)',
+                    (key, params_file, params_mtime, dir_mtime, json.dumps(params)))
+
+    def store_file(self, dataroot, channel, size, mtime):
+        """
+        Adds (or replaces) the size and mtime of a channel file of a session
+
+        :param dataroot: {str} core name of the eeg files
+        :param channel: {str} channel label (file extension)
+        :param size: {int} file size in bytes
+        :param mtime: {float} file modification time
+        """
+        with self._lock:
+            with self._connection:
+                self._connection.execute(
+                    'INSERT OR REPLACE INTO channel_files (dataroot, channel, size, mtime) VALUES (?, ?, ?, ?)',
+                    (self.key(dataroot), channel, int(size), mtime))
+
+    def remove(self, dataroot):
+        """
+        Removes a session from the catalog
+
+        :param dataroot: {str} core name of the eeg files
+        """
+        key = self.key(dataroot)
+        with self._lock:
+            with self._connection:
+                self._connection.execute('DELETE FROM channel_files WHERE dataroot = ?', (key,))
+                self._connection.execute('DELETE FROM sessions WHERE dataroot = ?', (key,))
@@ -1,6 +1,9 @@
-from contextlib import closing
+import atexit
+from collections import OrderedDict
+from contextlib import contextmanager
 import logging
 import os.path as osp
+import threading
 import warnings
 
 import numpy as np
@@ -12,19 +15,63 @@ logger = logging.getLogger(__name__)
 logger.addHandler(logging.NullHandler())
 
 
+class _EDFHandle(object):
+    """An open :class:`EDFFile` shared by all readers of the same file."""
+    def __init__(self, filename):
+        self.filename = filename
+        self.edf = EDFFile(filename)
+        self.lock = threading.RLock()
+        self.users = 0
+        self.closed = False
+        # set when the file is dropped from the cache while in use; it is
+        # closed when the last user releases it
+        self.close_on_release = False
+
+    def close(self):
+        # waits for a read in progress to finish
+        with self.lock:
+            if not self.closed:
+                self.edf.close()
+                self.closed = True
+
+
 class EDFRawReader(BaseRawReader):
     """Reads EEG data stored in the European Data Format (EDF/BDF, EDF+/BDF+
     formats).
 
+    Open files are kept in a process-wide cache so that the header of a given
+    file is parsed only once and shared by every reader of that file. A reader
+    normally only holds on to the shared file while reading; calling
+    :meth:`open` (or using the reader as a context manager) keeps the file
+    open until :meth:`close` is called. Idle files beyond
+    :attr:`max_cached_files` are closed in least-recently-used order and all
+    cached files can be closed with :meth:`close_all`.
+
     Keyword arguments
     -----------------
     dataroot : str
         Full path to EDF/BDF/EDF+/BDF+ file (including extension).
     channels : List[Union[str, int]]
         List of channels to read.
+    dtype : Union[None, str, np.dtype]
+        None (default) or a floating point dtype (see :class:`BaseRawReader`).
+        edflib only returns samples converted to physical units, so
+        ``'native'`` is not supported and raises a ``ValueError``.
+
+    Examples
+    --------
+    Keep the file open while reading several times::
 
+        with EDFRawReader(dataroot='session.bdf', channels=channels) as reader:
+            data, mask = reader.read()
 
     """
+    #: Maximum number of idle files kept open in the cache
+    max_cached_files = 16
+
+    _handles = OrderedDict()
+    _handles_lock = threading.Lock()
+
     def __init__(self, **kwargs):
         if EDFFile is None:
             raise RuntimeError(
@@ -36,8 +83,94 @@ class EDFRawReader(BaseRawReader):
         _, data_ext = osp.splitext(kwargs['dataroot'])
         if not len(data_ext):
             raise RuntimeError('Dataroot missing extension (must be supplied for EDF reader)')
+        if self.is_native_dtype(kwargs.get('dtype')):
+            raise ValueError("dtype='native' is not supported by the EDF reader, which reads physical values")
+        self._handle = None
         super(EDFRawReader, self).__init__(**kwargs)
 
+    def __enter__(self):
+        self.open()
+        return self
+
+    def __exit__(self, exc_type, exc_value, traceback):
+        self.close()
+
+    def open(self):
+        """Open the file (or reuse the cached open file) and keep it open until
+        :meth:`close` is called.
+
+        """
+        if self._handle is None or self._handle.closed:
+            self._handle = self._acquire_handle(self.dataroot)
+
+    def close(self):
+        """Release the file opened with :meth:`open`. The file itself stays in
+        the cache for use by other readers.
+
+        """
+        if self._handle is not None:
+            self._release_handle(self._handle)
+            self._handle = None
+
+    @classmethod
+    def close_all(cls):
+        """Close every file in the process-wide cache. Files that are in use
+        (see :meth:`open`) are removed from the cache and closed when their
+        last user releases them.
+
+        """
+        with cls._handles_lock:
+            idle = []
+            for handle in cls._handles.values():
+                if handle.users > 0:
+                    handle.close_on_release = True
+                else:
+                    idle.append(handle)
+            cls._handles.clear()
+        for handle in idle:
+            handle.close()
+
+    @classmethod
+    def _acquire_handle(cls, filename):
+        key = osp.abspath(filename)
+        with cls._handles_lock:
+            handle = cls._handles.pop(key, None)
+            if handle is None or handle.closed:
+                handle = _EDFHandle(key)
+            # most recently used handles are kept at the end
+            cls._handles[key] = handle
+            handle.users += 1
+        return handle
+
+    @classmethod
+    def _release_handle(cls, handle):
+        with cls._handles_lock:
+            handle.users -= 1
+            to_close = [handle] if handle.users <= 0 and handle.close_on_release else []
+            idle = [key for key, h in cls._handles.items() if h.users <= 0]
+            for key in idle[:max(0, len(cls._handles) - cls.max_cached_files)]:
+                to_close.append(cls._handles.pop(key))
+        # idle handles are no longer in the cache, so nobody can pick them up
+        for h in to_close:
+            h.close()
+
+    @contextmanager
+    def _edf_file(self):
+        """Yield the shared :class:`EDFFile` for this reader's dataroot while
+        holding its lock.
+
+        """
+        handle = self._handle
+        acquired = handle is None or handle.closed
+        if acquired:
+            handle = self._acquire_handle(self.dataroot)
+        try:
+            with handle.lock:
+                yield handle.edf
+        finally:
+            if acquired:
+                self._release_handle(handle)
+
     def init_params(self):
         return {'gain':1,
                 'samplerate':self.samplerate()
@@ -45,23 +178,63 @@ class EDFRawReader(BaseRawReader):
 
 
     def samplerate(self):
-        with closing(EDFFile(self.dataroot)) as self._edf:
+        with self._edf_file() as edf:
             channels = self.channels
             if not len(channels):
-                channels = [n for n in range(self._edf.num_channels)]
+                channels = [n for n in range(edf.num_channels)]
             else:
                 try:
                     channels = [int(n) for n in channels]
                 except ValueError:
-                    channels = self._edf.get_channel_numbers(channels)
+                    channels = edf.get_channel_numbers(channels)
 
-            samplerates = [self._edf.get_samplerate(c) for c in channels]
+            samplerates = [edf.get_samplerate(c) for c in channels]
             if not (len(np.unique(samplerates))==1):
                 raise RuntimeError('Inconsistent samplerates across channels; cannot read channels simultaneously')
             return samplerates[0]
 
+    def get_num_samples(self):
+        """Return the number of samples per channel in the file."""
+        with self._edf_file() as edf:
+            return int(edf.num_samples)
+
+    def resolve_channels(self):
+        """Set ``self.channels`` to the (index, label) records of the channels
+        :meth:`read_file` reads and return their number. Only the header of
+        the file is consulted.
+
+        """
+        with self._edf_file() as edf:
+            channels, indexes, labels = self._resolve_edf_channels(edf, self.channel_labels)
+        self.channels = self._channel_records(indexes, labels)
+        return len(channels)
+
+    @staticmethod
+    def _resolve_edf_channels(edf, channels):
+        """Return the channels to pass to edflib together with their indexes
+        and labels. All channels are read if ``channels`` is empty.
+
+        """
+        if not len(channels):
+            indexes = channels = [n for n in range(edf.num_channels)]
+            labels = [edf.get_channel_info(c).label for c in channels]
+        else:
+            try:
+                channels = [int(c) for c in channels]
+                indexes = channels
+                labels = [edf.get_channel_info(c).label for c in channels]
+            except ValueError:
+                channels = [c for c in channels]
+                indexes = edf.get_channel_numbers(channels)
+                labels = channels
+        return channels, indexes, labels
+
+    @staticmethod
+    def _channel_records(indexes, labels):
+        return np.rec.array(list(zip(indexes,labels)),dtype=[('index',int),('label','S17')])
+
     def read_file(self, filename, channels, start_offsets=np.array([0]),
-                  read_size=-1):
+                  read_size=-1, out=None, positions=None):
         """Read an EDF/BDF/EDF+/BDF+ file.
 
         Parameters
@@ -74,6 +247,13 @@ class EDFRawReader(BaseRawReader):
             Indices to start reading at (*not* the actual offset times).
         read_size : int
             Number of samples to read at each offset.
+        out : np.ndarray
+            Optional array to copy the data to. edflib decodes samples into
+            its own buffer, so this saves an allocation only when the data are
+            later assembled into a larger array.
+        positions : np.ndarray
+            Optional positions along the second axis of ``out`` the epochs are
+            copied to (see :meth:`read_into`).
 
         Returns
         -------
@@ -82,57 +262,44 @@ class EDFRawReader(BaseRawReader):
             indicating whether each offset was read successfully.
 
         """
-        with closing(EDFFile(self.dataroot)) as self._edf:
-
-            if not len(channels):
-                indexes = channels = [n for n in range(self._edf.num_channels)]
-                labels = [self._edf.get_channel_info(c).label for c in channels]
-            else:
-                try:
-                    channels = [int(c) for c in channels]
-                    indexes = channels
-                    labels = [self._edf.get_channel_info(c).label for c in channels]
-                except ValueError:
-                    channels = [c for c in channels]
-                    indexes = self._edf.get_channel_numbers(channels)
-                    labels = channels
-
+        with self._edf_file() as edf:
+            channels, indexes, labels = self._resolve_edf_channels(edf, channels)
 
             # Read all data
             if read_size < 0:
                 if len(start_offsets) > 1:
                     msg = "start_offsets given when read_size implies reading all data"
                     warnings.warn(msg, UserWarning)
-                data = self._edf.read_samples(channels, self._edf.num_samples)
-                self.read_size = int(self._edf.num_samples)
+                data = edf.read_samples(channels, edf.num_samples)
+                self.read_size = int(edf.num_samples)
                 data = data[:,None,:]
                 read_ok_mask = np.ones((len(channels), 1), dtype=bool)
 
             # Read epochs
             else:
-                data = np.empty((len(channels), len(start_offsets), read_size),
-                                dtype=np.float)
-                data.fill(np.nan)
-                read_ok_mask = np.ones((len(channels), len(start_offsets)),
-                                       dtype=bool)
-
-                for i, offset in enumerate(start_offsets):
+                data, in_bounds = edf.read_epochs(channels, np.asarray(start_offsets), read_size)
+                for offset in np.asarray(start_offsets)[~in_bounds]:
                     if offset < 0:
                         logger.warning("Cannot read negative offset %d", offset)
-                        read_ok_mask[:, i] = False
-                        continue
-
-                    samples = self._edf.read_samples(channels, read_size, offset=offset)
-                    if samples.shape[1] == read_size:
-                        data[:, i, :] = samples
                     else:
                         logger.warning("Cannot read full chunk of data for offset %d... probably end of file", offset)
-                        read_ok_mask[:, i] = False
+                read_ok_mask = np.tile(in_bounds, (len(channels), 1))
 
-            self.channels = np.rec.array(list(zip(indexes,labels)),dtype=[('index',int),('label','S17')])
+            self.channels = self._channel_records(indexes, labels)
+            if out is not None:
+                out = self.allocate_eventdata(data.shape, None, out, positions)
+                if positions is None:
+                    out[...] = data
+                else:
+                    out[:, positions, :] = data
+                self.fill_unread(out, read_ok_mask, positions)
+                return out, read_ok_mask
             return data, read_ok_mask
 
 
+atexit.register(EDFRawReader.close_all)
+
+
 if __name__ == "__main__": # pragma: no cover
     logger.addHandler(logging.StreamHandler())
     fname = osp.expanduser("/Volumes/rhino_root/data/eeg/eeg/scalp/ltp/ltpFR2/LTP375/session_0/eeg/LTP375_session_0.bdf")
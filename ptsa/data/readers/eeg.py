@@ -1,16 +1,24 @@
 from collections import defaultdict
+from copy import deepcopy
+from functools import partial
+from multiprocessing.pool import ThreadPool
 import os.path
 import warnings
 
 import numpy as np
-import xarray as xr
+
+try:
+    import dask
+    import dask.array as da
+except ImportError:
+    da = None
 
 import traits.api
 from ptsa.data.readers.params import ParamsReader
 from ptsa.data.readers.edf import EDFRawReader
 from ptsa.data.readers.binary import BinaryRawReader
 from ptsa.data.readers.hdf5 import H5RawReader
-from ptsa.data.readers.base import BaseReader
+from ptsa.data.readers.base import BaseReader, BaseRawReader
 from ptsa.data.timeseries import TimeSeries
 
 __all__ = [
@@ -23,6 +31,32 @@ class IncompatibleDataError(Exception):
     pass
 
 
+def _read_lazy_block(make_reader, channels, num_channels, start_offsets, read_size, dtype):
+    """
+    Reads a single (channels x start_offsets x read_size) block for a lazy read and applies the gain. Every block
+    is read by a raw reader of its own since read_file updates the reader's channel metadata and blocks may be
+    computed concurrently.
+
+    :param make_reader: callable returning a new BaseRawReader for the dataroot
+    :param channels: channel labels passed to read_file
+    :param num_channels: {int} number of channels read
+    :param start_offsets: {ndarray} read offsets of the block
+    :param read_size: {int} number of samples per epoch
+    :param dtype: dtype of the block
+    :return: tuple of the block and a boolean mask of the events that were read on all of its channels
+    """
+    raw_reader = make_reader()
+    in_bounds = raw_reader.epochs_in_bounds(start_offsets, read_size, raw_reader.get_num_samples())
+    if not in_bounds.any():
+        # no epoch can be read on the first channel, i.e. its read_ok_mask is all False. Readers may refuse to
+        # read such blocks (H5RawReader raises), so the block is filled without reading
+        eventdata = raw_reader.empty_eventdata((num_channels, len(start_offsets), read_size), dtype)
+        return eventdata, in_bounds
+
+    eventdata, read_ok_mask = raw_reader.read_file(raw_reader.dataroot, channels, start_offsets, read_size)
+    return raw_reader.apply_gain(eventdata), np.all(read_ok_mask, axis=0)
+
+
 class EEGReader(traits.api.HasTraits):
     """
     Reader that knows how to read binary eeg files. It can read chunks of the eeg signal based on events input
@@ -47,6 +81,15 @@ class EEGReader(traits.api.HasTraits):
         session
     remove_bad_events : bool
         Remove "bad" events. Defaults to True.
+    num_workers : int
+        Number of threads used to read data from different dataroots
+        concurrently. Defaults to 1 (read dataroots one after another).
+    dtype : str or np.dtype
+        dtype of the data. None (default) reads float64 data scaled by the gain,
+        a floating point dtype (e.g. 'float32') reads scaled data of that dtype
+        and 'native' reads the unscaled samples as stored in the files (e.g.
+        int16); multiply by ``attrs['gain']`` to obtain physical units. See
+        :class:`BaseRawReader`.
 
     Notes
     -----
@@ -59,6 +102,11 @@ class EEGReader(traits.api.HasTraits):
     buffer_time = traits.api.CFloat
     session_dataroot = traits.api.Str
     remove_bad_events = traits.api.Bool
+    num_workers = traits.api.Int
+    dtype = traits.api.Any
+
+    #: Default (channels, events) chunk sizes used by lazy reads
+    LAZY_CHUNKS = (16, 256)
 
     READER_FILETYPE_DICT = defaultdict(lambda : BinaryRawReader)
     READER_FILETYPE_DICT.update({'.h5':H5RawReader,
@@ -66,7 +114,8 @@ class EEGReader(traits.api.HasTraits):
                                  '.edf':EDFRawReader,})
 
     def __init__(self,events=None ,channels=np.array([], dtype='|S3'),
-                 start_time=0.0,end_time=0.0,buffer_time=0.0,session_dataroot='',remove_bad_events=True):
+                 start_time=0.0,end_time=0.0,buffer_time=0.0,session_dataroot='',remove_bad_events=True,
+                 num_workers=1, dtype=None):
         warnings.warn("Lab-specific readers may be moved to the cmlreaders "
                       "package (https://github.com/pennmem/cmlreaders)",
                       FutureWarning)
@@ -77,12 +126,15 @@ class EEGReader(traits.api.HasTraits):
         self.buffer_time = buffer_time
         self.session_dataroot = session_dataroot
         self.remove_bad_events = remove_bad_events
+        self.num_workers = num_workers
+        self.dtype = dtype
         self.removed_corrupt_events = False
         self.event_ok_mask_sorted = None
 
         assert self.start_time <= self.end_time, \
             'start_time (%s) must be less or equal to end_time(%s) ' % (self.start_time, self.end_time)
         assert self.events is not None or self.session_dataroot, 'Either events or session_dataroot must be present'
+        assert self.num_workers >= 1, 'num_workers (%s) must be at least 1' % self.num_workers
 
         self.read_fcn = self.read_events_data
         if self.session_dataroot:
@@ -107,6 +159,14 @@ class EEGReader(traits.api.HasTraits):
 
         return start_offset, end_offset, buffer_offset
 
+    def raw_reader_factory(self, dataroot):
+        """
+        :param dataroot: {str} core name of the eeg files
+        :return: callable that creates a new BaseRawReader of the right type for dataroot
+        """
+        RawReader = self.READER_FILETYPE_DICT[os.path.splitext(dataroot)[-1]]
+        return partial(RawReader, dataroot=dataroot, channels=self.channels, dtype=self.dtype)
+
     def __create_base_raw_readers(self):
         """
         Creates BaseRawreader for each (unique) dataroot present in events recarray
@@ -119,42 +179,84 @@ class EEGReader(traits.api.HasTraits):
         original_dataroots = []
 
         for dataroot in dataroots:
-            RawReader = self.READER_FILETYPE_DICT[os.path.splitext(dataroot)[-1]]
-            brr = RawReader(dataroot =dataroot)
+            brr = self.raw_reader_factory(dataroot)()
 
             events_with_matched_dataroot = evs[evs.eegfile == dataroot]
 
             start_offset, end_offset, buffer_offset = self.compute_read_offsets(brr)
 
-            read_size = end_offset - start_offset + 2 * buffer_offset
-
-            # start_offsets = events_with_matched_dataroot.eegoffset + start_offset - buffer_offset
-            start_offsets = events_with_matched_dataroot.eegoffset + start_offset - buffer_offset
+            # the read parameters depend on the samplerate, so they are set
+            # after the reader has loaded its params
+            brr.read_size = end_offset - start_offset + 2 * buffer_offset
+            brr.start_offsets = events_with_matched_dataroot.eegoffset + start_offset - buffer_offset
 
-            brr = RawReader(dataroot=dataroot,
-                            channels=self.channels,
-                            start_offsets=start_offsets,
-                            read_size=read_size)
             raw_readers.append(brr)
 
             original_dataroots.append(dataroot)
 
         return raw_readers, original_dataroots
 
-    def read_session_data(self):
+    def __read_raw_readers(self, tasks, out):
         """
-        Reads entire session worth of data
+        Reads the epochs of every raw reader into out, using a pool of up to self.num_workers threads
 
-        :return: TimeSeries object (channels x events x time) with data for entire session the events dimension has length 1
+        :param tasks: list of (raw reader, positions) tuples: the positions along the events axis of out the epochs
+            of the raw reader are written to (see :meth:`BaseRawReader.read_into`)
+        :param out: {ndarray} (channels x events x time) output array
+        :return: list of the read_ok_masks of the raw readers
         """
-        brr = self.READER_FILETYPE_DICT[os.path.splitext(self.session_dataroot)[-1]](dataroot=self.session_dataroot, channels=self.channels)
-        session_array,read_ok_mask = brr.read()
-        self.channel_name = brr.channel_name
+        num_workers = min(self.num_workers, len(tasks))
+        if num_workers <= 1:
+            return [raw_reader.read_into(out, positions) for raw_reader, positions in tasks]
+
+        pool = ThreadPool(num_workers)
+        try:
+            return pool.map(lambda task: task[0].read_into(out, task[1]), tasks)
+        finally:
+            pool.close()
+            pool.join()
+
+    def __event_indices(self, raw_readers, original_dataroots):
+        """
+        Finds the events read by each raw reader and sets self.channel_name
 
+        :param raw_readers: list of BaseRawReaders (one per dataroot)
+        :param original_dataroots: list of the dataroots of raw_readers
+        :return: list of the indices into self.events of the events read by each raw reader
+        :raises: :py:class:IncompatibleDataError if monopolar and bipolar data are read together
+        """
+        evs = self.events
+        ordered_indices = np.arange(len(evs))
+        event_indices_list = [ordered_indices[np.atleast_1d(evs.eegfile == dataroot)]
+                              for dataroot in original_dataroots]
+
+        if not all([r.channel_name==raw_readers[0].channel_name for r in raw_readers]):
+            raise IncompatibleDataError('cannot read monopolar and bipolar data together')
+
+        self.channel_name = raw_readers[0].channel_name
+
+        return event_indices_list
+
+    def __create_session_raw_reader(self):
+        """
+        Creates BaseRawReader for self.session_dataroot
+        :return: BaseRawReader
+        """
+        RawReader = self.READER_FILETYPE_DICT[os.path.splitext(self.session_dataroot)[-1]]
+        return RawReader(dataroot=self.session_dataroot, channels=self.channels, dtype=self.dtype)
+
+    def __session_time_series(self, session_array):
+        """
+        Converts the DataArray returned by a raw reader for a session read into a TimeSeries
+
+        :param session_array: DataArray (channels x start_offsets x offsets) with a single start offset
+        :return: TimeSeries object (channels x start_offsets x time)
+        """
         offsets_axis = session_array['offsets']
         number_of_time_points = offsets_axis.shape[0]
         samplerate = float(session_array['samplerate'])
-        physical_time_array = np.arange(number_of_time_points) * (1.0 / samplerate)
+        first_sample = int(session_array['start_offsets'][0])
+        physical_time_array = (first_sample + np.arange(number_of_time_points)) * (1.0 / samplerate)
 
         # session_array = session_array.rename({'start_offsets': 'events'})
 
@@ -164,7 +266,7 @@ class EEGReader(traits.api.HasTraits):
                                               self.channel_name: session_array[self.channel_name],
                                               'start_offsets': session_array['start_offsets'],
                                               'time': physical_time_array,
-                                              'offsets': ('time', session_array['offsets']),
+                                              'offsets': ('time', first_sample + session_array['offsets'].values),
                                               'samplerate': session_array['samplerate']
                                           }
                                          )
@@ -173,16 +275,71 @@ class EEGReader(traits.api.HasTraits):
 
         return session_time_series
 
+    def read_session_data(self, out=None):
+        """
+        Reads entire session worth of data
+
+        :param out: {ndarray} optional (channels x 1 x time) array the data are written to (see
+            :meth:`BaseRawReader.read`)
+        :return: TimeSeries object (channels x events x time) with data for entire session the events dimension has length 1
+        """
+        brr = self.__create_session_raw_reader()
+        session_array,read_ok_mask = brr.read(out=out)
+        self.channel_name = brr.channel_name
+
+        return self.__session_time_series(session_array)
+
+    def iter_session(self, window, overlap=0.0):
+        """
+        Iterates over the session in fixed-size windows without loading the entire session into memory
+
+        :param window: {float} length of each window in seconds
+        :param overlap: {float} overlap between consecutive windows in seconds (default 0)
+        :return: generator of TimeSeries objects (channels x start_offsets x time) whose 'time' and 'offsets'
+            coordinates are expressed w.r.t. the beginning of the session. The last window is truncated at the end
+            of the session.
+        """
+        assert self.session_dataroot, 'iter_session requires session_dataroot'
+
+        brr = self.__create_session_raw_reader()
+        self.channel_name = brr.channel_name
+
+        samplerate = float(brr.params_dict['samplerate'])
+        window_size = int(np.round(window * samplerate))
+        step = window_size - int(np.round(overlap * samplerate))
+        assert window_size > 0, 'window (%s) must be at least one sample long' % window
+        assert step > 0, 'overlap (%s) must be shorter than window (%s)' % (overlap, window)
+
+        num_samples = brr.get_num_samples()
+        start = 0
+        while start < num_samples:
+            brr.start_offsets = np.array([start])
+            brr.read_size = min(window_size, num_samples - start)
+            session_array, read_ok_mask = brr.read()
+            yield self.__session_time_series(session_array)
+
+            if start + window_size >= num_samples:
+                break
+            start += step
+
     def removed_bad_data(self):
         return self.removed_corrupt_events
 
     def get_event_ok_mask(self):
         return self.event_ok_mask_sorted
 
-    def read_events_data(self):
+    def read_events_data(self, out=None):
         """
         Reads eeg data for individual event
 
+        The channels and dtype of the data are resolved from the metadata of the first raw reader, so that a single
+        (channels x events x time) array is allocated up front and every raw reader writes its epochs directly into
+        their positions in it. Bad events, i.e. events that could not be read on all channels according to the read_ok_mask of the
+        raw readers, are removed afterwards.
+
+        :param out: {ndarray} optional (channels x events x time) array the data are written to, with one entry per
+            event in self.events. The returned TimeSeries is backed by out unless bad events are removed, in which
+            case it holds a copy of the good events
         :return: TimeSeries  object (channels x events x time) with data for individual events
         """
         self.event_ok_mask_sorted = None  # reset self.event_ok_mask_sorted
@@ -191,43 +348,39 @@ class EEGReader(traits.api.HasTraits):
 
         raw_readers, original_dataroots = self.__create_base_raw_readers()
 
-        # used for restoring original order of the events
-        ordered_indices = np.arange(len(evs))
-        event_indices_list = []
-        events = []
-
-        ts_array_list = []
+        event_indices_list = self.__event_indices(raw_readers, original_dataroots)
 
-        event_ok_mask_list = []
+        # the first raw reader determines the channels and the dtype of the output
+        raw_reader = raw_readers[0]
+        shape = (raw_reader.resolve_channels(), len(evs), raw_reader.read_size)
+        if out is None:
+            # every epoch is either read or filled by the raw readers
+            out = np.empty(shape, dtype=raw_reader.output_dtype(raw_reader.get_native_dtype()))
+        elif out.shape != shape:
+            raise ValueError('out has shape %s but the data read has shape %s' % (out.shape, shape))
 
-        for s, (raw_reader, dataroot) in enumerate(zip(raw_readers, original_dataroots)):
+        read_ok_masks = self.__read_raw_readers(list(zip(raw_readers, event_indices_list)), out)
 
-            ts_array, read_ok_mask = raw_reader.read()
-
-            event_ok_mask_list.append(np.all(read_ok_mask,axis=0))
-
-            ind = np.atleast_1d(evs.eegfile == dataroot)
-            event_indices_list.append(ordered_indices[ind])
-            events.append(evs[ind])
-
-            ts_array_list.append(ts_array)
-
-        if not all([r.channel_name==raw_readers[0].channel_name for r in raw_readers]):
-            raise IncompatibleDataError('cannot read monopolar and bipolar data together')
+        event_ok_mask = np.zeros(len(evs), dtype=bool)
+        for event_indices, read_ok_mask in zip(event_indices_list, read_ok_masks):
+            event_ok_mask[event_indices] = np.all(read_ok_mask, axis=0)
 
-        self.channel_name = raw_readers[0].channel_name
+        # removing bad events
+        if self.remove_bad_events:
+            if np.any(~event_ok_mask):
+                warnings.warn("Found some bad events. Removing!", UserWarning)
+                self.removed_corrupt_events = True
+                self.event_ok_mask_sorted = event_ok_mask
 
-        event_indices_array = np.hstack(event_indices_list)
-        event_indices_restore_sort_order_array = event_indices_array.argsort()
+        if not event_ok_mask.all():
+            out = out[:, event_ok_mask, :]
 
-        eventdata = xr.concat(ts_array_list, dim='start_offsets')
-        samplerate = float(eventdata['samplerate'])
-        tdim = np.arange(eventdata.shape[-1]) * (1.0 / samplerate) + (self.start_time - self.buffer_time)
-        cdim = eventdata[self.channel_name]
-        edim = np.rec.array(np.concatenate(events))
+        samplerate = float(raw_readers[0].params_dict['samplerate'])
+        tdim = np.arange(out.shape[-1]) * (1.0 / samplerate) + (self.start_time - self.buffer_time)
+        cdim = raw_readers[0].channels
+        edim = np.rec.array(evs[event_ok_mask])
 
-        attrs = eventdata.attrs.copy()
-        eventdata = TimeSeries(eventdata.data,
+        eventdata = TimeSeries(out,
                                dims=[self.channel_name, 'events', 'time'],
                                coords={self.channel_name: cdim,
                                         'events': edim,
@@ -236,29 +389,135 @@ class EEGReader(traits.api.HasTraits):
                                         }
                                )
 
-        eventdata.attrs = attrs
+        eventdata.attrs = deepcopy(raw_readers[0].params_dict)
+
+        return eventdata
+
+    def __lazy_event_array(self, raw_reader, make_reader, channel_chunk, event_chunk):
+        """
+        Builds a dask array (channels x start_offsets x time) for raw_reader. Every chunk spans a block of channels
+        and a block of events and is read by a new raw reader (see :func:`_read_lazy_block`) when it is computed.
+
+        :param raw_reader: BaseRawReader with start_offsets and read_size set
+        :param make_reader: callable creating a new raw reader for the dataroot of raw_reader
+        :param channel_chunk: {int} number of channels per chunk
+        :param event_chunk: {int} number of events per chunk
+        :return: tuple of the dask array and a dask array of the events (start_offsets) that were read on all
+            channels
+        """
+        # the shape and dtype of the array come from the channel metadata, so no data are read until it is computed
+        channel_labels = raw_reader.channel_labels
+        num_channels = raw_reader.resolve_channels()
+        dtype = raw_reader.output_dtype(raw_reader.get_native_dtype())
+
+        # H5RawReader.read_file orders and labels the channels it reads from the
+        # file, so it is only read for all channels at once
+        if not len(channel_labels) or isinstance(raw_reader, H5RawReader):
+            channel_blocks = [(channel_labels, num_channels)]
+        else:
+            channel_blocks = [(channel_labels[i:i + channel_chunk], len(channel_labels[i:i + channel_chunk]))
+                              for i in range(0, num_channels, channel_chunk)]
+
+        start_offsets = np.asarray(raw_reader.start_offsets)
+        read_size = raw_reader.read_size
+
+        rows = []
+        row_masks = []
+        for channels, n_channels in channel_blocks:
+            row = []
+            row_mask = []
+            for i in range(0, len(start_offsets), event_chunk):
+                offsets = start_offsets[i:i + event_chunk]
+                block, block_mask = dask.delayed(_read_lazy_block, nout=2)(
+                    make_reader, channels, n_channels, offsets, read_size, dtype)
+                row.append(da.from_delayed(block, shape=(n_channels, len(offsets), read_size), dtype=dtype))
+                row_mask.append(da.from_delayed(block_mask, shape=(len(offsets),), dtype=bool))
+            rows.append(da.concatenate(row, axis=1))
+            row_masks.append(da.concatenate(row_mask))
+
+        return da.concatenate(rows, axis=0), da.stack(row_masks).all(axis=0)
+
+    def read_events_data_lazy(self, chunks=None):
+        """
+        Reads eeg data for individual events lazily. No data are read until the values of the returned TimeSeries
+        are accessed (or computed), at which point only the chunks that are needed are read.
+
+        Which events cannot be read is only known once their data are read, so unlike :meth:`read_events_data`
+        bad events are not removed: the returned TimeSeries has one entry per event and the epochs that could not
+        be read are filled with NaN (0 for native dtypes). :meth:`get_event_ok_mask` returns a lazy boolean mask of
+        the events that were read on all channels, computed from the read_ok_mask of the raw readers. It shares the
+        reads with the data when both are computed together::
+
+            eeg = reader.read(lazy=True)
+            data, event_ok_mask = dask.compute(eeg.data, reader.get_event_ok_mask())
+
+        :param chunks: {int or tuple} number of events per chunk or (channels per chunk, events per chunk).
+            Defaults to LAZY_CHUNKS
+        :return: TimeSeries  object (channels x events x time) backed by a dask array
+        """
+        if da is None:
+            raise RuntimeError("Lazy reads require dask. Please pip install dask")
+
+        if chunks is None:
+            chunks = self.LAZY_CHUNKS
+        elif np.isscalar(chunks):
+            chunks = (self.LAZY_CHUNKS[0], chunks)
+        channel_chunk, event_chunk = chunks
+
+        evs = self.events
+
+        raw_readers, original_dataroots = self.__create_base_raw_readers()
+
+        event_indices_list = self.__event_indices(raw_readers, original_dataroots)
+
+        arrays = []
+        masks = []
+        for raw_reader, dataroot in zip(raw_readers, original_dataroots):
+            array, mask = self.__lazy_event_array(raw_reader, self.raw_reader_factory(dataroot),
+                                                  channel_chunk, event_chunk)
+            arrays.append(array)
+            masks.append(mask)
 
         # restoring original order of the events
-        eventdata = eventdata[:, event_indices_restore_sort_order_array, :]
+        event_indices_restore_sort_order_array = np.hstack(event_indices_list).argsort()
+        data = da.concatenate(arrays, axis=1)[:, event_indices_restore_sort_order_array, :]
+        self.event_ok_mask_sorted = da.concatenate(masks)[event_indices_restore_sort_order_array]
 
-        event_ok_mask = np.hstack(event_ok_mask_list)
-        event_ok_mask_sorted = event_ok_mask[event_indices_restore_sort_order_array]
+        samplerate = float(raw_readers[0].params_dict['samplerate'])
+        tdim = np.arange(data.shape[-1]) * (1.0 / samplerate) + (self.start_time - self.buffer_time)
+        cdim = raw_readers[0].channels
+        edim = np.rec.array(evs)
 
-        # removing bad events
-        if self.remove_bad_events:
-            if np.any(~event_ok_mask_sorted):
-                warnings.warn("Found some bad events. Removing!", UserWarning)
-                self.removed_corrupt_events = True
-                self.event_ok_mask_sorted = event_ok_mask_sorted
+        eventdata = TimeSeries(data,
+                               dims=[self.channel_name, 'events', 'time'],
+                               coords={self.channel_name: cdim,
+                                        'events': edim,
+                                        'time': tdim,
+                                        'samplerate': samplerate
+                                        }
+                               )
 
-        eventdata = eventdata[:, event_ok_mask_sorted, :]
+        eventdata.attrs = deepcopy(raw_readers[0].params_dict)
 
         return eventdata
 
-    def read(self):
+    def read(self, lazy=False, chunks=None, out=None):
         """
         Calls read_events_data or read_session_data depending on user selection
 
+        :param lazy: {bool} if True, return a TimeSeries backed by a dask array that reads data on demand (see
+            :meth:`read_events_data_lazy`). Requires dask; only supported when reading events
+        :param chunks: {int or tuple} chunk sizes for lazy reads
+        :param out: {ndarray} optional array (e.g. a view into a larger preallocated, memory-mapped or shared memory
+            array) the data are written to instead of allocating a new one. Its shape must match the returned
+            TimeSeries. The returned TimeSeries is backed by out. Not supported for lazy reads
         :return: TimeSeries object
         """
-        return self.read_fcn()
+        if lazy:
+            if out is not None:
+                raise ValueError('out cannot be used with lazy reads')
+            if self.session_dataroot:
+                raise ValueError('Lazy reads are only supported for events; '
+                                 'use iter_session to stream a session')
+            return self.read_events_data_lazy(chunks)
+        return self.read_fcn(out=out)
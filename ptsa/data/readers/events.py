@@ -34,6 +34,9 @@ class CMLEventReader(BaseEventReader):
     eeg_fname_search_pattern = traits.api.Str
     eeg_fname_replace_pattern = traits.api.Str
 
+    cache_key_attributes = BaseEventReader.cache_key_attributes + ('eeg_fname_search_pattern',
+                                                                   'eeg_fname_replace_pattern')
+
     def __init__(self, filename,eeg_fname_search_pattern = '',eeg_fname_replace_pattern='',**kwargs):
         BaseEventReader.__init__(self, filename,**kwargs)
         self.eeg_fname_replace_pattern = eeg_fname_replace_pattern
@@ -58,9 +61,8 @@ class CMLEventReader(BaseEventReader):
             eegfile
 
         """
-        for ev in events:
-            ev.eegfile = ev.eegfile.replace(self.eeg_fname_search_pattern, self.eeg_fname_replace_pattern)
-        return events
+        return self.map_eegfiles(events, lambda eegfiles: np.char.replace(eegfiles, self.eeg_fname_search_pattern,
+                                                                          self.eeg_fname_replace_pattern))
 
     def check_reader_settings_for_json_read(self):
         pass
@@ -12,6 +12,11 @@ __all__ = [
 
 class H5RawReader(BaseRawReader):
     """Class for reading raw EEG data stored in HDF5 format."""
+
+    #: Largest number of unrequested channels between two requested channels
+    #: that are still read with a single hyperslab
+    max_channel_gap = 4
+
     def __init__(self, **kwargs):
         """
         :param kwargs: allowed values are:
@@ -35,14 +40,88 @@ class H5RawReader(BaseRawReader):
                 raise IndexError('Cannot load bipolar data from monopolar channel list')
             kwargs['channels'] = channels['channel_1']
         super(H5RawReader, self).__init__(**kwargs)
+        self.channels = channels
+        self.channel_labels_to_string()
         with h5py.File(self.dataroot,'r') as eegfile:
             if 'samplerate' in eegfile:
                 self.params_dict['samplerate']= eegfile['samplerate'].value
-        self.channels = channels
-        self.channel_labels_to_string()
+            self._native_dtype = eegfile['/timeseries'].dtype
+            self._resolved_channel_labels = self.get_h5_channel_labels(eegfile, self.channel_labels)
+
+
+    def get_num_samples(self):
+        """
+        :return: {int} number of samples per channel in the HDF5 file
+        """
+        with h5py.File(self.dataroot, 'r') as eegfile:
+            return self.get_h5_num_samples(eegfile['/timeseries'])
+
+    def get_native_dtype(self):
+        """
+        :return: {dtype} dtype of the /timeseries dataset
+        """
+        return self._native_dtype
+
+    def resolve_channels(self):
+        """
+        Overloads BaseRawReader.resolve_channels(). The channels are resolved from the metadata of the file when
+        the reader is constructed
+
+        :return: {int} number of channels read by read_file
+        """
+        channel_labels = self._resolved_channel_labels
+        if len(self.channel_labels) == 0:
+            self.channels = channel_labels
+        return len(channel_labels)
+
+    @staticmethod
+    def get_h5_channel_labels(eegfile, channels):
+        """
+        Resolves the channels read from an HDF5 file: every port if channels is empty and the matching (ch0, ch1)
+        pairs if the file is a bipolar recording
+
+        :param eegfile: An open HDF5 file
+        :param channels: The channels to read from the file
+        :return: channels, the labels of all ports or a (ch0, ch1) recarray of bipolar pairs
+        """
+        if len(channels) == 0:
+            channels = np.array(['{:03d}'.format(x).encode() for x in eegfile['/ports'][:]])
+        try:
+            monopolar_possible = bool(eegfile['/monopolar_possible'][0])
+        except KeyError:
+            return channels
+
+        if 'bipolar_info' in eegfile and not monopolar_possible:
+
+            if not (np.in1d(channels, eegfile['/bipolar_info/ch0_label']).all()):
+                raise IndexError('Channel[s] %s not in recording' % (
+                    channels[~np.in1d(channels, eegfile['/bipolar_info/ch0_label'])]))
+            channel_mask = np.in1d(eegfile['/bipolar_info/ch0_label'], channels)
+            return np.rec.array(
+                list(
+                    zip(eegfile['/bipolar_info/ch0_label'][channel_mask],
+                        eegfile['/bipolar_info/ch1_label'][channel_mask]),
+                ),
+                dtype=[('ch0', int), ('ch1', int)])
+        return channels
 
+    @staticmethod
+    def is_row_major(timeseries):
+        """
+        :param timeseries: The /timeseries dataset of an HDF5 EEG file
+        :return: True if samples are stored along the first axis (orient == 'row')
+        """
+        return timeseries.attrs.get('orient') in ('row', b'row')
+
+    @staticmethod
+    def get_h5_num_samples(timeseries):
+        """
+        :param timeseries: The /timeseries dataset of an HDF5 EEG file
+        :return: {int} number of samples per channel
+        """
+        return timeseries.shape[0] if H5RawReader.is_row_major(timeseries) else timeseries.shape[1]
 
-    def read_file(self, filename, channels, start_offsets=np.array([0]), read_size=-1):
+    def read_file(self, filename, channels, start_offsets=np.array([0]), read_size=-1, out=None, positions=None):
         """
         Overloads BaseRawReader.read_file(). Does some mangling of the channels parameter if it is empty or if the
         HDF5 file is a bipolar recording
@@ -51,55 +130,62 @@ class H5RawReader(BaseRawReader):
         :param channels: The channels to read from the file
         :param start_offsets: The indices in the array to start reading at
         :param read_size: The number of samples to read at each offset.
+        :param out: Optional array to write the data to (see :meth:`allocate_eventdata`)
+        :param positions: Optional positions along the second axis of out the epochs are written to (see
+            :meth:`read_into`)
         :return: event_data: The EEG data corresponding to each offset
         :return: read_ok_mask: Boolean mask indicating whether each offset was read successfully.
         """
         with h5py.File(self.dataroot, 'r') as eegfile:
-            if len(channels) == 0:
-                channels_ = self.channel_labels = np.array(['{:03d}'.format(x).encode() for x in eegfile['/ports'][:]])
-            else:
-                channels_ = channels
-            try:
-                monopolar_possible = bool(eegfile['/monopolar_possible'][0])
-
-                if 'bipolar_info' in eegfile and not monopolar_possible:
-
-                    if not (np.in1d(channels_, eegfile['/bipolar_info/ch0_label']).all()):
-                        raise IndexError('Channel[s] %s not in recording' % (
-                            channels_[~np.in1d(channels_, eegfile['/bipolar_info/ch0_label'])]))
-                    channel_mask = np.in1d(eegfile['/bipolar_info/ch0_label'], channels_)
-                    self.channel_labels = np.rec.array(
-                        list(
-                            zip(eegfile['/bipolar_info/ch0_label'][channel_mask],
-                                eegfile['/bipolar_info/ch1_label'][channel_mask]),
-                        ),
-                        dtype=[('ch0', int), ('ch1', int)])
-
-                    is_bipolar = True
-                else:
-                    is_bipolar = False
-            except KeyError:
-                is_bipolar = False
+            channel_labels = self.get_h5_channel_labels(eegfile, channels)
+            if channel_labels is not channels:
+                self.channel_labels = channel_labels
 
-            channels_ = channels_ if not is_bipolar else self.channel_labels.ch0
+            channels_ = channel_labels if channel_labels.dtype.names is None else channel_labels.ch0
             event_data, read_ok_mask = self.read_h5file(eegfile, channels_,
-                                                        start_offsets, read_size)
+                                                        start_offsets, read_size, self.dtype, out, positions)
             if self.read_size == -1:
                 self.read_size = max(event_data.shape)
             if len(channels) == 0:
                 self.channels = self.channel_labels
             return event_data, read_ok_mask
 
+    @classmethod
+    def plan_channel_runs(cls, channels_to_read, max_gap=None):
+        """
+        Groups the (sorted) indices of the channels to read into runs that are read with one slice each. Channels
+        separated by at most max_gap unrequested channels share a run, so widely spaced channels are not read
+        together with every channel in between.
+
+        :param channels_to_read: {ndarray} increasing channel indices
+        :param max_gap: {int} defaults to :attr:`max_channel_gap`
+        :return: list of (start, stop) channel index ranges
+        """
+        if max_gap is None:
+            max_gap = cls.max_channel_gap
+        if not len(channels_to_read):
+            return []
+        breaks = np.where(np.diff(channels_to_read) > max_gap + 1)[0] + 1
+        return [(int(run[0]), int(run[-1]) + 1) for run in np.split(channels_to_read, breaks)]
+
     @staticmethod
-    def read_h5file(eegfile, channels, start_offsets=np.array([0]), read_size=-1):
+    def read_h5file(eegfile, channels, start_offsets=np.array([0]), read_size=-1, dtype=None, out=None,
+                    positions=None):
         """
         Reads raw data from HDF5 files into a numpy array of shape (len(channels),len(start_offsets), read_size).
         For each channel and offset, indicates whether the data at that offset on that channel could be read successfully.
 
+        Epochs are coalesced into a small number of large hyperslab reads (see :meth:`plan_read_blocks`) spanning
+        runs of nearby channels (see :meth:`plan_channel_runs`) and cut out in memory.
+
         :param eegfile: An open HDF5 file
         :param channels: The channels to read from the file
         :param start_offsets: The indices in the array to start reading at
         :param read_size: The number of samples to read at each offset.
+        :param dtype: dtype of event_data when reading epochs (see :meth:`resolve_dtype`). Defaults to float64
+        :param out: Optional array of shape (len(channels), len(start_offsets), read_size) to write the data to
+        :param positions: Optional positions along the second axis of out the epochs are written to (see
+            :meth:`read_into`)
         :return: event_data: The EEG data corresponding to each offset
         :return: read_ok_mask: Boolean mask indicating whether each offset was read successfully.
 
@@ -107,42 +193,63 @@ class H5RawReader(BaseRawReader):
         timeseries = eegfile['/timeseries']
         ports = eegfile['/ports']
         channels_to_read = np.where(np.in1d(ports, channels.astype(int)))[0]
+        row_major = H5RawReader.is_row_major(timeseries)
         if read_size < 0:
-            if 'orient' in timeseries.attrs and timeseries.attrs['orient'] == 'row':
+            if row_major:
                 eventdata = timeseries[:, channels_to_read].T
             else:
                 eventdata = timeseries[channels_to_read, :]
-            return eventdata[:, None, :], np.ones((len(channels), 1)).astype(bool)
+            read_ok_mask = np.ones((len(channels), 1)).astype(bool)
+            if out is not None:
+                out = H5RawReader.allocate_eventdata((eventdata.shape[0], 1, eventdata.shape[1]), None, out,
+                                                     positions)
+                out[:, 0 if positions is None else positions[0], :] = eventdata
+                return out, read_ok_mask
+            return eventdata[:, None, :], read_ok_mask
 
         else:
-            eventdata = np.empty((len(channels), len(start_offsets), read_size),
-                                 dtype=np.float)
-            eventdata.fill(np.nan)
-            read_ok_mask = np.ones((len(channels), len(start_offsets))).astype(bool)
-            for i, start_offset in enumerate(start_offsets):
-                if start_offset<0:
-                    print('Cannot read negative offset %s '%start_offset)
-                    read_ok_mask[:,i] = False
+            eventdata = H5RawReader.allocate_eventdata((len(channels), len(start_offsets), read_size),
+                                                       H5RawReader.resolve_dtype(dtype, timeseries.dtype), out,
+                                                       positions)
+            num_samples = H5RawReader.get_h5_num_samples(timeseries)
+
+            # Read contiguous hyperslabs spanning runs of nearby requested
+            # channels and pick the channels out in memory; h5py is much
+            # faster with plain slices than with fancy indexing.
+            runs = []
+            row = 0
+            for run_start, run_stop in H5RawReader.plan_channel_runs(channels_to_read):
+                channel_index = channels_to_read[(channels_to_read >= run_start) & (channels_to_read < run_stop)]
+                rows = slice(row, row + len(channel_index))
+                runs.append((slice(run_start, run_stop), channel_index - run_start, rows))
+                row = rows.stop
+            blocks = H5RawReader.plan_read_blocks(start_offsets, read_size, num_samples,
+                                                  sum(s.stop - s.start for s, _, _ in runs)) if runs else []
+
+            for block_start, block_stop in blocks:
+                for channel_slice, channel_index, rows in runs:
+                    if row_major:
+                        block = timeseries[block_start:block_stop, channel_slice].T
+                    else:
+                        block = timeseries[channel_slice, block_start:block_stop]
+                    H5RawReader.gather_epochs(block[channel_index], start_offsets, read_size, eventdata[rows],
+                                              source_offset=block_start, num_samples=num_samples,
+                                              positions=positions)
+
+            in_bounds = H5RawReader.epochs_in_bounds(start_offsets, read_size, num_samples)
+            for start_offset in np.asarray(start_offsets)[~in_bounds]:
+                if start_offset < 0:
+                    print('Cannot read negative offset %s ' % start_offset)
                 else:
-                    try:
-                        if 'orient' in timeseries.attrs.keys() and timeseries.attrs['orient'] == b'row':
-                            data = timeseries[start_offset:start_offset + read_size, channels_to_read].T
-                        else:
-                            data = timeseries[channels_to_read, start_offset:start_offset + read_size]
-                        if data.shape[-1] == read_size:
-                            eventdata[:, i, :] = data
-                        else:
-                            print(
-                                'Cannot read full chunk of data for offset ' + str(start_offset) +
-                                'End of read interval  is outside the bounds of file ' + eegfile.filename)
-                            read_ok_mask[:, i] = False
-                    except IndexError:
-                        print(
-                            'Cannot read full chunk of data for offset ' + str(start_offset) +
-                            'End of read interval  is outside the bounds of file ' + eegfile.filename)
-                        read_ok_mask[:, i] = False
-
-            if np.isnan(eventdata).all():
+                    print(
+                        'Cannot read full chunk of data for offset ' + str(start_offset) +
+                        'End of read interval  is outside the bounds of file ' + eegfile.filename)
+            read_ok_mask = np.tile(in_bounds, (len(channels), 1))
+            if out is not None:
+                H5RawReader.fill_unread(eventdata, read_ok_mask, positions)
+
+            epochs = range(len(start_offsets)) if positions is None else positions
+            if not in_bounds.any() or all(np.isnan(eventdata[:, i]).all() for i in epochs):
                 raise RuntimeError("All eventdata is nan!")
 
             return eventdata, read_ok_mask
@@ -1,8 +1,13 @@
 import copy
+import hashlib
 import json
 import os
+import sys
+import tempfile
 import warnings
 
+from six.moves import cPickle as pickle
+
 import pandas as pd
 
 from ptsa.data.common import pathlib
@@ -13,11 +18,151 @@ __all__ = [
 ]
 
 
+class _IndexTable(object):
+    """
+    Flattened index: one row per session with the protocol, subject, experiment and session keys and the leaf
+    fields of the session as columns. Queries are answered from per-column hash indexes mapping the string form of a
+    value to the set of rows holding it. A hash index is built the first time its column is queried.
+    """
+
+    MISSING = object()
+
+    def __init__(self, level_names, level_keys, leaves):
+        """
+        :param level_names: names of the tree levels (e.g. protocol, subject, experiment, session)
+        :param level_keys: list of tuples with the keys of each session along the levels of the tree
+        :param leaves: list of dictionaries with the leaf fields of each session
+        """
+        self.level_names = tuple(level_names)
+        self.num_rows = len(leaves)
+        self.levels = dict((name, [keys[i] for keys in level_keys]) for i, name in enumerate(self.level_names))
+        self.leaves = leaves
+        self._leaf_columns = {}
+        self._level_indexes = {}
+        self._leaf_indexes = {}
+
+    @classmethod
+    def from_index(cls, index, field_keys, field_names):
+        """
+        Flattens a tree of dictionaries. Only trees in which every node above the sessions holds nothing but the
+        container of the next level and sessions hold no nested dictionaries are supported.
+
+        :param index: tree of dictionaries as read from the index file
+        :param field_keys: container keys of the levels of the tree (JsonIndexReader.FIELD_KEYS)
+        :param field_names: names of the levels of the tree (JsonIndexReader.FIELD_NAMES)
+        :return: the table or None if the tree is irregular
+        """
+        container_keys = [key for key, _ in field_keys]
+        level_keys = []
+        leaves = []
+
+        def walk(node, depth, keys):
+            if not isinstance(node, dict):
+                return False
+            if depth == len(container_keys):
+                if any(isinstance(value, dict) for value in node.values()):
+                    return False
+                # empty sessions never appear in query results
+                if len(node):
+                    level_keys.append(keys)
+                    leaves.append(node)
+                return True
+            if not len(node):
+                return True
+            if list(node.keys()) != [container_keys[depth]] or not isinstance(node[container_keys[depth]], dict):
+                return False
+            return all(walk(child, depth + 1, keys + (key,))
+                       for key, child in node[container_keys[depth]].items())
+
+        if not walk(index, 0, ()):
+            return None
+        return cls(field_names, level_keys, leaves)
+
+    def leaf_column(self, field):
+        """
+        :param field: name of a leaf field
+        :return: list with the value of the field in each row or MISSING
+        """
+        column = self._leaf_columns.get(field)
+        if column is None:
+            column = [leaf.get(field, self.MISSING) for leaf in self.leaves]
+            self._leaf_columns[field] = column
+        return column
+
+    def level_index(self, name):
+        """
+        :param name: name of a tree level
+        :return: dictionary mapping each key of the level to the set of rows below it
+        """
+        hash_index = self._level_indexes.get(name)
+        if hash_index is None:
+            hash_index = {}
+            for row, key in enumerate(self.levels[name]):
+                hash_index.setdefault(key, set()).add(row)
+            self._level_indexes[name] = hash_index
+        return hash_index
+
+    def leaf_index(self, field):
+        """
+        :param field: name of a leaf field
+        :return: dictionary mapping the string form of each value of the field to the set of rows holding it
+        """
+        hash_index = self._leaf_indexes.get(field)
+        if hash_index is None:
+            hash_index = {}
+            for row, value in enumerate(self.leaf_column(field)):
+                if value is not self.MISSING:
+                    hash_index.setdefault(str(value), set()).add(row)
+            self._leaf_indexes[field] = hash_index
+        return hash_index
+
+    def select(self, **kwargs):
+        """
+        Finds the rows matching all constraints. Constraints on tree levels are matched against the keys of the
+        level. All other constraints are matched against the string form of a leaf field and exclude sessions
+        without the field.
+
+        :param kwargs: constraints (e.g. subject='R1001P', session=0, localization=1)
+        :return: set of rows
+        """
+        rows = None
+        for field, value in kwargs.items():
+            leaf_index = self.leaf_index(field)
+            if field in self.level_names:
+                matches = self.level_index(field).get('{}'.format(value), set())
+                if leaf_index:
+                    # sessions that also hold the level name as a leaf field have to match it as well
+                    mismatches = set().union(*leaf_index.values()) - leaf_index.get(str(value), set())
+                    matches = matches - mismatches
+            else:
+                matches = leaf_index.get(str(value), set())
+            rows = matches if rows is None else rows & matches
+            if not rows:
+                break
+        return set(range(self.num_rows)) if rows is None else rows
+
+    def aggregate_values(self, field, container_names, **kwargs):
+        """
+        :param field: container key of a tree level (e.g. 'subjects') or name of a leaf field
+        :param container_names: mapping of the container keys of the tree levels to the level names
+        :param kwargs: constraints
+        :return: set of the keys of the level or of the values of the leaf field in the matching rows
+        """
+        rows = self.select(**kwargs)
+        if field in container_names:
+            keys = self.levels[container_names[field]]
+            return set(keys[row] for row in rows)
+        column = self.leaf_column(field)
+        return set(column[row] for row in rows if column[row] is not self.MISSING)
+
+
 class JsonIndexReader(object):
     """
     Reads from one of the top level indexing files (r1.json, ltp.json)
     Allows for aggregation of values across any field with any constraint through the use of aggregateValues() or the
     specific methods subject(), experiment(), session() or montage().
+    The index is flattened into a table of sessions on the first query; later changes to `index` are not seen by
+    queries.
     """
 
     FIELD_KEYS = (('protocols', '{protocol}'),
@@ -27,21 +172,85 @@ class JsonIndexReader(object):
 
     FIELD_NAMES = ('protocol','subject','experiment','session')
 
-    def __init__(self, index_file):
+    # Version of the snapshot format. Changing it invalidates existing snapshots
+    SNAPSHOT_VERSION = 1
+
+    def __init__(self, index_file, cache_dir=None):
         """
         Constructor.
         Reads from the passed in index file, and appends the root of the index files to anything that
         appears to be a path
-        :param protocols: 'r1', 'ltp'
+        :param index_file: path to the index file (r1.json, ltp.json)
+        :param cache_dir: directory for snapshots of the prepared index. The first reader of an index file saves the
+            index and its flattened table there; later readers load the snapshot instead of parsing the file. A
+            snapshot is keyed by the path (as given, since it prefixes the paths in the index), mtime and size of the
+            index file. Snapshots are pickles, so the directory
+            must not be writable by others
         """
         warnings.warn("Lab-specific readers may be moved to the cmlreaders "
                       "package (https://github.com/pennmem/cmlreaders)",
                       FutureWarning)
         self.protocols_root = os.path.dirname(index_file)
         self.index_file = index_file
+        self.cache_dir = cache_dir
+        self._table = None
+
+        snapshot_file = self._get_snapshot_file() if cache_dir else None
+        snapshot = self._load_snapshot(snapshot_file) if snapshot_file else None
+        if snapshot is not None:
+            self.index, self._table = snapshot
+            return
+
         with open(index_file, 'r') as infile:
             self.index = json.loads(infile.read())
         self._prepend_db_root(self.protocols_root, self.index)
+        if snapshot_file:
+            self._get_table()
+            self._save_snapshot(snapshot_file, (self.index, self._table))
+
+    def _get_snapshot_file(self):
+        """
+        :return: path of the snapshot of the current version of the index file
+        """
+        stat = os.stat(self.index_file)
+        # paths in the index are prefixed with protocols_root as given, so readers that spell the path of the index
+        # file differently do not share snapshots
+        key = [type(self).__name__, self.SNAPSHOT_VERSION, sys.version_info[0], os.sep,
+               os.path.abspath(self.index_file), self.protocols_root, stat.st_mtime, stat.st_size]
+        digest = hashlib.sha1(repr(key).encode('utf-8')).hexdigest()
+        return os.path.join(os.path.expanduser(self.cache_dir),
+                            '%s.%s.pickle' % (os.path.basename(self.index_file), digest))
+
+    @staticmethod
+    def _load_snapshot(snapshot_file):
+        """
+        :return: tuple of the index and its table or None if there is no (readable) snapshot
+        """
+        try:
+            with open(snapshot_file, 'rb') as f:
+                return pickle.load(f)
+        except (IOError, OSError, EOFError, pickle.UnpicklingError):
+            return None
+
+    @staticmethod
+    def _save_snapshot(snapshot_file, snapshot):
+        """
+        Pickles the snapshot under a temporary name and renames it, so concurrent readers never load a partial
+        snapshot. Failures only emit a warning
+        """
+        cache_dir = os.path.dirname(snapshot_file)
+        tmp_file = None
+        try:
+            if not os.path.isdir(cache_dir):
+                os.makedirs(cache_dir)
+            with tempfile.NamedTemporaryFile(dir=cache_dir, suffix='.pickle', delete=False) as f:
+                tmp_file = f.name
+                pickle.dump(snapshot, f, pickle.HIGHEST_PROTOCOL)
+            os.rename(tmp_file, snapshot_file)
+        except (IOError, OSError, pickle.PicklingError) as e:
+            warnings.warn('Could not save index snapshot %s: %s' % (snapshot_file, e), RuntimeWarning)
+            if tmp_file is not None and os.path.exists(tmp_file):
+                os.remove(tmp_file)
 
     def as_dataframe(self, multiindex=True):
         """Flatten the index and format as a pandas :class:`DataFrame`. The
@@ -68,7 +277,7 @@ class JsonIndexReader(object):
             for experiment in experiments:
                 sessions = experiments[experiment]["sessions"]
                 for session in sessions:
-                    entry = sessions[session]
+                    entry = dict(sessions[session])
                     entry["subject"] = subject
                     entry["experiment"] = experiment
                     entry["session"] = int(session)
@@ -90,7 +299,7 @@ class JsonIndexReader(object):
         for k, v in list(index.items()):
             if isinstance(v, dict):
                 cls._prepend_db_root(protocols_root, v)
-            elif isinstance(v, string_types):
+            elif isinstance(v, string_types) and protocols_basename in v:
                 v_path = pathlib.Path(str(v))
                 root = str(v_path.parts[0])
                 if root == protocols_basename:
@@ -205,6 +414,21 @@ class JsonIndexReader(object):
                     out.add(index_i[field])
         return out
 
+    def _get_table(self):
+        """
+        :return: the flattened index or None if the index cannot be flattened
+        """
+        if self._table is None:
+            self._table = _IndexTable.from_index(self.index, self.FIELD_KEYS, self.FIELD_NAMES) or False
+        return self._table or None
+
+    def _query(self, field, **kwargs):
+        table = self._get_table()
+        if table is None:
+            return self._aggregate_values(self.index, field, **kwargs)
+        container_names = dict((key, name) for (key, _), name in zip(self.FIELD_KEYS, self.FIELD_NAMES))
+        return table.aggregate_values(field, container_names, **kwargs)
+
     def get_value(self, field, **kwargs):
         """
         Gets a single field from the dictionary tree. Raises a KeyError if the field is not found, or there
@@ -213,7 +437,7 @@ class JsonIndexReader(object):
         :param kwargs: constraints (e.g. subject='R1001P', session=0, experiment='FR3')
         :return: the value requested
         """
-        values = self._aggregate_values(self.index, field, **kwargs)
+        values = self._query(field, **kwargs)
         if len(values) != 1:
             raise ValueError("Expected 1 value for {}, found {}".format(field, len(values)))
         return list(values)[0]
@@ -226,7 +450,7 @@ class JsonIndexReader(object):
         :param kwargs: Constraints -- subject='R1001P', experiment='FR1', etc.
         :return: a set of all of the fields that were found
         """
-        return self._aggregate_values(self.index, field, **kwargs)
+        return self._query(field, **kwargs)
 
     def subjects(self, **kwargs):
         """
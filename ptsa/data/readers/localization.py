@@ -1,5 +1,8 @@
+from collections import OrderedDict
 from .base import BaseReader
-import json, itertools
+import json
+import os.path
+import numpy as np
 import pandas as pd
 import warnings
 
@@ -12,32 +15,162 @@ class LocReader(BaseReader):
     (either the name of the contact, or a tuple with the names of each half of the pair).
     """
 
-    def __init__(self, filename):
+    cache_key_attributes = ('columns',)
+    cache_extension = '.npz'
+
+    def __init__(self, filename, columns=None, cache_dir=''):
+        """
+        :param filename: {str} path to the localization file
+        :param columns: {list} flattened columns to return (e.g. ['type', 'atlases.dk']). All columns by default
+        :param cache_dir: {str} directory where the DataFrame is cached as a .npz file, keyed by the path, mtime and
+            size of the localization file and the columns. Later reads of the unmodified file load the cached
+            DataFrame. Caching is disabled by default
+        """
         warnings.warn("Lab-specific readers may be moved to the cmlreaders "
                       "package (https://github.com/pennmem/cmlreaders)",
                       FutureWarning)
-        with open(filename) as f:
-            self._dict = json.load(f)
+        self.filename = filename
+        self.columns = list(columns) if columns is not None else None
+        self.cache_dir = cache_dir or ''
+        self._json_dict = None
+        # a cache file is only written for a file that was read successfully, so the file only has to be parsed
+        # (and thereby validated) here if there is none
+        if not (self.cache_dir and os.path.exists(self.get_cache_filename())):
+            self._json_dict = self._load_json()
+
+    def _load_json(self):
+        with open(self.filename) as f:
+            return json.load(f)
+
+    @property
+    def _dict(self):
+        if self._json_dict is None:
+            self._json_dict = self._load_json()
+        return self._json_dict
 
     def read(self):
-        leads = self._dict["leads"].values()
-        for lead in leads:
-            contacts = lead["contacts"]
-            if isinstance(contacts,dict):
-                contacts = contacts.values()
-            for c in contacts:
-                c.update({"type":lead["type"],})
-            pairs = lead["pairs"]
-            if isinstance(pairs,dict):
-                pairs = pairs.values()
-            for p in pairs:
-                p['names'] = tuple(p['names'])
-                p.update({"type":lead["type"]})
-        flat_contact_data = list(itertools.chain(*[x["contacts"] for x in leads]))
-        flat_pairs_data = list(itertools.chain(*[x["pairs"] for x in leads]))
-        all_data = []
-        all_data.append(pd.io.json.json_normalize(flat_contact_data).set_index('name'))
-        all_data.append(pd.io.json.json_normalize(flat_pairs_data).set_index('names'))
+        return self.read_with_cache(self.read_localization)
+
+    def read_localization(self):
+        """
+        Reads the localization file without going through the cache
+        :return: {pd.DataFrame}
+        """
+        contacts = []
+        pairs = []
+        for lead in self._dict["leads"].values():
+            for entries, rows, is_pair in ((lead["contacts"], contacts, False), (lead["pairs"], pairs, True)):
+                if isinstance(entries, dict):
+                    entries = entries.values()
+                for entry in entries:
+                    entry = dict(entry, type=lead["type"])
+                    if is_pair:
+                        entry['names'] = tuple(entry['names'])
+                    rows.append(self.flatten_entry(entry))
+
+        all_data = [self.make_frame(contacts, 'name'), self.make_frame(pairs, 'names')]
         self._data = all_data
         combined_df = pd.concat(all_data,keys=['contacts','pairs'],)
+        if self.columns is not None:
+            combined_df = combined_df[self.columns]
         return combined_df
+
+    @classmethod
+    def flatten_entry(cls, entry, prefix='', row=None):
+        """
+        Flattens a contact or pair as :func:`pandas.io.json.json_normalize` does: top-level values keep their
+        position and nested dictionaries follow with the keys along their paths joined by periods
+
+        :param entry: {dict}
+        :return: {OrderedDict} mapping flattened keys to values
+        """
+        if row is None:
+            row = OrderedDict()
+        nested = []
+        for key, value in entry.items():
+            key = prefix + str(key)
+            if isinstance(value, dict):
+                if prefix:
+                    cls.flatten_entry(value, key + '.', row)
+                else:
+                    nested.append((key, value))
+            else:
+                row[key] = value
+        for key, value in nested:
+            cls.flatten_entry(value, key + '.', row)
+        return row
+
+    def make_frame(self, rows, index_name):
+        """
+        Builds the DataFrame of flattened entries with one conversion per column
+
+        :param rows: {list} of flattened entries
+        :param index_name: {str} column to use as the index
+        :return: {pd.DataFrame}
+        """
+        columns = OrderedDict()
+        for row in rows:
+            for key in row:
+                columns[key] = None
+        if self.columns is not None:
+            selected = set(self.columns)
+            columns = [key for key in columns if key == index_name or key in selected]
+
+        columns = list(columns)
+        df = pd.DataFrame.from_records([[row.get(key, np.nan) for key in columns] for row in rows],
+                                       columns=columns)
+        return df.set_index(index_name)
+
+    @staticmethod
+    def is_cacheable(df):
+        return True
+
+    @staticmethod
+    def load_cache(f):
+        """
+        Loads a DataFrame saved by :meth:`save_cache`. Nothing is unpickled: numeric columns are stored as arrays
+        and every value of the other columns and of the index as a JSON string
+        """
+        with np.load(f, allow_pickle=False) as cache:
+            levels = [pd.Index([LocReader._decode_label(json.loads(value)) for value in cache['level_%d' % i]],
+                               dtype=object, tupleize_cols=False)
+                      for i in range(len(cache['codes']))]
+            index = pd.MultiIndex(levels=levels, codes=list(cache['codes']),
+                                  names=json.loads(str(cache['index_names'])))
+            columns = OrderedDict()
+            for i, (name, is_object) in enumerate(zip(cache['columns'], cache['object_columns'])):
+                values = cache['column_%d' % i]
+                if is_object:
+                    # the extra element keeps numpy from turning equal length lists into a 2-d array
+                    values = np.array([json.loads(value) for value in values] + [None], dtype=object)[:-1]
+                columns[str(name)] = values
+        return pd.DataFrame(columns, index=index, columns=list(columns))
+
+    @staticmethod
+    def save_cache(f, df):
+        """
+        Saves a DataFrame with a two level index as an .npz file without pickling (see :meth:`load_cache`)
+
+        :raises: ValueError if a value cannot be encoded
+        """
+        def encode(values):
+            try:
+                return np.array([json.dumps(value) for value in values], dtype=str)
+            except TypeError as e:
+                raise ValueError(str(e))
+
+        arrays = {'columns': np.array(list(df.columns), dtype=str),
+                  'object_columns': np.array([dtype == object for dtype in df.dtypes], dtype=bool),
+                  'index_names': np.array(json.dumps(list(df.index.names))),
+                  'codes': np.array([np.asarray(codes) for codes in df.index.codes], dtype=np.int64)}
+        for i, level in enumerate(df.index.levels):
+            arrays['level_%d' % i] = encode(level)
+        for i, column in enumerate(df.columns):
+            values = df.iloc[:, i].values
+            arrays['column_%d' % i] = encode(values) if values.dtype == object else values
+        np.savez(f, **arrays)
+
+    @staticmethod
+    def _decode_label(value):
+        # the names of pairs are tuples, which JSON stores as lists
+        return tuple(value) if isinstance(value, list) else value
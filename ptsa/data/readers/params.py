@@ -1,6 +1,8 @@
 import collections
 import json
+import os
 from os.path import *
+import threading
 import warnings
 
 from ptsa.data.readers import BaseReader
@@ -14,10 +16,21 @@ __all__ = [
 class ParamsReader(BaseReader, traits.api.HasTraits):
     """
     Reader for parameter file (e.g. params.txt)
+
+    Parsed params files are kept in a process-wide LRU cache keyed by path, mtime and size, so a params file shared
+    by many dataroots (e.g. a sources.json listing every recording of a session) is parsed only once per process
+    as long as it is not modified. At most :attr:`max_cached_files` files are cached; use :meth:`clear_cache` to
+    empty the cache.
     """
     filename= traits.api.Str
     dataroot = traits.api.Str
 
+    #: Maximum number of parsed params files kept in the process-wide cache
+    max_cached_files = 256
+
+    _cache = collections.OrderedDict()
+    _cache_lock = threading.Lock()
+
     def __init__(self, filename='',dataroot=''):
         """
         Constructor
@@ -80,15 +93,61 @@ class ParamsReader(BaseReader, traits.api.HasTraits):
                       'params.txt, or sources.json, or be in the directory above and '+
                       'named sources.json')
 
+    @classmethod
+    def clear_cache(cls):
+        """Removes all parsed params files from the process-wide cache."""
+        with cls._cache_lock:
+            cls._cache.clear()
+
+    @classmethod
+    def load(cls, filename, parse):
+        """
+        Returns the parsed content of a params file, calling parse only if the file is not in the cache or has been
+        modified since it was cached. The returned object is shared and must not be modified.
+
+        :param filename: {str} path to params file
+        :param parse: {callable} function that parses the file given its path
+        :return: parsed file content
+        """
+        filename = abspath(filename)
+        stat = os.stat(filename)
+        key = (filename, stat.st_mtime, stat.st_size)
+
+        with cls._cache_lock:
+            try:
+                content = cls._cache.pop(key)
+                cls._cache[key] = content
+                return content
+            except KeyError:
+                pass
+
+        content = parse(filename)
+
+        with cls._cache_lock:
+            cls._cache[key] = content
+            while len(cls._cache) > cls.max_cached_files:
+                cls._cache.popitem(last=False)
+
+        return content
+
     def read(self):
         if splitext(self.filename)[-1] == '.txt':
             return self.read_txt()
         else:
             return self.read_json()
 
+    @staticmethod
+    def parse_json(filename):
+        """
+        Parses a sources.json file
+        :param filename: {str} path to sources.json
+        :return: {dict} content of the file (one entry per dataroot)
+        """
+        with open(filename) as f:
+            return json.load(f)
+
     def read_json(self):
-        with open(self.filename) as f:
-            json_params = json.load(f)[basename(self.dataroot)]
+        json_params = self.load(self.filename, self.parse_json)[basename(self.dataroot)]
         params = {}
         params['samplerate'] = json_params['sample_rate']
         params['gain'] = 1
@@ -96,13 +155,13 @@ class ParamsReader(BaseReader, traits.api.HasTraits):
         params['dataformat'] = json_params['data_format']
         return params
 
-    def read_txt(self):
+    def parse_txt(self, param_file):
         """
         Parses param file
-        :return: {dict} dictionary with param file content
+        :param param_file: {str} path to param file
+        :return: {dict} dictionary with the recognized params in the file
         """
         params = {}
-        param_file = self.filename
 
         # we have a file, so open and process it
         with open(param_file, 'r') as f:
@@ -121,6 +180,15 @@ class ParamsReader(BaseReader, traits.api.HasTraits):
                 except KeyError:
                     pass
 
+        return params
+
+    def read_txt(self):
+        """
+        Reads param file
+        :return: {dict} dictionary with param file content
+        """
+        params = dict(self.load(self.filename, self.parse_txt))
+
         if 'gain' not in params.keys():
             params['gain'] = 1.0
             warnings.warn('Did not find "gain" in the params.txt file. Assuming gain=1.0', RuntimeWarning)
@@ -1,3 +1,4 @@
+from collections import OrderedDict
 import json
 import os
 
@@ -22,8 +23,11 @@ class TalReader(BaseReader,traits.api.HasTraits):
     struct_name = traits.api.Str
     struct_type = traits.api.Enum('bi','mono')
     unpack = traits.api.Bool
+    cache_dir = traits.api.Str
 
-    def __init__(self, filename,struct_name='bpTalStruct',struct_type='bi',unpack=True):
+    cache_key_attributes = ('struct_name', 'struct_type', 'unpack')
+
+    def __init__(self, filename,struct_name='bpTalStruct',struct_type='bi',unpack=True,cache_dir=''):
         """
         Keyword arguments
         -----------------
@@ -35,6 +39,9 @@ class TalReader(BaseReader,traits.api.HasTraits):
         Default is 'bi'.
         :param unpack {bool} - If :py:val:False, returns the "atlases" column as an array of python dicts, rather
         than unpacking them into nested structured arrays. Default is :py:True.
+        :param cache_dir {str} - directory where the tal struct array is cached as a .npy file, keyed by the path,
+        mtime and size of the file and the reader settings. Later reads of the unmodified file load the cached array.
+        Caching is disabled by default.
         :return: None
 
         """
@@ -51,6 +58,7 @@ class TalReader(BaseReader,traits.api.HasTraits):
 
         self.tal_struct_array = None
         self.unpack = unpack
+        self.cache_dir = cache_dir or ''
         if not self.unpack:
             warnings.warn('Unpack option will be removed in a future release,'
                           'at which point behavior will be as with unpack=True',
@@ -92,9 +100,10 @@ class TalReader(BaseReader,traits.api.HasTraits):
         # initialize bipolar pairs
         self.bipolar_channels = np.recarray(shape=(len(self.tal_struct_array)), dtype=[('ch0','|S3'),('ch1','|S3')])
 
-        channel_record_array = self.tal_struct_array['channel']
-        for i, channel_array in enumerate(channel_record_array):
-            self.bipolar_channels[i] = tuple(map(lambda x: str(x).zfill(3), channel_array))
+        channels = np.asarray(self.tal_struct_array['channel']).reshape(-1, 2)
+        labels = np.char.zfill(channels.astype(str), 3).astype('|S3')
+        self.bipolar_channels['ch0'] = labels[:, 0]
+        self.bipolar_channels['ch1'] = labels[:, 1]
 
     @classmethod
     def from_records(cls,contact_dict):
@@ -102,29 +111,108 @@ class TalReader(BaseReader,traits.api.HasTraits):
         Helper method for :meth:from_dict.
         Takes a list of records (dictionaries with semi-consistent fields)
         and returns a structured array whose fields are the keys of each record.
-        Nested records are handled by recursion.
+        Nested records become nested structured arrays.
 
         Missing entries should be represented by either None, NaN, or an empty dictionary.
 
+        The records are flattened in a single pass and the types of all leaf fields are inferred by one call to
+        :meth:`pandas.DataFrame.from_records`. At every level fields holding values come before fields holding
+        dictionaries, each in the order :meth:`pandas.DataFrame.from_records` gives the keys of the records at that
+        level.
+
         :param contact_dict: {List[Union(Dict,None,NaN)]}
         :return: {np.array} A structured array with the same indexing structure as :arg:contact_dict
         """
-        contact_df = pd.DataFrame.from_records([x if not pd.isnull(x) else {} for x in contact_dict])
-        dict_cols = [col for col in contact_df.columns if any(isinstance(val,dict) for val in contact_df[col])]
-        flat_cols = [col for col in contact_df.columns if not col in dict_cols]
-        flat_df = contact_df[flat_cols]
-        dtype = cls.mkdtype(flat_df)
-
-        nested_arrs = [cls.from_records(contact_df[col]) for col in dict_cols]
-        nested_dtypes = [np.dtype([(str(col),x.dtype)]) for col,x in zip(dict_cols,nested_arrs)]
-        new_dtype = cls.merge_dtypes(dtype,*nested_dtypes)
-        new_arr = np.empty(len(contact_df),dtype=new_dtype)
-        for col in flat_cols:
-            new_arr[col] = flat_df[col].values
-        for (i,col) in enumerate(dict_cols):
-            new_arr[col] = nested_arrs[i]
+        # maps field names to None for value fields and to the tree of the nested records for dictionary fields
+        tree = OrderedDict()
+        # the distinct key lists of the records at each level, which determine the order of the fields
+        key_lists = {}
+        rows = []
+        for record in contact_dict:
+            row = {}
+            if not cls._isnull(record):
+                cls._flatten_record(record, (), tree, row, key_lists)
+            rows.append(row)
+        tree = cls._order_tree(tree, (), key_lists)
+
+        for path in cls._dict_paths(tree):
+            if any(not cls._isnull(row[path]) for row in rows if path in row):
+                raise ValueError('Field %s holds both dictionaries and values' % '.'.join(path))
+
+        leaf_paths = list(cls._leaf_paths(tree))
+
+        flat_df = pd.DataFrame.from_records([[row.get(path, np.nan) for path in leaf_paths] for row in rows],
+                                            columns=range(len(leaf_paths)))
+        leaf_dtypes = dict(zip(leaf_paths, cls.mkdtype(flat_df).fields.values()))
+        new_arr = np.empty(len(rows), dtype=cls._tree_dtype(tree, (), leaf_dtypes))
+        for i, path in enumerate(leaf_paths):
+            field = new_arr
+            for key in path:
+                field = field[str(key)]
+            field[...] = flat_df[i].values
         return np.rec.array(new_arr)
 
+    @staticmethod
+    def _isnull(value):
+        return value is None or (isinstance(value, float) and np.isnan(value))
+
+    @classmethod
+    def _flatten_record(cls, record, path, tree, row, key_lists):
+        """
+        Adds the leaf values of a (nested) record to row, keyed by their path, the fields of the record to tree and
+        its keys to key_lists
+        """
+        key_lists.setdefault(path, OrderedDict())[(type(record), tuple(record.keys()))] = None
+        for key, value in record.items():
+            key_path = path + (key,)
+            if isinstance(value, dict):
+                subtree = tree.get(key)
+                if subtree is None:
+                    subtree = tree[key] = OrderedDict()
+                cls._flatten_record(value, key_path, subtree, row, key_lists)
+            else:
+                tree.setdefault(key, None)
+                row[key_path] = value
+
+    @classmethod
+    def _order_tree(cls, tree, path, key_lists):
+        """
+        Orders the fields at every level of tree as :meth:`pandas.DataFrame.from_records` orders the columns of
+        the records at that level (e.g. sorted or in order of appearance, depending on the version of pandas and
+        the type of the records)
+        """
+        records = [record_type((key, None) for key in keys) for record_type, keys in key_lists.get(path, ())]
+        ordered = OrderedDict()
+        for key in pd.DataFrame.from_records(records).columns:
+            subtree = tree[key]
+            ordered[key] = None if subtree is None else cls._order_tree(subtree, path + (key,), key_lists)
+        return ordered
+
+    @classmethod
+    def _dict_paths(cls, tree, path=()):
+        for key, subtree in tree.items():
+            if subtree is not None:
+                yield path + (key,)
+                for dict_path in cls._dict_paths(subtree, path + (key,)):
+                    yield dict_path
+
+    @classmethod
+    def _leaf_paths(cls, tree, path=()):
+        for key, subtree in tree.items():
+            if subtree is None:
+                yield path + (key,)
+        for key, subtree in tree.items():
+            if subtree is not None:
+                for leaf_path in cls._leaf_paths(subtree, path + (key,)):
+                    yield leaf_path
+
+    @classmethod
+    def _tree_dtype(cls, tree, path, leaf_dtypes):
+        fields = [(str(key), leaf_dtypes[path + (key,)][0]) for key, subtree in tree.items() if subtree is None]
+        fields += [(str(key), cls._tree_dtype(subtree, path + (key,), leaf_dtypes))
+                   for key, subtree in tree.items() if subtree is not None]
+        return np.dtype(fields)
+
     def from_dict(self,json_dict,unpack=True):
         """
         Reads a JSON localization file into a record array.
@@ -177,6 +265,14 @@ class TalReader(BaseReader,traits.api.HasTraits):
         """
         :return: np.recarray representing tal struct array
         """
+        self.tal_struct_array = self.read_with_cache(self.read_tal_file)
+        return self.tal_struct_array
+
+    def read_tal_file(self):
+        """
+        Reads the tal struct array without going through the cache
+        :return: np.recarray representing tal struct array
+        """
         if not self._json:
             from ptsa.data.MatlabIO import read_single_matlab_matrix_as_numpy_structured_array
 
@@ -1,3 +1,5 @@
+import ast
+import itertools
 import json
 import time
 import warnings
@@ -24,6 +26,267 @@ class ConcatenationError(Exception):
     """
 
 
+def _encode_npy(array):
+    """Serialize an array with :func:`np.save` and base64-encode the result to
+    eliminate NULL bytes which HDF5 can't handle.
+
+    """
+    buffer = BytesIO()
+    np.save(buffer, array)
+    return b64encode(buffer.getvalue())
+
+
+def _decode_npy(data, allow_pickle=False):
+    """Inverse of :func:`_encode_npy`. Object arrays are pickled, so they are
+    only loaded with ``allow_pickle=True``.
+
+    """
+    try:
+        return np.load(BytesIO(b64decode(data)), allow_pickle=allow_pickle)
+    except ValueError:
+        if allow_pickle:
+            raise
+        raise ValueError("The file contains pickled coordinates. Loading "
+                         "them can execute arbitrary code; pass "
+                         "allow_pickle=True for files from trusted sources")
+
+
+def _encode_objects(array):
+    """Encode an object array whose elements are strings, numbers, booleans
+    or None as UTF-8 encoded JSON strings, one per element.
+
+    Raises
+    ------
+    TypeError
+        If an element is of any other type.
+
+    """
+    def encode(value):
+        if isinstance(value, np.generic):
+            value = value.item()
+        if not (value is None or isinstance(value, (str, bytes, int, float))):
+            raise TypeError("cannot encode %r as JSON" % (value,))
+        if isinstance(value, bytes):
+            # bytes are tagged so they are not restored as str
+            return json.dumps({'bytes': value.decode('utf-8')},
+                              ensure_ascii=False).encode('utf-8')
+        return json.dumps(value, ensure_ascii=False).encode('utf-8')
+
+    return np.array([encode(value) for value in array.flat],
+                    dtype=bytes).reshape(array.shape)
+
+
+def _decode_objects(array):
+    """Inverse of :func:`_encode_objects`."""
+    def decode(value):
+        value = json.loads(value.decode('utf-8'))
+        if isinstance(value, dict):
+            return value['bytes'].encode('utf-8')
+        return value
+
+    decoded = np.empty(array.shape, dtype=object)
+    for index, value in np.ndenumerate(array):
+        decoded[index] = decode(value)
+    return decoded
+
+
+def _has_unicode(dtype):
+    if dtype.names is not None:
+        return any(_has_unicode(dtype.fields[name][0]) for name in dtype.names)
+    if dtype.subdtype is not None:
+        return _has_unicode(dtype.subdtype[0])
+    return dtype.kind == 'U'
+
+
+def _encode_strings(array):
+    """Replace unicode strings (including unicode fields of structured arrays)
+    with UTF-8 encoded bytes.
+
+    """
+    if array.dtype.names is not None:
+        fields = [(name, _encode_strings(array[name]))
+                  for name in array.dtype.names]
+        encoded = np.empty(array.shape, dtype=[
+            (name, field.dtype, field.shape[array.ndim:])
+            for name, field in fields])
+        for name, field in fields:
+            encoded[name] = field
+        return encoded
+    if array.dtype.kind == 'U':
+        return np.char.encode(array, 'utf-8')
+    return array
+
+
+def _decode_strings(array, dtype):
+    """Inverse of :func:`_encode_strings`: convert ``array`` back to the
+    original ``dtype``.
+
+    """
+    if dtype.names is not None:
+        decoded = np.empty(array.shape, dtype=dtype)
+        for name in dtype.names:
+            field = decoded[name]
+            decoded[name] = _decode_strings(array[name], field.dtype)
+        return decoded
+    if dtype.kind == 'U':
+        return np.char.decode(array, 'utf-8').astype(dtype)
+    return array.astype(dtype)
+
+
+def _write_hdf_coord(group, name, coord, filters):
+    """Write a coordinate as a native HDF5 dataset; see
+    :meth:`TimeSeries.to_hdf`.
+
+    """
+    array = np.asarray(coord.values)
+    kwargs = {}
+    if array.ndim > 0 and array.size > 0:
+        kwargs = filters
+    try:
+        if array.dtype == object:
+            dset = group.create_dataset(name, data=_encode_objects(array),
+                                        **kwargs)
+            dset.attrs['encoding'] = b'json'
+        elif _has_unicode(array.dtype):
+            dset = group.create_dataset(name, data=_encode_strings(array),
+                                        **kwargs)
+            dset.attrs['dtype'] = repr(array.dtype.descr
+                                       if array.dtype.names is not None
+                                       else array.dtype.str).encode()
+        else:
+            dset = group.create_dataset(name, data=array, **kwargs)
+    except (TypeError, ValueError):
+        # e.g. object arrays holding other objects or structured arrays with
+        # object fields, which can only be loaded with allow_pickle=True
+        if name in group:
+            del group[name]
+        dset = group.create_dataset(name, data=_encode_npy(array))
+        dset.attrs['encoding'] = b'npy'
+    dset.attrs['dims'] = json.dumps(coord.dims).encode()
+
+
+def _read_hdf_coord(dset, allow_pickle=False):
+    """Read a coordinate written by :func:`_write_hdf_coord`.
+
+    Returns
+    -------
+    tuple
+        ``(dims, values)``
+
+    """
+    data = dset[()]
+    encoding = dset.attrs.get('encoding', None)
+    if encoding == b'npy':
+        data = _decode_npy(data, allow_pickle)
+    elif encoding == b'json':
+        data = _decode_objects(np.asarray(data))
+    else:
+        data = np.asarray(data)
+        dtype = dset.attrs.get('dtype', None)
+        if dtype is not None:
+            data = _decode_strings(data,
+                                   np.dtype(ast.literal_eval(dtype.decode())))
+    return tuple(json.loads(dset.attrs['dims'].decode())), data
+
+
+def _hdf_hyperslab(dset, positions):
+    """Read the elements of ``dset`` at ``positions`` from disk.
+
+    ``positions`` holds an integer (the axis is dropped) or a 1-D integer
+    array per axis. Regularly spaced positions are read as (strided) slices.
+    Other positions are sorted, deduplicated and split into runs of
+    consecutive indices. h5py accepts an increasing list of indices along a
+    single axis only: it is used for the axis with the most runs, and one
+    read is issued for every combination of runs along the other axes. Only
+    the selected elements are read; the requested order and repetitions are
+    restored in memory.
+
+    """
+    selection = []
+    takes = []
+    fancy = []
+    shape = []
+    for axis, pos in enumerate(positions):
+        if pos.ndim == 0:
+            selection.append(int(pos))
+            takes.append(None)
+            continue
+        if len(pos) == 0:
+            shape = [len(p) for p in positions if p.ndim]
+            return np.empty(shape, dtype=dset.dtype)
+
+        steps = np.diff(pos)
+        if len(pos) == 1 or (steps[0] > 0 and (steps == steps[0]).all()):
+            step = int(steps[0]) if len(pos) > 1 else 1
+            selection.append(slice(int(pos[0]), int(pos[-1]) + 1, step))
+            takes.append(None)
+            shape.append(len(pos))
+            continue
+
+        unique = np.unique(pos)
+        if np.array_equal(unique, pos):
+            takes.append(None)
+        else:
+            takes.append(np.searchsorted(unique, pos))
+        breaks = np.where(np.diff(unique) > 1)[0] + 1
+        runs = list(zip(np.r_[0, breaks], np.r_[breaks, len(unique)]))
+        # the axis of dset and of the data read
+        fancy.append((axis, len(shape), unique, runs))
+        selection.append(None)
+        shape.append(len(unique))
+
+    if not fancy:
+        data = dset[tuple(selection)]
+    else:
+        fancy.sort(key=lambda f: len(f[3]))
+        list_axis, _, unique, _ = fancy.pop()
+        selection[list_axis] = unique
+        data = np.empty(shape, dtype=dset.dtype)
+        index = [slice(None)] * len(shape)
+        for runs in itertools.product(*[f[3] for f in fancy]):
+            for (axis, out_axis, unique, _), (start, stop) in zip(fancy, runs):
+                selection[axis] = slice(int(unique[start]), int(unique[stop - 1]) + 1)
+                index[out_axis] = slice(start, stop)
+            data[tuple(index)] = dset[tuple(selection)]
+
+    out_axis = 0
+    for pos, take in zip(positions, takes):
+        if pos.ndim == 0:
+            continue
+        if take is not None:
+            data = np.take(data, take, axis=out_axis)
+        out_axis += 1
+    return data
+
+
+def _select_hdf(dset, dims, coords, isel, sel):
+    """Resolve ``isel`` and ``sel`` against the stored coordinates and read
+    the selected data; see :meth:`TimeSeries.from_hdf`.
+
+    Returns
+    -------
+    tuple
+        ``(data, dims, coords)`` of the selection
+
+    """
+    index_names = ['_hdf_position_' + dim for dim in dims]
+    selection = xr.Dataset(coords=coords).assign_coords(**{
+        name: (dim, np.arange(size))
+        for name, dim, size in zip(index_names, dims, dset.shape)})
+    if isel:
+        selection = selection.isel(**isel)
+    if sel:
+        selection = selection.sel(**sel)
+
+    positions = [selection[name].values for name in index_names]
+    data = _hdf_hyperslab(dset, positions)
+    dims = [dim for dim, pos in zip(dims, positions) if pos.ndim]
+    coords = {name: (coord.dims, coord.values)
+              for name, coord in selection.coords.items()
+              if name not in index_names}
+    return data, dims, coords
+
+
 class TimeSeries(xr.DataArray):
     """A thin wrapper around :class:`xr.DataArray` for dealing with time series
     data.
@@ -270,7 +533,72 @@ class TimeSeries(xr.DataArray):
                                attrs=attrs)
             return array
         
-    def to_hdf(self, filename, mode='w'):
+    #: Version of the HDF5 layout written by :meth:`to_hdf`. Files without a
+    #: ``layout`` attribute store coordinates as base64-encoded ``.npy`` data.
+    HDF_LAYOUT_VERSION = 2
+
+    #: Upper bound on the size in bytes of an HDF5 chunk of the data array.
+    hdf_chunk_bytes = 1 << 20
+
+    #: Dimensions that are usually read one (or a few) entries at a time.
+    #: Chunks never span more than one entry along these dimensions.
+    hdf_channel_dims = ('channels', 'bipolar_pairs')
+
+    #: Dimensions chunked in blocks, e.g. consecutive events.
+    hdf_block_dims = ('events', 'start_offsets')
+
+    def hdf_chunks(self, chunk_bytes=None):
+        """Compute the HDF5 chunk shape used to store the data.
+
+        Chunks are aligned with the typical access pattern of a single channel
+        over a block of events: every chunk covers one entry along the channel
+        dimensions (see :attr:`hdf_channel_dims`), all samples along the
+        remaining dimensions and as many entries along the block dimensions
+        (see :attr:`hdf_block_dims`) as fit in ``chunk_bytes``. Dimensions
+        without a label in either group are shrunk starting with the first one
+        when a single block entry does not fit.
+
+        Parameters
+        ----------
+        chunk_bytes : int or None
+            Upper bound on the chunk size in bytes. Defaults to
+            :attr:`hdf_chunk_bytes`.
+
+        Returns
+        -------
+        tuple or None
+            Chunk shape or None for scalar or empty data, which HDF5 stores
+            contiguously.
+
+        """
+        if self.size == 0 or self.ndim == 0:
+            return None
+        if chunk_bytes is None:
+            chunk_bytes = self.hdf_chunk_bytes
+
+        max_items = max(1, chunk_bytes // self.dtype.itemsize)
+        chunks = list(self.shape)
+        block_axes = []
+        other_axes = []
+        for axis, dim in enumerate(self.dims):
+            if dim in self.hdf_channel_dims:
+                chunks[axis] = 1
+            elif dim in self.hdf_block_dims:
+                block_axes.append(axis)
+            else:
+                other_axes.append(axis)
+
+        for axis in block_axes + other_axes:
+            size = int(np.prod(chunks))
+            if size <= max_items:
+                break
+            rest = size // chunks[axis]
+            chunks[axis] = max(1, max_items // rest)
+
+        return tuple(chunks)
+
+    def to_hdf(self, filename, mode='w', compression=None,
+               compression_opts=None, shuffle=False, chunks=None):
         """Save to disk using HDF5.
 
         Parameters
@@ -280,25 +608,51 @@ class TimeSeries(xr.DataArray):
         mode : str
             File mode to use. See the :mod:`h5py` documentation for details.
             Default: ``'w'``
+        compression : str or None
+            Compression filter for the data and coordinate arrays, e.g.
+            ``'gzip'`` or ``'lzf'`` (see :meth:`h5py.Group.create_dataset`).
+            Default: no compression.
+        compression_opts : int or None
+            Compression options, e.g. the gzip level (0-9).
+        shuffle : bool
+            Apply the HDF5 shuffle filter before compressing. This usually
+            improves the compression ratio of numeric data.
+        chunks : tuple or None
+            Chunk shape of the data array. Defaults to :meth:`hdf_chunks`.
 
         Notes
         -----
-        Because recarrays can complicate things when unicode is involved, saving
-        coordinates is a multi-step process:
-
-        1. Save to a buffer using :func:`np.save`. This uses Numpy's own binary
-           format and should Just Work.
-        2. Base64-encode the buffer to eliminate NULL bytes which HDF5 can't
-           handle.
-        3. Write the bytes contained in the buffer to the HDF5 file.
+        Coordinates are stored as native HDF5 datasets in the ``coords``
+        group. HDF5 has no fixed-width unicode type, so unicode arrays and
+        unicode fields of record arrays are stored as UTF-8 encoded bytes; the
+        original dtype is kept in the ``dtype`` attribute of the dataset and
+        restored by :meth:`from_hdf`. Object arrays of strings, numbers,
+        booleans and None are stored as UTF-8 encoded JSON strings, one per
+        element. Other coordinates that HDF5 cannot represent fall back to
+        base64-encoded :func:`np.save` output, which is how all coordinates
+        were stored by earlier versions; loading them requires unpickling
+        (see the ``allow_pickle`` argument of :meth:`from_hdf`).
 
         """
         if h5py is None:  # pragma: nocover
             raise RuntimeError("You must install h5py to save as HDF5")
 
+        filters = dict(compression=compression,
+                       compression_opts=compression_opts,
+                       shuffle=shuffle)
+
         with h5py.File(filename, mode) as hfile:
             hfile.attrs['ptsa_version'] = ptsa_version
-            hfile.create_dataset("data", data=self.data, chunks=True)
+            hfile.attrs['created'] = time.time()
+            hfile.attrs['layout'] = self.HDF_LAYOUT_VERSION
+
+            if self.size == 0 or self.ndim == 0:
+                hfile.create_dataset("data", data=self.values)
+            else:
+                if chunks is None:
+                    chunks = self.hdf_chunks()
+                hfile.create_dataset("data", data=self.values, chunks=chunks,
+                                     **filters)
 
             dims = [dim.encode() for dim in self.dims]
             hfile.create_dataset("dims", data=dims)
@@ -307,15 +661,7 @@ class TimeSeries(xr.DataArray):
             coords = []
             for name, data in self.coords.items():
                 coords.append(name)
-                buffer = BytesIO()
-                np.save(buffer, data)
-                buffer.seek(0)
-                output = b64encode(buffer.read())
-                try:
-                    coords_group.create_dataset(name, data=output)
-                except:
-                    print(output)
-                    raise
+                _write_hdf_coord(coords_group, name, data, filters)
             names = json.dumps(coords).encode()
             coords_group.attrs.update(names=names)
 
@@ -326,35 +672,68 @@ class TimeSeries(xr.DataArray):
                 root.attrs['attrs'] = json.dumps(self.attrs).encode()
 
     @classmethod
-    def from_hdf(cls, filename):
-        """
-        Function to support loading files created with
-        the to_hdf5 method in previous versions of PTSA.
+    def from_hdf(cls, filename, isel=None, sel=None, allow_pickle=False):
+        """Load a time series saved with :meth:`to_hdf`.
 
+        Files written by previous versions of PTSA, which store coordinates
+        as base64-encoded :func:`np.save` output, are supported as well.
 
         Parameters
         ----------
         filename : str
             Path to HDF5 file.
+        isel : dict or None
+            Integer indexers by dimension as accepted by
+            :meth:`xr.DataArray.isel`.
+        sel : dict or None
+            Label indexers by dimension as accepted by
+            :meth:`xr.DataArray.sel`. Applied after ``isel``.
+        allow_pickle : bool
+            Allow loading coordinates that were stored pickled, i.e. object
+            arrays written by previous versions and object arrays of
+            arbitrary objects. Unpickling can execute arbitrary code, so only
+            use this for files from trusted sources. Default: False.
+
+        Raises
+        ------
+        ValueError
+            If the file contains pickled coordinates and ``allow_pickle`` is
+            False.
+
+        Notes
+        -----
+        With ``isel`` or ``sel`` the selection is resolved against the stored
+        coordinates first and only the selected part of the data array is read
+        from disk, e.g.::
+
+            power = TimeSeries.from_hdf(filename,
+                                        isel={'channels': [0, 5]},
+                                        sel={'frequency': slice(3, 8)})
+
+        is equivalent to (but needs far less memory than)::
+
+            TimeSeries.from_hdf(filename).isel(channels=[0, 5]).sel(
+                frequency=slice(3, 8))
 
         """
-        import warnings
-        
         if h5py is None:  # pragma: nocover
             raise RuntimeError("You must install h5py to load from HDF5")
 
         with h5py.File(filename, 'r') as hfile:
-            dims = hfile['dims'][:]
+            dims = [dim.decode() for dim in hfile['dims'][:]]
 
             root = hfile['/']
+            legacy = 'layout' not in root.attrs
 
             coords_group = hfile['coords']
             names = json.loads(coords_group.attrs['names'].decode())
             coords = dict()
             for name in names:
-                buffer = BytesIO(b64decode(coords_group[name].value))
-                coord = np.load(buffer)
-                coords[name] = coord
+                dset = coords_group[name]
+                if legacy:
+                    coords[name] = _decode_npy(dset[()], allow_pickle)
+                else:
+                    coords[name] = _read_hdf_coord(dset, allow_pickle)
 
             name = root.attrs.get('name', None)
             if name is not None:
@@ -363,8 +742,13 @@ class TimeSeries(xr.DataArray):
             if attrs is not None:
                 attrs = json.loads(attrs.decode())
 
-            array = cls.create(hfile['data'].value, None, coords=coords,
-                               dims=[dim.decode() for dim in dims],
+            if isel or sel:
+                data, dims, coords = _select_hdf(hfile['data'], dims, coords,
+                                                 isel, sel)
+            else:
+                data = hfile['data'][()]
+
+            array = cls.create(data, None, coords=coords, dims=dims,
                                name=name, attrs=attrs)
 
             return array
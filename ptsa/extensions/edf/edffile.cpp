@@ -1,3 +1,6 @@
+#include <algorithm>
+#include <limits>
+
 #include "edffile.hpp"
 
 
@@ -46,7 +49,7 @@ EDFFile::~EDFFile()
 
 void EDFFile::close()
 {
-    if (edfclose_file(this->handle() < 0)) {
+    if (edfclose_file(this->handle()) < 0) {
         throw std::runtime_error("Error closing EDF file!");
     }
     else {
@@ -147,3 +150,78 @@ py::array_t<double> EDFFile::read_samples(std::vector<std::string> channel_names
     auto numbers = get_channel_numbers(channel_names);
     return read_samples(numbers, n_samples, offset);
 }
+
+
+std::tuple<py::array_t<double>, py::array_t<bool>> EDFFile::read_epochs(
+    std::vector<int> channels,
+    py::array_t<long long, py::array::c_style | py::array::forcecast> offsets,
+    int n_samples)
+{
+    ensure_open();
+
+    if (offsets.ndim() != 1) {
+        throw std::runtime_error("offsets must be one-dimensional");
+    }
+
+    const ssize_t n_channels = static_cast<ssize_t>(channels.size());
+    const ssize_t n_epochs = offsets.shape(0);
+    const std::vector<ssize_t> shape = {{n_channels, n_epochs, n_samples}};
+
+    // An epoch can only be read if it fits within every requested channel
+    long long smp_in_file = std::numeric_limits<long long>::max();
+    for (const auto channel: channels) {
+        smp_in_file = std::min(smp_in_file, this->get_channel_info(channel).smp_in_file);
+    }
+
+    auto output = py::array_t<double>(shape);
+    auto ok = py::array_t<bool>(n_epochs);
+
+    double *data = output.mutable_data();
+    bool *ok_data = ok.mutable_data();
+    const long long *offset_data = offsets.data();
+    const auto handle = this->handle();
+
+    bool failed = false;
+
+    {
+        py::gil_scoped_release release;
+
+        for (ssize_t e = 0; e < n_epochs; ++e) {
+            ok_data[e] = (offset_data[e] >= 0) && (offset_data[e] + n_samples <= smp_in_file);
+        }
+
+        for (ssize_t c = 0; c < n_channels && !failed; ++c) {
+            for (ssize_t e = 0; e < n_epochs; ++e) {
+                double *buffer = data + (c * n_epochs + e) * n_samples;
+
+                if (!ok_data[e]) {
+                    std::fill(buffer, buffer + n_samples, std::numeric_limits<double>::quiet_NaN());
+                    continue;
+                }
+
+                if (edfseek(handle, channels[c], offset_data[e], EDFSEEK_SET) != offset_data[e]
+                    || edfread_physical_samples(handle, channels[c], n_samples, buffer) != n_samples) {
+                    failed = true;
+                    break;
+                }
+            }
+        }
+    }
+
+    if (failed) {
+        throw std::runtime_error("Error reading EDF samples!");
+    }
+
+    return std::make_tuple(output, ok);
+}
+
+
+std::tuple<py::array_t<double>, py::array_t<bool>> EDFFile::read_epochs(
+    std::vector<std::string> channel_names,
+    py::array_t<long long, py::array::c_style | py::array::forcecast> offsets,
+    int n_samples)
+{
+    ensure_open();
+    auto numbers = get_channel_numbers(channel_names);
+    return read_epochs(numbers, offsets, n_samples);
+}
@@ -3,6 +3,7 @@
 #include <exception>
 #include <locale>
 #include <string>
+#include <tuple>
 
 #include <pybind11/numpy.h>
 #include <pybind11/stl.h>
@@ -158,4 +159,32 @@ public:
      * @return data array
      */
     py::array_t<double> read_samples(std::vector<std::string> channel_names, int n_samples, long long offset);
+
+    /**
+     * Read many equally sized epochs from a list of channels into a single
+     * preallocated array. The GIL is released while reading.
+     * @param channels - the channels to read from
+     * @param offsets - sample offset at which each epoch starts
+     * @param n_samples - number of samples in each epoch
+     * @return tuple of the (channels, epochs, samples) data array and a
+     *         boolean mask indicating which epochs were read. Epochs that do
+     *         not fit within the file are filled with NaN.
+     * @throws std::runtime_error when an error occurs
+     */
+    std::tuple<py::array_t<double>, py::array_t<bool>> read_epochs(
+        std::vector<int> channels,
+        py::array_t<long long, py::array::c_style | py::array::forcecast> offsets,
+        int n_samples);
+
+    /**
+     * @brief Read many equally sized epochs from a list of channel names
+     * @param channel_names vector of channel names to read
+     * @param offsets sample offset at which each epoch starts
+     * @param n_samples number of samples in each epoch
+     * @return tuple of data array and epoch mask
+     */
+    std::tuple<py::array_t<double>, py::array_t<bool>> read_epochs(
+        std::vector<std::string> channel_names,
+        py::array_t<long long, py::array::c_style | py::array::forcecast> offsets,
+        int n_samples);
 };
@@ -85,6 +85,16 @@ PYBIND11_MODULE(edffile, m)
              py::overload_cast<std::vector<std::string>, int, long long>(&EDFFile::read_samples),
              "Read samples from a list of channel names",
              py::arg("channels"), py::arg("samples"), py::arg("offset") = 0)
+        .def("read_epochs",
+             py::overload_cast<std::vector<int>, py::array_t<long long, py::array::c_style | py::array::forcecast>, int>(&EDFFile::read_epochs),
+             "Read epochs of n_samples samples starting at each offset from a list of channel numbers. "
+             "Returns a (channels, epochs, samples) array and a boolean mask of the epochs that were read.",
+             py::arg("channels"), py::arg("offsets"), py::arg("n_samples"))
+        .def("read_epochs",
+             py::overload_cast<std::vector<std::string>, py::array_t<long long, py::array::c_style | py::array::forcecast>, int>(&EDFFile::read_epochs),
+             "Read epochs of n_samples samples starting at each offset from a list of channel names. "
+             "Returns a (channels, epochs, samples) array and a boolean mask of the epochs that were read.",
+             py::arg("channels"), py::arg("offsets"), py::arg("n_samples"))
         .def("get_samplerate", &EDFFile::get_samplerate, py::arg("channel"))
     ;
 }
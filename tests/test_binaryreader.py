@@ -0,0 +1,156 @@
+from tempfile import mkdtemp
+import os.path as osp
+import shutil
+
+import numpy as np
+import pytest
+
+from ptsa.data.readers import BinaryRawReader
+
+CHANNELS = np.array(['001', '002', '003'])
+NUM_SAMPLES = 1000
+
+
+@pytest.fixture
+def dataroot():
+    """Split-channel int16 session with a params.txt file."""
+    path = mkdtemp()
+    dataroot = osp.join(path, 'R1XXXX_FR1_0')
+    with open(osp.join(path, 'params.txt'), 'w') as f:
+        f.write('samplerate 500\ndataformat \'int16\'\ngain 0.5\n')
+    for i, channel in enumerate(CHANNELS):
+        data = (np.arange(NUM_SAMPLES) + 1000 * i).astype('<i2')
+        data.tofile(dataroot + '.' + channel)
+    yield dataroot
+    shutil.rmtree(path, ignore_errors=True)
+
+
+def expected_epoch(channel_index, start_offset, read_size):
+    return np.arange(start_offset, start_offset + read_size) + 1000 * channel_index
+
+
+@pytest.mark.parametrize('num_workers', [1, 2, 16])
+@pytest.mark.parametrize('use_memmap', [True, False])
+def test_read_epochs(dataroot, use_memmap, num_workers):
+    start_offsets = np.array([0, 100, 950, -5, 990])
+    reader = BinaryRawReader(dataroot=dataroot, channels=CHANNELS,
+                             start_offsets=start_offsets, read_size=50,
+                             use_memmap=use_memmap, num_workers=num_workers)
+    data, mask = reader.read()
+
+    assert data.shape == (3, 5, 50)
+    assert (mask == [True, True, True, False, False]).all()
+    for c in range(len(CHANNELS)):
+        for e, start_offset in enumerate(start_offsets[:3]):
+            assert (data.values[c, e] == 0.5 * expected_epoch(c, start_offset, 50)).all()
+    assert np.isnan(data.values[:, 3:]).all()
+
+
+def test_memmap_matches_file_read(dataroot):
+    start_offsets = np.array([10, 10, 300, 700, 999])
+    kwargs = dict(dataroot=dataroot, channels=CHANNELS,
+                  start_offsets=start_offsets, read_size=100)
+    mm_data, mm_mask = BinaryRawReader(use_memmap=True, **kwargs).read()
+    f_data, f_mask = BinaryRawReader(use_memmap=False, **kwargs).read()
+
+    assert (mm_mask == f_mask).all()
+    np.testing.assert_equal(mm_data.values, f_data.values)
+
+
+@pytest.mark.parametrize('use_memmap', [True, False])
+def test_overlapping_epochs(dataroot, use_memmap, monkeypatch):
+    # force several coalesced blocks
+    monkeypatch.setattr(BinaryRawReader, 'max_block_size', 120)
+    monkeypatch.setattr(BinaryRawReader, 'max_block_gap', 0)
+    start_offsets = np.array([500, 20, 0, 40, 520, 10, 900, 20])
+    reader = BinaryRawReader(dataroot=dataroot, channels=CHANNELS,
+                             start_offsets=start_offsets, read_size=50,
+                             use_memmap=use_memmap)
+    assert reader.plan_read_blocks(start_offsets, 50, NUM_SAMPLES) == [(0, 90), (500, 570), (900, 950)]
+
+    data, mask = reader.read()
+    assert mask.all()
+    for c in range(len(CHANNELS)):
+        for e, start_offset in enumerate(start_offsets):
+            assert (data.values[c, e] == 0.5 * expected_epoch(c, start_offset, 50)).all()
+
+
+def test_read_full_session(dataroot):
+    reader = BinaryRawReader(dataroot=dataroot, channels=CHANNELS)
+    data, mask = reader.read()
+    assert data.shape == (3, 1, NUM_SAMPLES)
+    assert mask.all()
+    assert (data.values[1, 0] == 0.5 * expected_epoch(1, 0, NUM_SAMPLES)).all()
+
+
+@pytest.mark.parametrize('use_memmap', [True, False])
+@pytest.mark.parametrize('dtype,expected_dtype,gain', [
+    (None, np.float64, 0.5),
+    ('float32', np.float32, 0.5),
+    ('native', np.int16, 1),
+])
+def test_read_dtype(dataroot, use_memmap, dtype, expected_dtype, gain):
+    start_offsets = np.array([0, 100, 990])
+    reader = BinaryRawReader(dataroot=dataroot, channels=CHANNELS,
+                             start_offsets=start_offsets, read_size=50,
+                             use_memmap=use_memmap, dtype=dtype)
+    data, mask = reader.read()
+
+    assert data.dtype == expected_dtype
+    assert data.attrs['gain'] == 0.5
+    assert (mask == [True, True, False]).all()
+    for c in range(len(CHANNELS)):
+        for e, start_offset in enumerate(start_offsets[:2]):
+            assert (data.values[c, e] == gain * expected_epoch(c, start_offset, 50)).all()
+    if dtype == 'native':
+        assert (data.values[:, 2] == 0).all()
+    else:
+        assert np.isnan(data.values[:, 2]).all()
+
+
+@pytest.mark.parametrize('use_memmap', [True, False])
+@pytest.mark.parametrize('dtype,out_dtype,gain', [
+    (None, np.float64, 0.5),
+    (None, np.float32, 0.5),
+    ('native', np.int32, 1),
+])
+def test_read_out(dataroot, use_memmap, dtype, out_dtype, gain):
+    start_offsets = np.array([0, 990, 100])
+    reader = BinaryRawReader(dataroot=dataroot, channels=CHANNELS,
+                             start_offsets=start_offsets, read_size=50,
+                             use_memmap=use_memmap, dtype=dtype)
+    # write into a strided view of a larger buffer
+    buffer = np.full((3, 4, 60), 7, dtype=out_dtype)
+    out = buffer[:, 1:, 5:55]
+    data, mask = reader.read(out=out)
+
+    assert np.shares_memory(data.values, buffer)
+    assert (mask == [True, False, True]).all()
+    assert (buffer[:, 0] == 7).all() and (buffer[..., :5] == 7).all() and (buffer[..., 55:] == 7).all()
+    for c in range(len(CHANNELS)):
+        assert (out[c, 0] == gain * expected_epoch(c, 0, 50)).all()
+        assert (out[c, 2] == gain * expected_epoch(c, 100, 50)).all()
+    if dtype == 'native':
+        assert (out[:, 1] == 0).all()
+    else:
+        assert np.isnan(out[:, 1]).all()
+
+
+def test_read_out_invalid(dataroot):
+    reader = BinaryRawReader(dataroot=dataroot, channels=CHANNELS,
+                             start_offsets=np.array([0, 100]), read_size=50)
+    with pytest.raises(ValueError):
+        reader.read(out=np.empty((3, 2, 49)))
+    with pytest.raises(ValueError):
+        reader.read(out=np.empty((3, 2, 50), dtype=np.int16))
+
+
+@pytest.mark.parametrize('dtype', ['int16', 'foo'])
+def test_invalid_dtype(dataroot, dtype):
+    with pytest.raises((ValueError, TypeError)):
+        BinaryRawReader(dataroot=dataroot, channels=CHANNELS, dtype=dtype)
+
+
+def test_invalid_num_workers(dataroot):
+    with pytest.raises(ValueError):
+        BinaryRawReader(dataroot=dataroot, channels=CHANNELS, num_workers=0)
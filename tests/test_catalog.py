@@ -0,0 +1,116 @@
+import os
+import os.path as osp
+
+import numpy as np
+import pytest
+
+from ptsa.data.readers import BaseRawReader, BinaryRawReader, ParamsReader, SessionCatalog
+
+CHANNELS = np.array(['001', '002'])
+
+
+@pytest.fixture
+def dataroot(tmpdir):
+    with open(str(tmpdir.join('params.txt')), 'w') as f:
+        f.write('samplerate 500\ndataformat \'int16\'\ngain 0.5\n')
+    dataroot = str(tmpdir.join('R1XXXX_FR1_0'))
+    for channel in CHANNELS:
+        np.arange(1000, dtype='<i2').tofile(dataroot + '.' + channel)
+    return dataroot
+
+
+@pytest.fixture
+def catalog(tmpdir, monkeypatch):
+    # keep the database out of the session directory; writing to it would change the directory mtime
+    catalog = SessionCatalog(str(tmpdir.mkdir('catalog').join('catalog.sqlite')))
+    monkeypatch.setattr(BaseRawReader, 'catalog', catalog)
+    yield catalog
+    catalog.close()
+
+
+def count_calls(monkeypatch, cls, name):
+    calls = []
+    method = getattr(cls, name)
+
+    def wrapper(*args, **kwargs):
+        calls.append(args)
+        return method(*args, **kwargs)
+
+    monkeypatch.setattr(cls, name, staticmethod(wrapper))
+    return calls
+
+
+def test_catalog_hit(dataroot, catalog, monkeypatch):
+    locate_calls = count_calls(monkeypatch, ParamsReader, 'locate_params_file')
+
+    reader = BinaryRawReader(dataroot=dataroot, channels=CHANNELS)
+    assert reader.get_num_samples() == 1000
+    assert len(locate_calls) == 1
+
+    entry = catalog.lookup(dataroot)
+    assert entry['params'] == reader.params_dict
+    assert entry['files'] == {'001': 2000}
+
+    reader = BinaryRawReader(dataroot=dataroot, channels=CHANNELS, start_offsets=np.array([10]), read_size=5)
+    assert reader.get_num_samples() == 1000
+    assert len(locate_calls) == 1
+    assert reader.params_dict == {'samplerate': 500.0, 'format': 'int16', 'gain': 0.5}
+    data, mask = reader.read()
+    assert (data.values[:, 0] == 0.5 * np.arange(10, 15)).all()
+
+
+def test_catalog_invalidation(dataroot, catalog):
+    BinaryRawReader(dataroot=dataroot, channels=CHANNELS).get_num_samples()
+    assert catalog.lookup(dataroot) is not None
+
+    params_file = osp.join(osp.dirname(dataroot), 'params.txt')
+    with open(params_file, 'w') as f:
+        f.write('samplerate 1000\ndataformat \'int16\'\ngain 2.0\n')
+    stat = os.stat(params_file)
+    os.utime(params_file, (stat.st_atime, stat.st_mtime + 10))
+    assert catalog.lookup(dataroot) is None
+
+    reader = BinaryRawReader(dataroot=dataroot, channels=CHANNELS)
+    assert reader.params_dict['samplerate'] == 1000
+    assert catalog.lookup(dataroot) == {'params': reader.params_dict, 'files': {}}
+
+    # replacing a channel file changes the directory mtime
+    directory = osp.dirname(dataroot)
+    stat = os.stat(directory)
+    os.utime(directory, (stat.st_atime, stat.st_mtime + 10))
+    assert catalog.lookup(dataroot) is None
+
+
+def test_catalog_without_validation(dataroot, tmpdir):
+    filename = str(tmpdir.mkdir('catalog').join('catalog.sqlite'))
+    with SessionCatalog(filename) as catalog:
+        catalog.store_params(dataroot, osp.join(osp.dirname(dataroot), 'params.txt'), {'samplerate': 1.0})
+        catalog.store_file(dataroot, '001', 10, 0.0)
+
+    os.remove(osp.join(osp.dirname(dataroot), 'params.txt'))
+    with SessionCatalog(filename) as catalog:
+        assert catalog.lookup(dataroot) is None
+    with SessionCatalog(filename, validate=False) as catalog:
+        assert catalog.lookup(dataroot) == {'params': {'samplerate': 1.0}, 'files': {'001': 10}}
+        catalog.remove(dataroot)
+        assert catalog.lookup(dataroot) is None
+
+
+def test_catalog_channel_file_rewritten(dataroot, catalog):
+    assert BinaryRawReader(dataroot=dataroot, channels=CHANNELS).get_num_samples() == 1000
+    directory_mtime = os.stat(osp.dirname(dataroot)).st_mtime
+
+    # rewriting a channel file in place does not change the directory mtime
+    with open(dataroot + '.001', 'r+b') as f:
+        np.arange(3000, dtype='<i2').tofile(f)
+    stat = os.stat(dataroot + '.001')
+    os.utime(dataroot + '.001', (stat.st_atime, stat.st_mtime + 10))
+    assert os.stat(osp.dirname(dataroot)).st_mtime == directory_mtime
+
+    assert catalog.lookup(dataroot)['files'] == {}
+    reader = BinaryRawReader(dataroot=dataroot, channels=CHANNELS, start_offsets=np.array([2000]), read_size=10)
+    assert reader.get_num_samples() == 3000
+    data, mask = reader.read()
+    assert mask.tolist() == [[True], [False]]
+    assert (data.values[0, 0] == 0.5 * np.arange(2000, 2010)).all()
+    assert catalog.lookup(dataroot)['files'] == {'001': 6000}
@@ -1,4 +1,5 @@
 import os.path as osp
+import numpy as np
 import pytest
 
 from ptsa.extensions.edf import EDFFile
@@ -42,3 +43,22 @@ class TestEDFFile:
         data_l = edffile.read_samples(labels, requested)
         assert data_n.shape[1] == requested
         assert (data_n == data_l).all()
+
+    def test_read_epochs(self, edffile):
+        numbers = [0, 3, 6]
+        labels = ['EEG FP1', 'EEG F4', 'EEG P3']
+        offsets = np.array([0, 500, 1950, -1, 1900])
+        data_n, ok_n = edffile.read_epochs(numbers, offsets, 100)
+        data_l, ok_l = edffile.read_epochs(labels, offsets, 100)
+
+        assert data_n.shape == (3, 5, 100)
+        assert (ok_n == [True, True, False, False, True]).all()
+        assert (ok_n == ok_l).all()
+        np.testing.assert_equal(data_n, data_l)
+
+        for i, offset in enumerate(offsets):
+            if ok_n[i]:
+                expected = edffile.read_samples(numbers, 100, offset=int(offset))
+                assert (data_n[:, i] == expected).all()
+            else:
+                assert np.isnan(data_n[:, i]).all()
@@ -1,6 +1,7 @@
 from ptsa.data.readers import EDFRawReader, JsonIndexReader, BaseEventReader, EEGReader
 import pytest
 import os.path as osp
+import threading
 from ptsa.test.utils import get_rhino_root, skip_without_rhino
 import numpy as np
 
@@ -23,6 +24,144 @@ def test_channel_names(local_eegfile):
     assert not np.isnan(data).any()
 
 
+def test_read_epochs_local(local_eegfile):
+    channels = np.array([0, 3, 6])
+    offsets = np.array([100, 0, 1950, -10, 1000])
+    reader = EDFRawReader(dataroot=local_eegfile, channels=channels,
+                          start_offsets=offsets, read_size=100)
+    data, mask = reader.read()
+
+    assert (mask == [[True, True, False, False, True]] * 3).all()
+    full, _ = EDFRawReader(dataroot=local_eegfile, channels=channels).read()
+    for i, offset in enumerate(offsets):
+        if mask[0, i]:
+            assert (data.values[:, i] == full.values[:, 0, offset:offset + 100]).all()
+        else:
+            assert np.isnan(data.values[:, i]).all()
+
+
+def test_read_out_local(local_eegfile):
+    channels = np.array([0, 3])
+    offsets = np.array([100, 1950])
+    reader = EDFRawReader(dataroot=local_eegfile, channels=channels,
+                          start_offsets=offsets, read_size=100)
+    expected, _ = reader.read()
+    out = np.empty((2, 2, 100), dtype=np.float32)
+    data, mask = reader.read(out=out)
+
+    assert np.shares_memory(data.values, out)
+    np.testing.assert_array_equal(out, expected.values.astype(np.float32))
+
+
+@pytest.mark.parametrize('dtype', ['float32', 'native'])
+def test_dtype(local_eegfile, dtype):
+    kwargs = dict(dataroot=local_eegfile, channels=np.array([0, 3]), start_offsets=np.array([100]), read_size=100)
+    if dtype == 'native':
+        with pytest.raises(ValueError):
+            EDFRawReader(dtype=dtype, **kwargs)
+        return
+
+    expected, _ = EDFRawReader(**kwargs).read()
+    data, mask = EDFRawReader(dtype=dtype, **kwargs).read()
+    assert data.dtype == np.float32
+    np.testing.assert_array_equal(data.values, expected.values.astype(np.float32))
+
+
+def test_read_into_local(local_eegfile):
+    offsets = np.array([100, 1950, 1000])
+    reader = EDFRawReader(dataroot=local_eegfile, channels=np.array([]), start_offsets=offsets, read_size=100)
+    num_channels = reader.resolve_channels()
+    assert num_channels == len(reader.channels) == 37
+
+    expected, expected_mask = reader.read()
+    out = np.zeros((num_channels, 5, 100))
+    mask = reader.read_into(out, np.array([0, 1, 4]))
+
+    np.testing.assert_array_equal(mask, expected_mask)
+    np.testing.assert_array_equal(out[:, [0, 1, 4]], expected.values)
+    assert (out[:, [2, 3]] == 0).all()
+
+
+class TestHandleCache:
+    def setup_method(self):
+        EDFRawReader.close_all()
+
+    def teardown_method(self):
+        EDFRawReader.close_all()
+
+    def test_shared_handle(self, local_eegfile):
+        reader1 = EDFRawReader(dataroot=local_eegfile, channels=np.array([0]))
+        reader2 = EDFRawReader(dataroot=local_eegfile, channels=np.array([1]))
+        reader1.read()
+        reader2.read()
+
+        assert len(EDFRawReader._handles) == 1
+        handle = list(EDFRawReader._handles.values())[0]
+        assert handle.users == 0
+        assert not handle.closed
+
+    def test_context_manager(self, local_eegfile):
+        with EDFRawReader(dataroot=local_eegfile, channels=np.array([0])) as reader:
+            handle = reader._handle
+            assert handle.users == 1
+            data, mask = reader.read()
+            assert mask.all()
+        assert reader._handle is None
+        assert handle.users == 0
+
+        EDFRawReader.close_all()
+        assert handle.closed
+        assert len(EDFRawReader._handles) == 0
+
+        # closed files are transparently reopened
+        data2, _ = reader.read()
+        assert (data.values == data2.values).all()
+
+    def test_close_all_in_use(self, local_eegfile):
+        reader = EDFRawReader(dataroot=local_eegfile, channels=np.array([0]))
+        reader.open()
+        handle = reader._handle
+
+        # the file stays open for its user and is closed once released
+        EDFRawReader.close_all()
+        assert len(EDFRawReader._handles) == 0
+        assert not handle.closed
+        data, mask = reader.read()
+        assert mask.all()
+
+        reader.close()
+        assert handle.closed
+
+    def test_close_all_waits_for_read(self, local_eegfile):
+        reader = EDFRawReader(dataroot=local_eegfile, channels=np.array([0]))
+        handle = EDFRawReader._handles[osp.abspath(local_eegfile)]
+        closer = threading.Thread(target=EDFRawReader.close_all)
+        with handle.lock:
+            closer.start()
+            closer.join(0.2)
+            # the file is not closed while its lock is held, e.g. by a read
+            assert closer.is_alive()
+            assert not handle.closed
+        closer.join()
+        assert handle.closed
+
+    def test_max_cached_files(self, local_eegfile, tmpdir, monkeypatch):
+        monkeypatch.setattr(EDFRawReader, 'max_cached_files', 1)
+        other = str(tmpdir.join('copy.edf'))
+        with open(local_eegfile, 'rb') as src, open(other, 'wb') as dst:
+            dst.write(src.read())
+
+        first = EDFRawReader(dataroot=local_eegfile, channels=np.array([0]))
+        first.open()
+        EDFRawReader(dataroot=other, channels=np.array([0])).read()
+        # the pinned file stays open, the idle one beyond the limit is closed
+        assert list(EDFRawReader._handles.keys()) == [osp.abspath(local_eegfile)]
+
+        data, mask = first.read()
+        assert mask.all()
+        first.close()
+
+
 @skip_without_rhino
 class TestEDFReader:
 
@@ -1,9 +1,255 @@
+import os.path as osp
+
+import numpy as np
 from numpy.testing import assert_array_equal
 import pytest
 
+from ptsa.data.readers import BinaryRawReader, EEGReader
 from ptsa.test.utils import skip_without_rhino, get_rhino_root
 
 
+@pytest.fixture
+def local_events(tmpdir):
+    """Events spread (out of order) over three split-channel binary sessions."""
+    with open(str(tmpdir.join('params.txt')), 'w') as f:
+        f.write('samplerate 1000\ndataformat \'int16\'\ngain 2.0\n')
+
+    dataroots = []
+    for session in range(3):
+        dataroot = str(tmpdir.join('R1XXXX_FR1_%d' % session))
+        for c, channel in enumerate(['001', '002']):
+            data = (np.arange(2000) + 10000 * session + 3000 * c).astype('<i2')
+            data.tofile(dataroot + '.' + channel)
+        dataroots.append(dataroot)
+
+    eegfile = [dataroots[i] for i in [2, 0, 1, 0, 2, 1, 0]]
+    eegoffset = [100, 200, 300, 1990, 500, 600, 700]
+    return np.rec.fromarrays([np.array(eegfile), np.array(eegoffset)],
+                             names=['eegfile', 'eegoffset'])
+
+
+@pytest.mark.parametrize('num_workers', [1, 2, 8])
+def test_read_events_local(local_events, num_workers):
+    reader = EEGReader(events=local_events, channels=np.array(['001', '002']),
+                       start_time=0.0, end_time=0.05, num_workers=num_workers)
+    eeg = reader.read()
+
+    event_ok_mask = reader.get_event_ok_mask()
+    assert (event_ok_mask == [True, True, True, False, True, True, True]).all()
+    assert_array_equal(eeg['events'].values, local_events[event_ok_mask])
+    assert eeg.shape == (2, 6, 50)
+
+    for i, event in enumerate(local_events[event_ok_mask]):
+        session = int(event.eegfile[-1])
+        for c in range(2):
+            expected = 2.0 * (np.arange(event.eegoffset, event.eegoffset + 50) + 10000 * session + 3000 * c)
+            assert_array_equal(eeg.values[c, i], expected)
+
+
+@pytest.mark.parametrize('lazy', [False, True])
+@pytest.mark.parametrize('dtype', ['float32', 'native'])
+def test_read_events_dtype(local_events, dtype, lazy):
+    if lazy:
+        pytest.importorskip('dask')
+    kwargs = dict(events=local_events, channels=np.array(['001', '002']),
+                  start_time=0.0, end_time=0.05)
+    expected_reader = EEGReader(**kwargs)
+    expected = expected_reader.read()
+    eeg = EEGReader(dtype=dtype, **kwargs).read(lazy=lazy)
+    if lazy:
+        # lazy reads keep the bad events
+        eeg = eeg[:, expected_reader.get_event_ok_mask()]
+
+    assert eeg.dtype == (np.float32 if dtype == 'float32' else np.int16)
+    assert eeg.attrs['gain'] == 2.0
+    if dtype == 'native':
+        assert_array_equal(eeg.values * eeg.attrs['gain'], expected.values)
+    else:
+        assert_array_equal(eeg.values, expected.values)
+
+
+@pytest.mark.parametrize('num_workers', [1, 2])
+def test_read_events_direct(local_events, num_workers, monkeypatch):
+    """Every reader writes its events directly into a single output array allocated up front."""
+    # events grouped by session plus a session with interleaved events
+    events = local_events[[1, 3, 6, 2, 0, 5, 4]]
+    events.eegfile[4] = events.eegfile[0]
+    kwargs = dict(events=events, channels=np.array(['001', '002']),
+                  start_time=0.0, end_time=0.05, num_workers=num_workers)
+
+    outs = []
+    read_file = BinaryRawReader.read_file
+
+    def spy(self, *args, **kwargs):
+        outs.append(kwargs['out'])
+        return read_file(self, *args, **kwargs)
+
+    monkeypatch.setattr(BinaryRawReader, 'read_file', spy)
+    eeg = EEGReader(**kwargs).read()
+
+    assert len(outs) == 3
+    assert outs[0] is not None and all(out is outs[0] for out in outs)
+    assert outs[0].shape == (2, 7, 50)
+    assert_array_equal(eeg['events'].values, events[[0, 2, 3, 4, 5, 6]])
+    for i, event in enumerate(eeg['events'].values):
+        session = int(event.eegfile[-1])
+        for c in range(2):
+            expected = 2.0 * (np.arange(event.eegoffset, event.eegoffset + 50) + 10000 * session + 3000 * c)
+            assert_array_equal(eeg.values[c, i], expected)
+
+
+def test_read_events_out(local_events):
+    kwargs = dict(channels=np.array(['001', '002']), start_time=0.0, end_time=0.05)
+    expected_reader = EEGReader(events=local_events, **kwargs)
+    expected = expected_reader.read()
+    event_ok_mask = expected_reader.get_event_ok_mask()
+
+    # out has an entry for every event; the bad event is removed from a copy
+    out = np.empty((2, 7, 50), dtype=np.float32)
+    eeg = EEGReader(events=local_events, **kwargs).read(out=out)
+    assert not np.shares_memory(eeg.values, out)
+    assert_array_equal(eeg.values, expected.values)
+    assert_array_equal(out[:, event_ok_mask], expected.values)
+    assert_array_equal(eeg['events'].values, expected['events'].values)
+    assert eeg.attrs == expected.attrs
+
+    out = np.empty((2, 6, 50), dtype=np.float32)
+    eeg = EEGReader(events=local_events[event_ok_mask], **kwargs).read(out=out)
+    assert eeg.values is out
+    assert_array_equal(out, expected.values)
+
+    with pytest.raises(ValueError):
+        EEGReader(events=local_events, **kwargs).read(out=np.empty((2, 6, 50)))
+    with pytest.raises(ValueError):
+        EEGReader(events=local_events, **kwargs).read(out=np.empty((3, 7, 50)))
+
+
+@pytest.mark.parametrize('num_workers', [1, 2])
+@pytest.mark.parametrize('use_out', [False, True])
+def test_read_events_truncated_channel(local_events, num_workers, use_out):
+    """Events that cannot be read on any one channel are removed."""
+    dataroot = local_events[0].eegfile
+    (np.arange(1500) + 23000).astype('<i2').tofile(dataroot + '.002')
+    events = local_events[[1, 0, 2, 0, 0]]
+    events.eegoffset = [100, 100, 300, 1200, 1600]
+    reader = EEGReader(events=events, channels=np.array(['001', '002']), start_time=0.0, end_time=0.05,
+                       num_workers=num_workers)
+    out = np.empty((2, 5, 50)) if use_out else None
+    with pytest.warns(UserWarning):
+        eeg = reader.read(out=out)
+
+    assert eeg.shape == (2, 4, 50)
+    assert_array_equal(reader.get_event_ok_mask(), [True, True, True, True, False])
+    assert_array_equal(eeg['events'].values, events[:4])
+    assert_array_equal(eeg.values[:, 3], 2.0 * (np.arange(1200, 1250) + [[20000], [23000]]))
+
+
+def test_read_session_out(local_events):
+    dataroot = local_events[1].eegfile
+    reader = EEGReader(session_dataroot=dataroot, channels=np.array(['001', '002']))
+    out = np.empty((2, 1, 2000))
+    session = reader.read(out=out)
+    assert np.shares_memory(session.values, out)
+    assert_array_equal(out[1, 0], 2.0 * (np.arange(2000) + 3000))
+
+
+@pytest.mark.parametrize('chunks', [None, 2, (1, 2), (5, 100)])
+def test_read_events_lazy(local_events, chunks):
+    pytest.importorskip('dask')
+    kwargs = dict(events=local_events, channels=np.array(['001', '002']),
+                  start_time=-0.01, end_time=0.05, buffer_time=0.01)
+    eager_reader = EEGReader(**kwargs)
+    eager = eager_reader.read()
+    lazy_reader = EEGReader(**kwargs)
+    lazy = lazy_reader.read(lazy=True, chunks=chunks)
+
+    assert not isinstance(lazy.data, np.ndarray)
+    # bad events are kept (and NaN) since they are only known once read
+    assert lazy.shape == (2, 7, 80)
+    event_ok_mask = lazy_reader.get_event_ok_mask().compute()
+    assert_array_equal(event_ok_mask, eager_reader.get_event_ok_mask())
+    assert_array_equal(lazy['events'].values, local_events)
+    assert_array_equal(lazy['time'].values, eager['time'].values)
+    assert_array_equal(lazy['channels'].values, eager['channels'].values)
+    assert lazy.attrs == eager.attrs
+    values = lazy.values
+    assert_array_equal(values[:, event_ok_mask], eager.values)
+    assert np.isnan(values[:, ~event_ok_mask]).all()
+
+
+def test_read_events_lazy_no_io(local_events, monkeypatch):
+    """Building a lazy read does not read any data."""
+    pytest.importorskip('dask')
+    read_file = BinaryRawReader.read_file
+    calls = []
+
+    def spy(self, *args, **kwargs):
+        calls.append(self.dataroot)
+        return read_file(self, *args, **kwargs)
+
+    monkeypatch.setattr(BinaryRawReader, 'read_file', spy)
+    lazy = EEGReader(events=local_events, channels=np.array(['001', '002']), start_time=0.0, end_time=0.05,
+                     dtype='native').read(lazy=True)
+
+    assert calls == []
+    assert lazy.dtype == np.int16
+    assert lazy.values.dtype == np.int16
+    assert len(calls) == 3
+
+
+def test_read_lazy_session(local_events):
+    pytest.importorskip('dask')
+    reader = EEGReader(session_dataroot=local_events[0].eegfile, channels=np.array(['001']))
+    with pytest.raises(ValueError):
+        reader.read(lazy=True)
+
+
+def test_read_events_lazy_truncated_channel(local_events):
+    """Events that cannot be read on some channel are flagged; blocks with no readable event are not read."""
+    dask = pytest.importorskip('dask')
+    dataroot = local_events[0].eegfile
+    (np.arange(1500) + 23000).astype('<i2').tofile(dataroot + '.002')
+    events = np.rec.fromarrays([np.array([dataroot] * 4), np.array([100, 1200, 1600, 2500])],
+                               names=['eegfile', 'eegoffset'])
+    reader = EEGReader(events=events, channels=np.array(['001', '002']), start_time=0.0, end_time=0.05)
+    eeg = reader.read(lazy=True, chunks=(1, 2))
+
+    data, event_ok_mask = dask.compute(eeg.data, reader.get_event_ok_mask())
+    assert_array_equal(event_ok_mask, [True, True, False, False])
+    assert_array_equal(data[0, 2], 2.0 * np.arange(1600, 1650) + 2.0 * 20000)
+    assert np.isnan(data[1, 2:]).all() and np.isnan(data[0, 3]).all()
+    for i, offset in enumerate([100, 1200]):
+        assert_array_equal(data[:, i], 2.0 * (np.arange(offset, offset + 50) + [[20000], [23000]]))
+
+
+@pytest.mark.parametrize('window,overlap', [(0.5, 0.0), (0.3, 0.1), (0.7, 0.2), (5.0, 0.0)])
+def test_iter_session_local(local_events, window, overlap):
+    dataroot = local_events[1].eegfile
+    reader = EEGReader(session_dataroot=dataroot, channels=np.array(['001', '002']))
+    session = reader.read()
+    chunks = list(reader.iter_session(window, overlap))
+
+    step = int(round((window - overlap) * 1000))
+    size = int(round(window * 1000))
+    assert chunks[-1]['offsets'].values[-1] == 1999
+    for i, chunk in enumerate(chunks):
+        start = i * step
+        assert chunk.shape[:2] == (2, 1)
+        assert chunk.shape[2] == min(size, 2000 - start)
+        assert (chunk['start_offsets'].values == [start]).all()
+        assert_array_equal(chunk['offsets'].values, np.arange(start, start + chunk.shape[2]))
+        assert_array_equal(chunk['time'].values, session['time'].values[start:start + chunk.shape[2]])
+        assert_array_equal(chunk.values, session.values[..., start:start + chunk.shape[2]])
+
+
+def test_iter_session_local_edf():
+    dataroot = osp.join(osp.dirname(__file__), 'data', 'eeg.edf')
+    reader = EEGReader(session_dataroot=dataroot, channels=np.array([0, 5]))
+    session = reader.read()
+    chunks = list(reader.iter_session(window=3.0))
+    assert len(chunks) == 4
+    assert_array_equal(np.concatenate([chunk.values for chunk in chunks], axis=-1), session.values)
+
 
 @skip_without_rhino
 @pytest.mark.current
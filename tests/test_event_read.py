@@ -1,7 +1,9 @@
+import os
 import os.path as osp
 import json
 import numpy as np
 import pandas as pd
+import pytest
 
 from ptsa.data.readers import BaseEventReader
 
@@ -29,3 +31,98 @@ class TestBaseEventReader:
 
         with open(self.filename) as f:
             assert len(events) == len(json.loads(f.read()))
+
+    def test_from_dict_columnar(self, monkeypatch):
+        with open(self.filename) as f:
+            events = json.load(f)
+        # irregular entries are copied element by element
+        irregular = json.loads(json.dumps(events))
+        irregular[1]['eegoffset'] = float(irregular[1]['eegoffset'])
+
+        columnar = [BaseEventReader.from_dict(events), BaseEventReader.from_dict(irregular)]
+
+        def fail(*args, **kwargs):
+            raise ValueError
+
+        monkeypatch.setattr(BaseEventReader, 'copy_columns', classmethod(fail))
+        elementwise = [BaseEventReader.from_dict(events), BaseEventReader.from_dict(irregular)]
+
+        for a, b in zip(columnar, elementwise):
+            assert type(a) is type(b)
+            assert a.dtype == b.dtype
+            assert a.tobytes() == b.tobytes()
+
+    def test_from_dict_columnar_errors(self, monkeypatch):
+        events = [{'type': u'WORD', 'eegoffset': 1}, {'type': u'STIM', 'eegoffset': 2}]
+
+        def fail(*args, **kwargs):
+            raise KeyError('bug')
+
+        # only irregular input falls back to the elementwise copy; bugs are not hidden
+        monkeypatch.setattr(BaseEventReader, 'copy_columns', classmethod(fail))
+        with pytest.raises(KeyError):
+            BaseEventReader.from_dict(events)
+
+    def test_from_dict_lists(self):
+        events = [{'type': u'STIM', 'values': [1, 2], 'params': [{'amplitude': 1.5, 'anode': u'LA\xe91'}]},
+                  {'type': u'WORD', 'values': [], 'params': []},
+                  {'type': u'STIM', 'values': [3], 'params': [{'amplitude': 2.5, 'anode': u'LA2'}]}]
+        evs = BaseEventReader.from_dict(events)
+
+        assert (evs.type == ['STIM', 'WORD', 'STIM']).all()
+        assert evs['values'].tolist() == [[1, 2], [0, 0], [3, 0]]
+        # lists of at most one element are stored as scalars
+        assert evs.params.amplitude.tolist() == [1.5, 0, 2.5]
+        assert evs.params.anode.tolist() == ['LAe1', '', 'LA2']
+
+    def test_eegfile_post_processing(self):
+        eegfiles = ['/data3/eeg/R1XXXX/eeg.reref/R1XXXX_FR1_0', '', '/data/eeg/R1XXXX/eeg.reref/R1XXXX_FR1_1',
+                    '/data10/eeg/R1XXXX/eeg.reref/R1XXXX_FR1_0', 'abc']
+        evs = np.rec.fromarrays([np.array(eegfiles * 100, dtype='U256'), np.array(['R1XXXX'] * 500)],
+                                names=['eegfile', 'subject'])
+        ber = BaseEventReader(filename=self.filename)
+
+        assert (ber.has_eegfile(evs) == [True, False, True, True, False] * 100).all()
+
+        evs = ber.modify_eeg_path(ber.normalize_paths(evs))
+        assert evs.eegfile.tolist() == ['/data/eeg/R1XXXX/eeg.noreref/R1XXXX_FR1_0', '',
+                                        '/data/eeg/R1XXXX/eeg.noreref/R1XXXX_FR1_1',
+                                        '/data/eeg/R1XXXX/eeg.noreref/R1XXXX_FR1_0', 'abc'] * 100
+
+    def test_cache(self, tmpdir, monkeypatch):
+        filename = str(tmpdir.join('task_events.json'))
+        with open(self.filename) as src, open(filename, 'w') as dst:
+            dst.write(src.read())
+        cache_dir = str(tmpdir.join('cache'))
+
+        expected = BaseEventReader(filename=filename).read()
+        events = BaseEventReader(filename=filename, cache_dir=cache_dir).read()
+        assert len(os.listdir(cache_dir)) == 1
+
+        def fail(*args, **kwargs):
+            raise AssertionError('event file parsed')
+
+        monkeypatch.setattr(BaseEventReader, 'read_json', fail)
+        cached = BaseEventReader(filename=filename, cache_dir=cache_dir).read()
+        for evs in events, cached:
+            assert isinstance(evs, np.recarray)
+            assert evs.dtype == expected.dtype
+            assert evs.tobytes() == expected.tobytes()
+        monkeypatch.undo()
+
+        # different settings use a different cache file
+        BaseEventReader(filename=filename, cache_dir=cache_dir, eliminate_nans=False).read()
+        assert len(os.listdir(cache_dir)) == 2
+
+        # modifying the event file invalidates the cache
+        stat = os.stat(filename)
+        os.utime(filename, (stat.st_atime, stat.st_mtime + 10))
+        BaseEventReader(filename=filename, cache_dir=cache_dir).read()
+        assert len(os.listdir(cache_dir)) == 3
+
+    def test_cache_unwritable(self, tmpdir):
+        cache_dir = tmpdir.join('cache')
+        cache_dir.write('not a directory')
+        with pytest.warns(RuntimeWarning):
+            events = BaseEventReader(filename=self.filename, cache_dir=str(cache_dir)).read()
+        assert len(events)
@@ -13,6 +13,155 @@ from ptsa.data.readers import EEGReader
 from ptsa.test.utils import get_rhino_root, skip_without_rhino
 
 
+@pytest.fixture(params=['row', 'col'])
+def local_h5file(request, tmpdir):
+    """Small monopolar HDF5 recording stored in either orientation."""
+    data = np.arange(4 * 2000, dtype=float).reshape(4, 2000)
+    filename = str(tmpdir.join('eeg_timeseries.h5'))
+    with h5py.File(filename, 'w') as hfile:
+        if request.param == 'row':
+            dset = hfile.create_dataset('timeseries', data=data.T)
+            dset.attrs['orient'] = b'row'
+        else:
+            hfile.create_dataset('timeseries', data=data)
+        hfile.create_dataset('ports', data=np.arange(1, 5))
+    with open(str(tmpdir.join('params.txt')), 'w') as f:
+        f.write('samplerate 1000\ngain 1.0\n')
+    return filename, data
+
+
+@pytest.mark.parametrize('max_block_size', [2 ** 24, 1])
+def test_read_h5file_local(local_h5file, max_block_size, monkeypatch):
+    filename, data = local_h5file
+    monkeypatch.setattr(H5RawReader, 'max_block_size', max_block_size)
+    channels = np.array(['002', '004'])
+    offsets = np.array([1500, 0, -1, 1990, 500])
+    with h5py.File(filename, 'r') as hfile:
+        h5_data, h5_mask = H5RawReader.read_h5file(hfile, channels, offsets, 100)
+
+    assert h5_data.shape == (2, 5, 100)
+    assert (h5_mask == [[True, True, False, False, True]] * 2).all()
+    for i, offset in enumerate(offsets):
+        if h5_mask[0, i]:
+            assert (h5_data[:, i] == data[[1, 3], offset:offset + 100]).all()
+        else:
+            assert np.isnan(h5_data[:, i]).all()
+
+
+@pytest.mark.parametrize('dtype', [None, 'float32', 'native'])
+def test_read_h5file_dtype(local_h5file, dtype):
+    filename, data = local_h5file
+    with h5py.File(filename, 'r') as hfile:
+        h5_data, h5_mask = H5RawReader.read_h5file(hfile, np.array(['001']), np.array([0, 1990]), 100, dtype)
+
+    assert h5_data.dtype == (np.float32 if dtype == 'float32' else np.float64)
+    assert (h5_mask == [[True, False]]).all()
+    assert (h5_data[0, 0] == data[0, :100]).all()
+    assert np.isnan(h5_data[0, 1]).all()
+
+
+@pytest.mark.parametrize('read_size', [-1, 100])
+def test_read_h5file_out(local_h5file, read_size):
+    filename, data = local_h5file
+    offsets = np.array([0, 1990]) if read_size > 0 else np.array([0])
+    out = np.empty((2, len(offsets), 100 if read_size > 0 else 2000), dtype=np.float32)
+    with h5py.File(filename, 'r') as hfile:
+        h5_data, h5_mask = H5RawReader.read_h5file(hfile, np.array(['001', '003']), offsets, read_size, out=out)
+
+    assert h5_data is out
+    assert (out[:, 0] == data[[0, 2], :out.shape[-1]]).all()
+    if read_size > 0:
+        assert not h5_mask[:, 1].any()
+        assert np.isnan(out[:, 1]).all()
+
+
+
+def test_read_into_local(local_h5file):
+    filename, data = local_h5file
+    reader = H5RawReader(dataroot=filename, channels=np.array([]), start_offsets=np.array([0, 1990, 500]),
+                         read_size=100)
+    assert reader.resolve_channels() == 4
+    assert (reader.channels == [b'001', b'002', b'003', b'004']).all()
+    assert reader.get_native_dtype() == np.float64
+
+    out = np.full((4, 6, 100), -1.0)
+    mask = reader.read_into(out, np.array([0, 2, 5]))
+
+    assert (mask == [[True, False, True]] * 4).all()
+    assert (out[:, 0] == data[:, :100]).all()
+    assert np.isnan(out[:, 2]).all()
+    assert (out[:, 5] == data[:, 500:600]).all()
+    assert (out[:, [1, 3, 4]] == -1).all()
+
+
+@pytest.mark.parametrize('orient', ['row', 'col'])
+def test_read_h5file_spaced_channels(tmpdir, orient, monkeypatch):
+    """Widely spaced channels are read as separate hyperslabs."""
+    data = np.arange(30 * 500, dtype=float).reshape(30, 500)
+    filename = str(tmpdir.join('eeg_timeseries.h5'))
+    with h5py.File(filename, 'w') as hfile:
+        if orient == 'row':
+            hfile.create_dataset('timeseries', data=data.T).attrs['orient'] = b'row'
+        else:
+            hfile.create_dataset('timeseries', data=data)
+        hfile.create_dataset('ports', data=np.arange(1, 31))
+
+    assert H5RawReader.plan_channel_runs(np.array([0, 1, 4, 29])) == [(0, 5), (29, 30)]
+    assert H5RawReader.plan_channel_runs(np.array([0, 1, 4, 29]), max_gap=0) == [(0, 2), (4, 5), (29, 30)]
+
+    read_sizes = []
+    getitem = h5py.Dataset.__getitem__
+
+    def wrapper(self, args):
+        block = getitem(self, args)
+        if self.name == '/timeseries':
+            read_sizes.append(block.size)
+        return block
+
+    monkeypatch.setattr(h5py.Dataset, '__getitem__', wrapper)
+    channels = np.array(['002', '030', '001'])
+    offsets = np.array([100, 10, 480])
+    with h5py.File(filename, 'r') as hfile:
+        h5_data, h5_mask = H5RawReader.read_h5file(hfile, channels, offsets, 50)
+
+    assert sum(read_sizes) == 3 * (150 - 10)
+    assert (h5_mask == [[True, True, False]] * 3).all()
+    for i, offset in enumerate(offsets[:2]):
+        assert (h5_data[:, i] == data[[0, 1, 29], offset:offset + 50]).all()
+
+def test_h5reader_local(local_h5file):
+    filename, data = local_h5file
+    eeg, mask = H5RawReader(dataroot=filename, channels=np.array(['001', '003']),
+                            start_offsets=np.array([10, 20]), read_size=50).read()
+    assert mask.all()
+    assert (eeg.values[1, 1] == data[2, 20:70]).all()
+
+
+def test_iter_session_local(local_h5file):
+    filename, data = local_h5file
+    assert H5RawReader(dataroot=filename, channels=np.array(['001'])).get_num_samples() == 2000
+
+    reader = EEGReader(session_dataroot=filename, channels=np.array(['001', '004']))
+    chunks = list(reader.iter_session(window=0.75, overlap=0.25))
+    assert [int(chunk['start_offsets']) for chunk in chunks] == [0, 500, 1000, 1500]
+    assert (chunks[-1].values[:, 0] == data[[0, 3], 1500:]).all()
+
+
+
+def test_lazy_read_local(local_h5file):
+    """Lazy blocks without a readable event are NaN instead of failing the whole compute."""
+    pytest.importorskip('dask')
+    filename, data = local_h5file
+    events = np.rec.fromarrays([np.array([filename] * 3), np.array([10, 1990, 1995])],
+                               names=['eegfile', 'eegoffset'])
+    reader = EEGReader(events=events, channels=np.array(['001', '003']), start_time=0.0, end_time=0.05)
+    eeg = reader.read(lazy=True, chunks=1)
+
+    assert (reader.get_event_ok_mask().compute() == [True, False, False]).all()
+    values = eeg.values
+    assert (values[:, 0] == data[[0, 2], 10:60]).all()
+    assert np.isnan(values[:, 1:]).all()
+
 @skip_without_rhino
 class TestH5Reader:
     @classmethod
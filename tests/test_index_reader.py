@@ -1,3 +1,5 @@
+import json
+import os
 import os.path as osp
 import pytest
 from ptsa.data.readers.index import JsonIndexReader
@@ -46,3 +48,79 @@ class TestJsonIndexReader:
             assert len(sessions) == 4
         else:
             assert len(df[(df.subject == 'R1111M') & (df.experiment == 'FR1')]) == 4
+
+    @pytest.mark.parametrize('field,kwargs', [
+        ('subjects', {}),
+        ('subjects', {'experiment': 'FR1', 'session': 0}),
+        ('experiments', {'subject': 'R1111M'}),
+        ('sessions', {'subject': 'R1111M', 'experiment': 'FR1', 'localization': 0}),
+        ('montage', {'subject': 'R1286J'}),
+        ('localization', {'experiment': 'PAL1'}),
+        ('system_version', {'montage': 0}),
+        ('task_events', {'subject': 'R1111M', 'experiment': 'FR1', 'session': '2'}),
+        ('protocols', {'subject': 'R0000X'}),
+        ('subjects', {'experiment': 'FR1', 'nonexistent': 1}),
+    ])
+    def test_query_matches_tree(self, reader, field, kwargs):
+        assert reader._get_table() is not None
+        assert reader.aggregate_values(field, **kwargs) == reader._aggregate_values(reader.index, field, **kwargs)
+
+    def test_get_value(self, reader):
+        task_events = reader.get_value('task_events', subject='R1111M', experiment='FR1', session=0)
+        assert task_events.endswith('task_events.json')
+        with pytest.raises(ValueError):
+            reader.get_value('task_events', subject='R1111M', experiment='FR1')
+
+    def test_as_dataframe_keeps_index(self, reader):
+        reader.as_dataframe()
+        assert reader.aggregate_values('subject') == set()
+
+    def test_irregular_index(self, reader):
+        # leaf fields above the session level cannot be flattened
+        reader.index['protocols']['r1']['subjects']['R1111M']['age'] = 30
+        assert reader._get_table() is None
+        assert reader.experiments(subject='R1111M') == ['FR1', 'FR2', 'PAL1', 'PAL2', 'PS2', 'catFR1']
+        assert len(reader.montages(subject='R1286J')) == 1
+
+
+def test_snapshot(tmpdir, monkeypatch):
+    index_file = str(tmpdir.join('r1.json'))
+    with open(osp.join(osp.dirname(__file__), 'data', 'r1.json')) as src, open(index_file, 'w') as dst:
+        dst.write(src.read())
+    cache_dir = str(tmpdir.join('cache'))
+
+    reader = JsonIndexReader(index_file, cache_dir=cache_dir)
+    assert len(os.listdir(cache_dir)) == 1
+
+    def fail(*args, **kwargs):
+        raise AssertionError('index file parsed')
+
+    monkeypatch.setattr(JsonIndexReader, '_prepend_db_root', classmethod(fail))
+    cached = JsonIndexReader(index_file, cache_dir=cache_dir)
+    assert cached.index == reader.index
+    assert cached.experiments(subject='R1111M') == reader.experiments(subject='R1111M')
+    assert cached.montages(subject='R1286J') == reader.montages(subject='R1286J')
+    monkeypatch.undo()
+
+    # modifying the index file invalidates the snapshot
+    stat = os.stat(index_file)
+    os.utime(index_file, (stat.st_atime, stat.st_mtime + 10))
+    JsonIndexReader(index_file, cache_dir=cache_dir)
+    assert len(os.listdir(cache_dir)) == 2
+
+
+def test_snapshot_path_prefix(tmpdir, monkeypatch):
+    """Paths in the index are prefixed with the directory of the index file as it was passed in."""
+    protocols = tmpdir.mkdir('protocols')
+    index = {'protocols': {'r1': {'subjects': {'R1001P': {'experiments': {'FR1': {'sessions': {'0': {
+        'task_events': 'protocols/r1/subjects/R1001P/task_events.json'}}}}}}}}}
+    protocols.join('r1.json').write(json.dumps(index))
+    cache_dir = str(tmpdir.join('cache'))
+
+    absolute = JsonIndexReader(str(protocols.join('r1.json')), cache_dir=cache_dir)
+    monkeypatch.chdir(str(tmpdir))
+    relative = JsonIndexReader(osp.join('protocols', 'r1.json'), cache_dir=cache_dir)
+
+    assert absolute.get_value('task_events') == str(protocols.join('r1', 'subjects', 'R1001P', 'task_events.json'))
+    assert relative.get_value('task_events') == osp.join('protocols', 'r1', 'subjects', 'R1001P', 'task_events.json')
+    assert len(os.listdir(cache_dir)) == 2
@@ -1,6 +1,8 @@
 from ptsa.data.readers import LocReader
 import os.path as osp
+import numpy as np
 import pandas as pd
+import pytest
 
 class TestLocReader:
 
@@ -19,4 +21,63 @@ class TestLocReader:
         assert pd.isnull(contacts['type']).sum() == 0
 
         pairs = self.localization.loc['pairs']
-        assert pd.isnull(pairs['type']).sum() == 0
\ No newline at end of file
+        assert pd.isnull(pairs['type']).sum() == 0
+
+    def test_columns(self):
+        loc_file = osp.join(osp.dirname(__file__), 'data', 'localization.json')
+        columns = ['atlases.dk', 'type', 'coordinate_spaces.fs.raw', 'lead_group']
+        subset = LocReader(filename=loc_file, columns=columns).read()
+        pd.testing.assert_frame_equal(subset, self.localization[columns])
+
+    def test_flatten_entry(self):
+        entry = {'atlases': {'dk': 'a', 'extra': {'x': 1}}, 'name': 'LA1', 'info': {}, 'lead_loc': [1, 1],
+                 'type': 'D'}
+        row = LocReader.flatten_entry(entry)
+        assert list(row.items()) == [('name', 'LA1'), ('lead_loc', [1, 1]), ('type', 'D'),
+                                     ('atlases.dk', 'a'), ('atlases.extra.x', 1)]
+
+
+def test_cache(tmpdir, monkeypatch):
+    loc_file = str(tmpdir.join('localization.json'))
+    with open(osp.join(osp.dirname(__file__), 'data', 'localization.json')) as src, open(loc_file, 'w') as dst:
+        dst.write(src.read())
+    cache_dir = str(tmpdir.join('cache'))
+
+    expected = LocReader(filename=loc_file).read()
+    LocReader(filename=loc_file, cache_dir=cache_dir).read()
+
+    def fail(*args, **kwargs):
+        raise AssertionError('localization file parsed')
+
+    monkeypatch.setattr(LocReader, 'read_localization', fail)
+    pd.testing.assert_frame_equal(LocReader(filename=loc_file, cache_dir=cache_dir).read(), expected)
+    monkeypatch.undo()
+
+    LocReader(filename=loc_file, columns=['type'], cache_dir=cache_dir).read()
+    assert len(tmpdir.join('cache').listdir()) == 2
+
+    # the cache holds no pickles
+    for cache_file in tmpdir.join('cache').listdir():
+        with np.load(str(cache_file), allow_pickle=False) as cache:
+            for name in cache.files:
+                cache[name]
+
+    # a file with a cache is not parsed until the cache turns out to be unreadable
+    monkeypatch.setattr(LocReader, '_load_json', fail)
+    reader = LocReader(filename=loc_file, cache_dir=cache_dir)
+    for cache_file in tmpdir.join('cache').listdir():
+        cache_file.write('corrupt')
+    with pytest.raises(AssertionError):
+        reader.read()
+
+
+def test_invalid_file(tmpdir):
+    with pytest.raises(EnvironmentError):
+        LocReader(filename=str(tmpdir.join('missing.json')))
+    with pytest.raises(EnvironmentError):
+        LocReader(filename=str(tmpdir.join('missing.json')), cache_dir=str(tmpdir.join('cache')))
+
+    loc_file = tmpdir.join('localization.json')
+    loc_file.write('{"leads": ')
+    with pytest.raises(ValueError):
+        LocReader(filename=str(loc_file), cache_dir=str(tmpdir.join('cache')))
@@ -1,6 +1,8 @@
 from ptsa.data import MatlabIO
 import os.path as osp
+import numpy as np
 import pytest
+from scipy.io import savemat
 
 @pytest.fixture
 def filename():
@@ -11,3 +13,32 @@ def test_read_matlab_struct(filename):
     assert len(events.squeeze()) == 191
     assert events.list.max() == 1
 
+
+
+def test_read_large_struct(tmpdir):
+    n = 500
+    events = np.zeros(n, dtype=[('subject', 'O'), ('mstime', 'O'), ('late', 'O'), ('channels', 'O'),
+                                ('tag', 'O'), ('stim', 'O')])
+    for i in range(n):
+        events[i]['subject'] = 'R1%03dM' % (i % 7)
+        events[i]['mstime'] = float(i) + 0.5 if i % 3 else i
+        # changes type after the sampled records
+        events[i]['late'] = 1.5 if i == n - 1 else i
+        events[i]['channels'] = np.arange(3) + i
+        events[i]['tag'] = np.array([]) if i % 4 == 0 else 'LA%d' % i
+        stim = np.zeros(1, dtype=[('amplitude', 'O')])
+        stim[0]['amplitude'] = i * 0.25
+        events[i]['stim'] = stim
+    filename = str(tmpdir.join('events.mat'))
+    savemat(filename, {'events': events})
+
+    evs = MatlabIO.read_single_matlab_matrix_as_numpy_structured_array(filename, 'events')
+    assert isinstance(evs, np.recarray)
+    assert evs.subject.tolist() == ['R1%03dM' % (i % 7) for i in range(n)]
+    assert evs.mstime.dtype == np.float64
+    assert (evs.mstime == [float(i) + 0.5 if i % 3 else i for i in range(n)]).all()
+    assert evs.late.dtype == np.float64
+    assert (evs.late[:-1] == np.arange(n - 1)).all() and evs.late[-1] == 1.5
+    assert (evs.channels == np.arange(3) + np.arange(n)[:, None]).all()
+    assert evs.tag.tolist() == ['' if i % 4 == 0 else 'LA%d' % i for i in range(n)]
+    assert (evs.stim.amplitude == np.arange(n) * 0.25).all()
@@ -0,0 +1,77 @@
+import json
+import os
+
+import pytest
+
+from ptsa.data.readers import ParamsReader
+
+
+@pytest.fixture(autouse=True)
+def clear_cache():
+    ParamsReader.clear_cache()
+    yield
+    ParamsReader.clear_cache()
+
+
+def count_parses(monkeypatch, name):
+    calls = []
+    parse = getattr(ParamsReader, name)
+
+    def wrapper(*args):
+        calls.append(args[-1])
+        return parse(*args)
+
+    monkeypatch.setattr(ParamsReader, name, wrapper if name == 'parse_txt' else staticmethod(wrapper))
+    return calls
+
+
+def test_sources_json_parsed_once(tmpdir, monkeypatch):
+    sources = {'R1XXXX_FR1_%d' % i: {'sample_rate': 1000 + i, 'data_format': 'int16'} for i in range(20)}
+    with open(str(tmpdir.join('sources.json')), 'w') as f:
+        json.dump(sources, f)
+    calls = count_parses(monkeypatch, 'parse_json')
+
+    for i in range(20):
+        params = ParamsReader(dataroot=str(tmpdir.join('R1XXXX_FR1_%d' % i))).read()
+        assert params == {'samplerate': 1000 + i, 'gain': 1, 'format': 'int16', 'dataformat': 'int16'}
+    assert len(calls) == 1
+
+
+def test_params_txt_invalidation(tmpdir, monkeypatch):
+    filename = str(tmpdir.join('params.txt'))
+    with open(filename, 'w') as f:
+        f.write('samplerate 500\ngain 0.5\n')
+    calls = count_parses(monkeypatch, 'parse_txt')
+
+    params = ParamsReader(filename=filename).read()
+    assert params == {'samplerate': 500.0, 'gain': 0.5}
+    # results are copies of the cached params
+    params['gain'] = 10
+    assert ParamsReader(dataroot=str(tmpdir.join('R1XXXX_FR1_0'))).read() == {'samplerate': 500.0, 'gain': 0.5}
+    assert len(calls) == 1
+
+    with open(filename, 'w') as f:
+        f.write('samplerate 1000\n')
+    stat = os.stat(filename)
+    os.utime(filename, (stat.st_atime, stat.st_mtime + 10))
+    with pytest.warns(RuntimeWarning):
+        assert ParamsReader(filename=filename).read() == {'samplerate': 1000.0, 'gain': 1.0}
+    assert len(calls) == 2
+
+
+def test_cache_size(tmpdir, monkeypatch):
+    monkeypatch.setattr(ParamsReader, 'max_cached_files', 2)
+    filenames = []
+    for i in range(3):
+        filenames.append(str(tmpdir.join('params%d.txt' % i)))
+        with open(filenames[-1], 'w') as f:
+            f.write('samplerate %d\ngain 1\n' % i)
+    calls = count_parses(monkeypatch, 'parse_txt')
+
+    for filename in filenames + filenames[-1:]:
+        ParamsReader(filename=filename).read()
+    assert len(calls) == 3
+    assert len(ParamsReader._cache) == 2
+
+    ParamsReader(filename=filenames[0]).read()
+    assert len(calls) == 4
@@ -0,0 +1,60 @@
+import numpy as np
+import pytest
+
+from ptsa.data.readers import BaseRawReader
+
+
+@pytest.mark.parametrize('source_offset', [0, 100])
+def test_gather_epochs(source_offset):
+    source = np.arange(3 * 500, dtype=float).reshape(3, 500)
+    offsets = np.array([100, 550, 100, 90, 590, -1, 600])
+    eventdata = np.full((3, len(offsets), 10), np.nan)
+
+    mask = BaseRawReader.gather_epochs(source, offsets, 10, eventdata,
+                                       source_offset=source_offset,
+                                       num_samples=1000)
+
+    assert (mask == [True, True, True, True, True, False, True]).all()
+    for i, offset in enumerate(offsets):
+        local = offset - source_offset
+        if mask[i] and 0 <= local and local + 10 <= 500:
+            assert (eventdata[:, i] == source[:, local:local + 10]).all()
+        else:
+            assert np.isnan(eventdata[:, i]).all()
+
+
+def test_gather_epochs_1d_memmap(tmpdir):
+    filename = str(tmpdir.join('data.bin'))
+    np.arange(100, dtype='<i2').tofile(filename)
+    source = np.memmap(filename, dtype='<i2', mode='r')
+    eventdata = np.full((3, 5), np.nan)
+
+    mask = BaseRawReader.gather_epochs(source, [0, 95, 96], 5, eventdata)
+
+    assert (mask == [True, True, False]).all()
+    assert (eventdata[0] == np.arange(5)).all()
+    assert (eventdata[1] == np.arange(95, 100)).all()
+    assert np.isnan(eventdata[2]).all()
+
+
+def test_plan_read_blocks(monkeypatch):
+    offsets = np.array([0, 50, -5, 990, 200])
+    assert BaseRawReader.plan_read_blocks(offsets, 20, 1000) == [(0, 220)]
+    assert BaseRawReader.plan_read_blocks(offsets, 20, 1000, max_gap=30) == [(0, 70), (200, 220)]
+    assert BaseRawReader.plan_read_blocks(offsets, 20, 1000, max_gap=0) == [(0, 20), (50, 70), (200, 220)]
+    assert BaseRawReader.plan_read_blocks(np.array([30, 0, 10, 30]), 20, 1000, max_gap=0) == [(0, 50)]
+    assert BaseRawReader.plan_read_blocks(np.array([-1]), 20, 1000) == []
+
+    monkeypatch.setattr(BaseRawReader, 'max_block_size', 200)
+    assert BaseRawReader.plan_read_blocks(offsets, 20, 1000) == [(0, 70), (200, 220)]
+    assert BaseRawReader.plan_read_blocks(offsets, 20, 1000, num_channels=4) == [(0, 20), (50, 70), (200, 220)]
+
+
+def test_abstract_methods():
+    class Reader(BaseRawReader):
+        def read_file(self, filename, channels, start_offsets=np.array([0]), read_size=-1, out=None,
+                      positions=None):
+            pass
+
+    with pytest.raises(TypeError):
+        Reader(dataroot='dataroot')
@@ -1,6 +1,8 @@
 from ptsa.data.readers import TalReader
 from ptsa.data.readers.index import JsonIndexReader
+import json
 import numpy as np
+import pandas as pd
 import os.path as osp
 from ptsa.test import utils
 import pytest
@@ -873,3 +875,110 @@ def test_with_version_no():
     fname = osp.join(osp.dirname(__file__),'data','pairs.json')
     tal_reader =TalReader(filename=fname)
     tal_reader.read()
+
+
+def test_from_records():
+    records = [{'code': 'A1', 'channel': 1, 'atlases': {'avg': {'x': 1.5, 'region': 'left'}}},
+               None,
+               {'code': 'A3', 'atlases': {'avg': None, 'ind': {'x': 2}}, 'channel': 3, 'flag': True},
+               {'code': 'A4', 'channel': 4, 'atlases': {'avg': {'x': None, 'region': None}}}]
+    arr = TalReader.from_records(records)
+
+    # value fields come first, each level in the order pandas gives the keys (order of first appearance)
+    assert arr.dtype.names == ('code', 'channel', 'flag', 'atlases')
+    assert arr.atlases.dtype.names == ('avg', 'ind')
+    assert arr.atlases.avg.dtype.names == ('x', 'region')
+    assert arr.code.tolist() == ['A1', 'nan', 'A3', 'A4']
+    assert arr.channel.dtype == np.float64
+    assert np.isnan(arr.channel[1])
+    assert arr.flag.tolist() == ['nan', 'nan', 'True', 'nan']
+    assert np.isnan(arr.atlases.avg.x[1:]).all() and arr.atlases.avg.x[0] == 1.5
+    assert arr.atlases.avg.region.tolist() == ['left', 'nan', 'nan', 'None']
+    assert arr.atlases.ind.x[2] == 2
+
+    with pytest.raises(ValueError):
+        TalReader.from_records([{'atlases': {'avg': 1}}, {'atlases': 'none'}])
+
+
+def _from_records_reference(contact_dict):
+    """The recursive implementation of TalReader.from_records used before the records were flattened."""
+    contact_df = pd.DataFrame.from_records([x if not pd.isnull(x) else {} for x in contact_dict])
+    dict_cols = [col for col in contact_df.columns if any(isinstance(val, dict) for val in contact_df[col])]
+    flat_cols = [col for col in contact_df.columns if not col in dict_cols]
+    flat_df = contact_df[flat_cols]
+    dtype = TalReader.mkdtype(flat_df)
+
+    nested_arrs = [_from_records_reference(contact_df[col]) for col in dict_cols]
+    nested_dtypes = [np.dtype([(str(col), x.dtype)]) for col, x in zip(dict_cols, nested_arrs)]
+    new_dtype = TalReader.merge_dtypes(dtype, *nested_dtypes)
+    new_arr = np.empty(len(contact_df), dtype=new_dtype)
+    for col in flat_cols:
+        new_arr[col] = flat_df[col].values
+    for (i, col) in enumerate(dict_cols):
+        new_arr[col] = nested_arrs[i]
+    return np.rec.array(new_arr)
+
+
+def _assert_records_equal(actual, expected):
+    assert actual.dtype == expected.dtype
+    for name in expected.dtype.names:
+        if expected.dtype[name].names:
+            _assert_records_equal(actual[name], expected[name])
+        else:
+            np.testing.assert_array_equal(actual[name], expected[name])
+
+
+@pytest.mark.parametrize('sort_columns', [False, True])
+def test_from_records_matches_reference(monkeypatch, sort_columns):
+    """Fields are ordered as pandas orders the columns of the records, e.g. sorted by older versions."""
+    if sort_columns:
+        from_records = pd.DataFrame.from_records
+
+        def sorted_from_records(cls, data, **kwargs):
+            df = from_records(data, **kwargs)
+            return df if 'columns' in kwargs else df[sorted(df.columns)]
+
+        monkeypatch.setattr(pd.DataFrame, 'from_records', classmethod(sorted_from_records))
+
+    with open(osp.join(osp.dirname(__file__), 'data', 'pairs.json')) as f:
+        pairs = json.load(f)
+    subject = [k for k in pairs if k not in ['version', 'info', 'meta']][0]
+    montage = list(pairs[subject]['pairs'].values())
+    montage[1] = None
+    montage[2] = dict(montage[2], atlases=dict(montage[2]['atlases'], extra={'b': 1, 'a': 'x'}))
+
+    _assert_records_equal(TalReader.from_records(montage), _from_records_reference(montage))
+
+
+def test_bipolar_pairs():
+    reader = TalReader(filename=osp.join(osp.dirname(__file__), 'data', 'pairs.json'))
+    pairs = reader.get_bipolar_pairs()
+    channels = reader.tal_struct_array.channel
+    assert pairs.dtype == np.dtype([('ch0', '|S3'), ('ch1', '|S3')])
+    assert pairs.ch0.tolist() == [('%03d' % c).encode() for c in channels[:, 0]]
+    assert pairs.ch1.tolist() == [('%03d' % c).encode() for c in channels[:, 1]]
+
+
+def test_cache(tmpdir, monkeypatch):
+    fname = str(tmpdir.join('pairs.json'))
+    with open(osp.join(osp.dirname(__file__), 'data', 'pairs.json')) as src, open(fname, 'w') as dst:
+        dst.write(src.read())
+    cache_dir = str(tmpdir.join('cache'))
+
+    expected = TalReader(filename=fname).read()
+    TalReader(filename=fname, cache_dir=cache_dir).read()
+
+    def fail(*args, **kwargs):
+        raise AssertionError('pairs file parsed')
+
+    monkeypatch.setattr(TalReader, 'from_dict', fail)
+    reader = TalReader(filename=fname, cache_dir=cache_dir)
+    pairs = reader.read()
+    assert pairs.dtype == expected.dtype
+    assert pairs.tobytes() == expected.tobytes()
+    assert reader.get_bipolar_pairs().ch0[0] == b'001'
+    monkeypatch.undo()
+
+    # unpacked atlases hold python objects and are never cached
+    TalReader(filename=fname, cache_dir=cache_dir, unpack=False).read()
+    assert len(tmpdir.join('cache').listdir()) == 1
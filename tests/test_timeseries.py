@@ -1,4 +1,5 @@
 from tempfile import mkdtemp
+import json
 import os.path as osp
 import shutil
 import warnings
@@ -151,6 +152,169 @@ def test_hdf(tempdir):
     assert loaded.name == "container test"
 
 
+def test_hdf_chunks():
+    data = np.zeros((4, 500, 1000))
+    ts = TimeSeries.create(data, 1000., dims=('channels', 'events', 'time'))
+    assert ts.hdf_chunks() == (1, 131, 1000)
+    assert ts.hdf_chunks(chunk_bytes=8000) == (1, 1, 1000)
+    assert ts.hdf_chunks(chunk_bytes=4000) == (1, 1, 500)
+    assert ts.transpose('time', 'events', 'channels').hdf_chunks() == (1000, 131, 1)
+
+    ts = TimeSeries.create(data, 1000., dims=('x', 'y', 'z'))
+    assert ts.hdf_chunks() == (1, 131, 1000)
+
+    assert TimeSeries.create(np.zeros((0, 5)), 1.).hdf_chunks() is None
+    assert TimeSeries.create(np.array(1.), 1.).hdf_chunks() is None
+
+
+@pytest.mark.parametrize("kwargs", [
+    {},
+    {'compression': 'gzip', 'compression_opts': 4, 'shuffle': True},
+    {'compression': 'lzf'},
+    {'chunks': (2, 1, 10)},
+])
+def test_hdf_layout(tempdir, kwargs):
+    events = np.zeros(3, dtype=[('eegoffset', int), ('type', 'U4'),
+                                ('stim_params', [('amplitude', float),
+                                                 ('anode_label', 'U8')])])
+    events['eegoffset'] = [10, 20, 30]
+    events['type'] = ['WORD', 'RÉC', '']
+    events['stim_params']['anode_label'] = ['LA1', 'ÄB', '']
+    ts = TimeSeries.create(
+        np.random.random((2, 3, 10)), 1000.,
+        coords={'channels': np.array(['001', '002']),
+                'events': events.view(np.recarray),
+                'time': np.arange(10) / 1000.,
+                'label': ('events', np.array(['a', 'b', 'c'], dtype=object))},
+        dims=('channels', 'events', 'time'))
+
+    filename = osp.join(tempdir, "timeseries.h5")
+    ts.to_hdf(filename, **kwargs)
+
+    with h5py.File(filename, 'r') as hfile:
+        dset = hfile['data']
+        assert dset.chunks == kwargs.get('chunks', (1, 3, 10))
+        assert dset.compression == kwargs.get('compression')
+        assert dset.shuffle == kwargs.get('shuffle', False)
+        # coordinates are native datasets; strings are stored as utf-8
+        assert hfile['coords/time'].dtype == np.float64
+        assert hfile['coords/channels'][0] == b'001'
+        assert hfile['coords/events']['type'][1] == 'RÉC'.encode()
+
+    loaded = TimeSeries.from_hdf(filename)
+    assert (loaded.values == ts.values).all()
+    assert loaded.dims == ts.dims
+    for coord in ts.coords:
+        assert loaded.coords[coord].dims == ts.coords[coord].dims
+        assert loaded.coords[coord].dtype == ts.coords[coord].dtype
+        assert (loaded.coords[coord].values == ts.coords[coord].values).all()
+
+
+def test_hdf_legacy_layout(tempdir):
+    """Files with base64-encoded coordinates can still be read."""
+    from base64 import b64encode
+    from io import BytesIO
+
+    coords = {'channels': np.array(['001', '002']),
+              'events': np.array([(1, 'WORD')], dtype=[('eegoffset', int),
+                                                       ('type', 'U4')]),
+              'samplerate': np.array(500.)}
+    data = np.random.random((2, 1, 5))
+    filename = osp.join(tempdir, "legacy.h5")
+    with h5py.File(filename, 'w') as hfile:
+        hfile.create_dataset("data", data=data, chunks=True)
+        hfile.create_dataset("dims", data=[b'channels', b'events', b'time'])
+        group = hfile.create_group("coords")
+        for name, coord in coords.items():
+            buffer = BytesIO()
+            np.save(buffer, coord)
+            group.create_dataset(name, data=b64encode(buffer.getvalue()))
+        group.attrs['names'] = json.dumps(list(coords)).encode()
+        hfile.attrs['name'] = b'legacy'
+
+    loaded = TimeSeries.from_hdf(filename)
+    assert (loaded.values == data).all()
+    assert loaded.name == 'legacy'
+    assert loaded.samplerate == 500.
+    assert (loaded.events.values == coords['events']).all()
+    assert (loaded.channels.values == coords['channels']).all()
+
+
+def test_hdf_object_coords(tempdir):
+    """Object coordinates are stored as JSON strings; anything else is
+    pickled and only loaded on request."""
+    ts = TimeSeries.create(
+        np.random.random((2, 3)), 1000.,
+        coords={'label': ('events', np.array(['a', 'ü', ''], dtype=object)),
+                'extra': ('events', np.array([1, None, 2.5], dtype=object)),
+                'raw': ('events', np.array([b'x', 'y', True], dtype=object))},
+        dims=('channels', 'events'))
+    filename = osp.join(tempdir, "objects.h5")
+    ts.to_hdf(filename)
+
+    with h5py.File(filename, 'r') as hfile:
+        for name in ['label', 'extra', 'raw']:
+            assert hfile['coords'][name].attrs['encoding'] == b'json'
+
+    loaded = TimeSeries.from_hdf(filename)
+    for name in ['label', 'extra', 'raw']:
+        assert loaded[name].dtype == object
+        assert loaded[name].values.tolist() == ts[name].values.tolist()
+
+    ts['other'] = ('events', np.array([(1, 2), None, 'c'], dtype=object))
+    ts.to_hdf(filename)
+    with pytest.raises(ValueError):
+        TimeSeries.from_hdf(filename)
+    loaded = TimeSeries.from_hdf(filename, allow_pickle=True)
+    assert loaded['other'].values.tolist() == [(1, 2), None, 'c']
+
+
+@pytest.mark.parametrize("isel,sel", [
+    ({'channels': [3, 0, 3]}, None),
+    ({'channels': 1, 'events': slice(2, 9, 3)}, None),
+    ({'events': [7, 1, 4], 'time': [0, 5]}, {'frequency': slice(2., 40.)}),
+    (None, {'channels': ['002', '004'], 'frequency': 10.}),
+    ({'events': np.array([], dtype=int)}, None),
+    # several list-valued selections are all read as true hyperslabs
+    ({'channels': [4, 0, 2], 'events': [9, 1, 2, 7, 1]}, None),
+    ({'channels': [0, 3, 4], 'events': [8, 0, 1], 'time': [5, 0, 1]},
+     {'frequency': [50., 1.]}),
+])
+def test_hdf_partial_read(tempdir, monkeypatch, isel, sel):
+    ts = TimeSeries.create(
+        np.random.random((4, 5, 10, 6)), 100.,
+        coords={'frequency': np.array([1., 5., 10., 50.]),
+                'channels': np.array(['%03d' % i for i in range(5)]),
+                'eegoffset': ('events', np.arange(10) * 100)},
+        dims=('frequency', 'channels', 'events', 'time'), name='power')
+    filename = osp.join(tempdir, "timeseries.h5")
+    ts.to_hdf(filename)
+
+    expected = ts.isel(**(isel or {})).sel(**(sel or {}))
+
+    # only the selected hyperslab is read from disk
+    read_sizes = []
+    getitem = h5py.Dataset.__getitem__
+
+    def wrapper(self, args):
+        data = getitem(self, args)
+        if self.name == '/data':
+            read_sizes.append(np.size(data))
+        return data
+
+    monkeypatch.setattr(h5py.Dataset, '__getitem__', wrapper)
+    loaded = TimeSeries.from_hdf(filename, isel=isel, sel=sel)
+
+    assert sum(read_sizes) <= expected.size
+    assert loaded.name == 'power'
+    assert loaded.dims == expected.dims
+    assert (loaded.values == expected.values).all()
+    for coord in expected.coords:
+        assert loaded.coords[coord].dims == expected.coords[coord].dims
+        assert (loaded.coords[coord].values ==
+                expected.coords[coord].values).all()
+
+
 @pytest.mark.parametrize("cls,kwargs", [
     (None, {}),
     (ResampleFilter, {"resamplerate": 1.}),